@@ -1,10 +1,11 @@
 import os
 from typing import Optional, Union, List
 
-import requests
 from django.conf import settings
 from django.core.mail import send_mail as django_send_mail
 
+from . import http_client
+
 
 def send_email(
     to: Union[str, List[str]],
@@ -30,7 +31,7 @@ def send_email(
             }
             if html:
                 payload["html"] = html
-            r = requests.post(
+            r = http_client.post(
                 "https://api.resend.com/emails",
                 headers={
                     "Authorization": f"Bearer {api_key}",
@@ -0,0 +1,113 @@
+"""Shared outbound HTTP client (OpenRouter, Nominatim, Resend, ...).
+
+One ``requests.Session`` per scheme+host keeps TLS connections alive between
+calls instead of handshaking on every request. Pools are bounded by
+``HTTP_CLIENT_POOL_MAXSIZE`` (further concurrent callers wait for a free
+connection); idempotent methods are retried with exponential
+backoff, other methods only when the connection could not be established.
+
+Per-host latency and connection reuse are exposed through ``stats()``.
+"""
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def default_timeout() -> tuple:
+    return (settings.HTTP_CLIENT_CONNECT_TIMEOUT, settings.HTTP_CLIENT_READ_TIMEOUT)
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=settings.HTTP_CLIENT_RETRIES,
+        backoff_factor=settings.HTTP_CLIENT_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.HTTP_CLIENT_POOL_MAXSIZE,
+        # A hard bound: extra threads wait for a free connection instead of opening throwaway ones
+        pool_block=True,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_for(url: str) -> requests.Session:
+    host = _host(url)
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _build_session()
+        return session
+
+
+def request(method: str, url: str, *, timeout=None, **kwargs) -> requests.Response:
+    host = urlsplit(url).netloc
+    session = session_for(url)
+    t0 = time.perf_counter()
+    try:
+        return session.request(method.upper(), url, timeout=timeout or default_timeout(), **kwargs)
+    except requests.RequestException:
+        metrics.incr(f"http.{host}.errors")
+        raise
+    finally:
+        metrics.observe(f"http.{host}", (time.perf_counter() - t0) * 1000)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def stats() -> Dict[str, dict]:
+    """Per-host request latency and connection reuse for this process."""
+    snap = metrics.snapshot()
+    timers, counters = snap["timers"], snap["counters"]
+    with _lock:
+        sessions = dict(_sessions)
+    report = {}
+    for base, session in sessions.items():
+        host = urlsplit(base).netloc
+        adapter = session.get_adapter(base)
+        pools = adapter.poolmanager.pools
+        new_connections = sum(pools[key].num_connections for key in pools.keys())
+        pool_requests = sum(pools[key].num_requests for key in pools.keys())
+        timer: Optional[dict] = timers.get(f"http.{host}")
+        report[host] = {
+            "requests": int(timer["count"]) if timer else 0,
+            "errors": int(counters.get(f"http.{host}.errors", 0)),
+            "avg_ms": round(timer["avg_ms"], 2) if timer else 0.0,
+            "max_ms": round(timer["max_ms"], 2) if timer else 0.0,
+            "new_connections": new_connections,
+            "reused_connections": max(0, pool_requests - new_connections),
+        }
+    return report
@@ -0,0 +1,53 @@
+"""Tiny in-process metrics registry (counters and timers).
+
+Values are per worker process; ``snapshot()`` includes the pid so numbers
+from several gunicorn workers can be told apart when scraped.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_timers: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, ms: float) -> None:
+    with _lock:
+        t = _timers[name]
+        t["count"] += 1
+        t["total_ms"] += ms
+        if ms > t["max_ms"]:
+            t["max_ms"] = ms
+
+
+@contextmanager
+def timer(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - t0) * 1000)
+
+
+def snapshot() -> dict:
+    with _lock:
+        timers = {
+            name: {**t, "avg_ms": (t["total_ms"] / t["count"]) if t["count"] else 0.0}
+            for name, t in _timers.items()
+        }
+        return {"pid": os.getpid(), "counters": dict(_counters), "timers": timers}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timers.clear()
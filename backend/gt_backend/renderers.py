@@ -0,0 +1,39 @@
+"""orjson-backed DRF renderer and parser (opt-in via ``API_FAST_JSON=1``).
+
+Output matches ``rest_framework.renderers.JSONRenderer`` (compact, UTF-8):
+datetimes and every type orjson does not encode natively (``Decimal``,
+lazy strings, ...) go through DRF's own ``JSONEncoder.default``.
+Requires the ``orjson`` package (listed in requirements-cloudflare.txt);
+settings fall back to DRF's classes when it is not installed.
+"""
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    # Datetimes are passed to DRF's encoder, whose formatting differs from orjson's
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        options = self.options
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            # orjson only supports two-space indentation
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
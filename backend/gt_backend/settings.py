@@ -11,10 +11,12 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 from dotenv import load_dotenv
 from corsheaders.defaults import default_headers, default_methods
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -170,11 +172,23 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 # DRF / Auth
+# orjson-backed renderer/parser (gt_backend.renderers); ignored unless the orjson package is installed
+API_FAST_JSON = os.getenv('API_FAST_JSON', '0') == '1' and importlib.util.find_spec('orjson') is not None
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'gt_backend.renderers.ORJSONRenderer' if API_FAST_JSON else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'gt_backend.renderers.ORJSONParser' if API_FAST_JSON else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_THROTTLE_CLASSES': (
         'rest_framework.throttling.ScopedRateThrottle',
         'rest_framework.throttling.UserRateThrottle',
@@ -190,6 +204,85 @@ REST_FRAMEWORK = {
     },
 }
 
+# Shared outbound HTTP client (gt_backend.http_client)
+HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT', '5'))
+HTTP_CLIENT_READ_TIMEOUT = float(os.getenv('HTTP_CLIENT_READ_TIMEOUT', '30'))
+HTTP_CLIENT_POOL_MAXSIZE = int(os.getenv('HTTP_CLIENT_POOL_MAXSIZE', '10'))
+HTTP_CLIENT_RETRIES = int(os.getenv('HTTP_CLIENT_RETRIES', '2'))
+HTTP_CLIENT_BACKOFF = float(os.getenv('HTTP_CLIENT_BACKOFF', '0.3'))
+
+# Django cache (public itinerary responses, catalog index version, throttling).
+# DJANGO_CACHE_URL selects a cache shared by every process and host:
+#   redis://host:6379/0 (needs the redis package), memcached://host:11211
+#   (needs pymemcache) or db://table_name (run `manage.py createcachetable`).
+# DJANGO_CACHE_DIR shares a file cache between processes of one host only;
+# the default local-memory cache is per process.
+DJANGO_CACHE_URL = os.getenv('DJANGO_CACHE_URL', '')
+_cache_options = {'MAX_ENTRIES': int(os.getenv('DJANGO_CACHE_MAX_ENTRIES', '5000'))}
+if DJANGO_CACHE_URL:
+    _scheme, _, _location = DJANGO_CACHE_URL.partition('://')
+    if _scheme in ('redis', 'rediss'):
+        CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': DJANGO_CACHE_URL}}
+    elif _scheme == 'memcached':
+        CACHES = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': _location}}
+    elif _scheme == 'db':
+        CACHES = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': _location or 'django_cache',
+            'OPTIONS': _cache_options,
+        }}
+    else:
+        raise ImproperlyConfigured(f"Unsupported DJANGO_CACHE_URL scheme: {_scheme!r}")
+elif os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+            'OPTIONS': _cache_options,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': _cache_options,
+        }
+    }
+
+# Response cache for /api/public/itineraries/<slug> (trips.public_cache).
+# Invalidation bumps a version in the cache, so it is only correct when every
+# process that edits trips shares that cache (see settings_production).
+PUBLIC_ITINERARY_CACHE_ENABLED = os.getenv('PUBLIC_ITINERARY_CACHE_ENABLED', '1') == '1'
+PUBLIC_ITINERARY_CACHE_SECONDS = int(os.getenv('PUBLIC_ITINERARY_CACHE_SECONDS', '600'))
+
+# Static JSON snapshots of shared itineraries (trips.snapshots): storage alias from STORAGES and path prefix
+PUBLIC_SNAPSHOT_STORAGE = os.getenv('PUBLIC_SNAPSHOT_STORAGE', 'default')
+PUBLIC_SNAPSHOT_PREFIX = os.getenv('PUBLIC_SNAPSHOT_PREFIX', 'snapshots')
+# Local FileSystemStorage only works when one machine renders and serves the files (development)
+PUBLIC_SNAPSHOT_ALLOW_LOCAL_STORAGE = os.getenv('PUBLIC_SNAPSHOT_ALLOW_LOCAL_STORAGE', '1') == '1'
+
+# Delta sync (trips.sync): re-read window behind each cursor, and how long deletions are remembered
+SYNC_CURSOR_OVERLAP_SECONDS = int(os.getenv('SYNC_CURSOR_OVERLAP_SECONDS', '5'))
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+
+# Persistent cache of parsed LLM itinerary payloads (trips.llm_cache)
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+
+# Replay window for generate requests carrying an Idempotency-Key header
+GENERATE_IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv('GENERATE_IDEMPOTENCY_WINDOW_SECONDS', str(24 * 3600)))
+
+# Per-process memo of the city lookups behind the homepage sample itinerary (trips.samples); size counts cities
+SAMPLE_ITINERARY_CACHE_SIZE = int(os.getenv('SAMPLE_ITINERARY_CACHE_SIZE', '256'))
+SAMPLE_ITINERARY_CACHE_SECONDS = int(os.getenv('SAMPLE_ITINERARY_CACHE_SECONDS', '3600'))
+
+# Reload interval for the in-process ActivityCatalog index (trips.catalog_index)
+CATALOG_INDEX_TTL_SECONDS = int(os.getenv('CATALOG_INDEX_TTL_SECONDS', '300'))
+
+# OpenRouter circuit breaker (trips.circuit_breaker)
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '3'))
+LLM_BREAKER_RESET_SECONDS = int(os.getenv('LLM_BREAKER_RESET_SECONDS', '60'))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'GlobalTrotters API',
     'DESCRIPTION': 'API for the GlobalTrotters travel planner',
@@ -224,10 +317,12 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     "authorization",
     "x-requested-with",
     "x-csrftoken",
+    "idempotency-key",
     "sec-ch-ua",
     "sec-ch-ua-mobile",
     "sec-ch-ua-platform",
 ]
+CORS_EXPOSE_HEADERS = ["idempotent-replayed", "etag", "last-modified"]
 CORS_ALLOW_METHODS = list(default_methods)
 CORS_PREFLIGHT_MAX_AGE = int(os.getenv("CORS_PREFLIGHT_MAX_AGE", "86400"))
 
@@ -2,8 +2,10 @@
 Production Django settings for Cloudflare deployment.
 """
 
+import json
 import os
 import dj_database_url
+from django.conf import global_settings
 from .settings import *
 
 # Security Settings
@@ -28,6 +30,27 @@ DATABASES = {
     )
 }
 
+# Public itinerary response cache: web workers and the worker/snapshots
+# processes each hold their own local-memory or file cache, so an edit would
+# only invalidate the copy of the process that made it. Serve uncached
+# unless DJANGO_CACHE_URL points at a shared cache.
+PUBLIC_ITINERARY_CACHE_ENABLED = bool(DJANGO_CACHE_URL) and os.getenv('PUBLIC_ITINERARY_CACHE_ENABLED', '1') == '1'
+
+# Public itinerary snapshots: the snapshots process and the web dynos have
+# separate ephemeral disks and /media/ is not served, so snapshots must go to
+# shared object storage, e.g. django-storages' S3Storage pointed at an R2 or
+# S3 bucket whose public URL the /snapshots/* rule in _redirects proxies to.
+PUBLIC_SNAPSHOT_ALLOW_LOCAL_STORAGE = False
+if os.getenv('PUBLIC_SNAPSHOT_STORAGE_BACKEND'):
+    STORAGES = {
+        **global_settings.STORAGES,
+        'snapshots': {
+            'BACKEND': os.environ['PUBLIC_SNAPSHOT_STORAGE_BACKEND'],
+            'OPTIONS': json.loads(os.getenv('PUBLIC_SNAPSHOT_STORAGE_OPTIONS', '{}')),
+        },
+    }
+    PUBLIC_SNAPSHOT_STORAGE = 'snapshots'
+
 # Static Files with WhiteNoise
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -101,6 +124,9 @@ if os.environ.get('EMAIL_BACKEND'):
 # Performance Optimizations
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# JSON only: no browsable API renderer (templates, forms) in production
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'][:1]
+
 # Sentry Integration (optional)
 if os.environ.get('SENTRY_DSN'):
     import sentry_sdk
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the trip budget summary on trips with thousands of activities.
+
+Compares the original implementation (iterate every activity in Python,
+normalize its category string, one extra activities query per stop) with
+trips.budget.trip_summary, which reads the per-stop TripBudgetRollup rows
+in one query. Both must produce the same payload.
+
+Usage:
+  python scripts/bench_budget.py [--stops 40] [--acts 100] [--runs 5]
+"""
+from __future__ import annotations
+
+import argparse
+from collections import defaultdict
+from datetime import date, timedelta
+
+from bench_common import measure, report, test_database
+
+from accounts.models import User  # noqa: E402
+from trips.budget import trip_summary  # noqa: E402
+from trips.categories import normalize_category  # noqa: E402
+from trips.models import Activity, City, Trip, TripStop  # noqa: E402
+
+CATEGORIES = ["Food", "sightseeing", "Train", "Hotel", "museum", "", "shopping", "Taxi"]
+
+
+def legacy_summary(trip) -> dict:
+    activities = Activity.objects.filter(trip_stop__trip=trip)
+    first_act = activities.first()
+    currency = first_act.currency if first_act and first_act.currency else 'INR'
+    cat_totals = defaultdict(int)
+    num_activities = 0
+    for a in activities:
+        cat_totals[normalize_category(a.category)] += int(a.cost_amount or 0)
+        num_activities += 1
+    total = sum(cat_totals.values())
+    days = max((trip.end_date - trip.start_date).days, 1)
+    per_city = []
+    for s in trip.stops.select_related('city').all().order_by('order', 'start_date'):
+        city_cat = defaultdict(int)
+        city_total = 0
+        for a in s.activities.all():
+            amt = int(a.cost_amount or 0)
+            city_cat[normalize_category(a.category)] += amt
+            city_total += amt
+        per_city.append({
+            'city': {'id': s.city.id, 'name': s.city.name, 'country': s.city.country},
+            'total_minor': city_total,
+            'categories': {c: city_cat.get(c, 0) for c in ('activities', 'meals', 'transport', 'stay', 'other')},
+        })
+    return {
+        'trip_id': trip.id,
+        'currency': currency,
+        'total_minor': total,
+        'avg_per_day_minor': total // days if total else 0,
+        'num_activities': num_activities,
+        'categories': {c: cat_totals.get(c, 0) for c in ('activities', 'meals', 'transport', 'stay', 'other')},
+        'per_city': per_city,
+        'days': days,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=40)
+    parser.add_argument("--acts", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database() as vendor:
+        user = User.objects.create_user(username="bench", email="bench@example.com", password="x")
+        start = date(2025, 1, 1)
+        trip = Trip.objects.create(user=user, name="Bench", start_date=start, end_date=start + timedelta(days=args.stops * 2))
+        cities = City.objects.bulk_create([City(name=f"City {i}", country="Country") for i in range(args.stops)])
+        stops = TripStop.objects.bulk_create([
+            TripStop(trip=trip, city=c, start_date=start + timedelta(days=2 * i), end_date=start + timedelta(days=2 * i + 2), order=i + 1)
+            for i, c in enumerate(cities)
+        ])
+        Activity.objects.bulk_create([
+            Activity(trip_stop=s, title=f"Activity {j}", category=CATEGORIES[j % len(CATEGORIES)], cost_amount=100 + j, currency="EUR")
+            for s in stops for j in range(args.acts)
+        ], batch_size=500)
+        summary = trip_summary(trip)
+        summary.pop("unconverted_minor")
+        assert legacy_summary(trip) == summary, "summaries disagree"
+
+        rows = {
+            "python loop (before)": measure(lambda: legacy_summary(trip), args.runs),
+            "rollup rows": measure(lambda: trip_summary(trip), args.runs),
+        }
+        report(f"Budget summary {args.stops} stops x {args.acts} activities", vendor, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
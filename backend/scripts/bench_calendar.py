@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the trip calendar on a long trip (default 365 days, 100 stops).
+
+Compares the original TripViewSet.calendar body (linear stop scan per day,
+per-stop ``.order_by('id')`` defeating the prefetch) with
+trips.schedule.build_calendar (bisect over disjoint stop segments, one
+activities prefetch), for the whole trip and for a one-month window.
+The full-trip payloads must match.
+
+Usage:
+  python scripts/bench_calendar.py [--days 365] [--stops 100] [--acts 5] [--runs 5]
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import date, timedelta
+
+from bench_common import measure, report, test_database
+
+from accounts.models import User  # noqa: E402
+from trips.models import Activity, City, Trip, TripStop  # noqa: E402
+from trips.schedule import build_calendar  # noqa: E402
+
+
+def legacy_calendar(trip) -> dict:
+    days = max((trip.end_date - trip.start_date).days, 1)
+    stops = list(trip.stops.select_related('city').prefetch_related('activities').order_by('order', 'start_date'))
+
+    def stop_for(date_obj):
+        for s in stops:
+            if s.start_date <= date_obj < s.end_date:
+                return s
+        return None
+
+    stop_to_buckets = {}
+    for s in stops:
+        span = max((s.end_date - s.start_date).days, 1)
+        acts = list(s.activities.all().order_by('id'))
+        buckets = [[] for _ in range(span)]
+        for idx, a in enumerate(acts):
+            buckets[min((idx * span) // len(acts), span - 1)].append(a)
+        stop_to_buckets[s.id] = buckets
+
+    def serialize_activity(a):
+        return {'id': a.id, 'title': a.title, 'category': a.category, 'start_time': a.start_time,
+                'end_time': a.end_time, 'cost_amount': a.cost_amount, 'currency': a.currency}
+
+    timeline = []
+    for i in range(days):
+        day_date = trip.start_date + timedelta(days=i)
+        s = stop_for(day_date)
+        entry = {
+            'date': day_date.isoformat(),
+            'day_index': i + 1,
+            'stop_id': s.id if s else None,
+            'stop_order': s.order if s else None,
+            'city': ({'id': s.city.id, 'name': s.city.name, 'country': s.city.country} if s else None),
+            'activities': [],
+        }
+        if s:
+            span = max((s.end_date - s.start_date).days, 1)
+            offset = max(0, min((day_date - s.start_date).days, span - 1))
+            entry['activities'] = [serialize_activity(a) for a in stop_to_buckets[s.id][offset]]
+        timeline.append(entry)
+    return {'trip_id': trip.id, 'start_date': trip.start_date.isoformat(), 'end_date': trip.end_date.isoformat(),
+            'total_days': days, 'days': timeline}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--stops", type=int, default=100)
+    parser.add_argument("--acts", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database() as vendor:
+        user = User.objects.create_user(username="bench", email="bench@example.com", password="x")
+        start = date(2025, 1, 1)
+        trip = Trip.objects.create(user=user, name="Bench", start_date=start, end_date=start + timedelta(days=args.days))
+        cities = City.objects.bulk_create([City(name=f"City {i}", country="Country") for i in range(args.stops)])
+        per_stop = args.days / args.stops
+        stops = TripStop.objects.bulk_create([
+            TripStop(trip=trip, city=c, order=i + 1,
+                     start_date=start + timedelta(days=int(i * per_stop)),
+                     # Overlap each stop into the next one by a day
+                     end_date=start + timedelta(days=min(int((i + 1) * per_stop) + 1, args.days)))
+            for i, c in enumerate(cities)
+        ])
+        Activity.objects.bulk_create([
+            Activity(trip_stop=s, title=f"Activity {j}", category="sightseeing", cost_amount=100 + j)
+            for s in stops for j in range(args.acts)
+        ], batch_size=500)
+        assert legacy_calendar(trip) == build_calendar(trip), "calendars disagree"
+
+        month = (date(2025, 6, 1), date(2025, 6, 30))
+        rows = {
+            "full: scan (before)": measure(lambda: legacy_calendar(trip), args.runs),
+            "full: bisect index": measure(lambda: build_calendar(trip), args.runs),
+            "month window": measure(lambda: build_calendar(trip, *month), args.runs),
+        }
+        report(f"Calendar {args.days} days x {args.stops} stops x {args.acts} activities", vendor, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
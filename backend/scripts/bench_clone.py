@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark copying a large public itinerary (default 40 stops x 25 activities).
+
+Compares the original copy_public_itinerary body (one INSERT per stop and
+per activity, one activities query per stop, no transaction) with
+trips.cloning.clone_trip (two prefetch queries, one bulk_create per level
+in one transaction). Both copies must hold the same stops and activities.
+
+Usage:
+  python scripts/bench_clone.py [--stops 40] [--acts 25] [--runs 5]
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import date, timedelta
+
+from bench_common import measure, report, test_database
+
+from accounts.models import User  # noqa: E402
+from trips.cloning import clone_trip  # noqa: E402
+from trips.models import Activity, City, Trip, TripStop  # noqa: E402
+
+
+def legacy_copy(src_trip, user):
+    new_trip = Trip.objects.create(
+        user=user, name=src_trip.name, start_date=src_trip.start_date, end_date=src_trip.end_date,
+        origin_city=src_trip.origin_city, description=src_trip.description, cover_image=src_trip.cover_image,
+        is_public=False,
+    )
+    for s in src_trip.stops.all().order_by('order', 'start_date'):
+        new_stop = TripStop.objects.create(trip=new_trip, city=s.city, start_date=s.start_date, end_date=s.end_date, order=s.order)
+        for a in s.activities.all().order_by('id'):
+            Activity.objects.create(
+                trip_stop=new_stop, title=a.title, category=a.category, start_time=a.start_time, end_time=a.end_time,
+                cost_amount=a.cost_amount, currency=a.currency, notes=a.notes,
+            )
+    return new_trip
+
+
+def tree(trip) -> list:
+    return [
+        (s.city_id, s.order, list(s.activities.order_by('id').values_list('title', 'category', 'cost_amount', 'currency')))
+        for s in trip.stops.order_by('order', 'start_date')
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=40)
+    parser.add_argument("--acts", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database() as vendor:
+        owner = User.objects.create_user(username="owner", email="owner@example.com", password="x")
+        user = User.objects.create_user(username="bench", email="bench@example.com", password="x")
+        start = date(2025, 1, 1)
+        src = Trip.objects.create(user=owner, name="Bench", start_date=start, end_date=start + timedelta(days=args.stops * 2), is_public=True)
+        cities = City.objects.bulk_create([City(name=f"City {i}", country="Country") for i in range(args.stops)])
+        stops = TripStop.objects.bulk_create([
+            TripStop(trip=src, city=c, start_date=start + timedelta(days=2 * i), end_date=start + timedelta(days=2 * i + 2), order=i + 1)
+            for i, c in enumerate(cities)
+        ])
+        Activity.objects.bulk_create([
+            Activity(trip_stop=s, title=f"Activity {j}", category="sightseeing", cost_amount=100 + j)
+            for s in stops for j in range(args.acts)
+        ], batch_size=500)
+        assert tree(legacy_copy(src, user)) == tree(clone_trip(Trip.objects.get(pk=src.pk), user)) == tree(src), "copies disagree"
+
+        rows = {
+            "per-row inserts (before)": measure(lambda: legacy_copy(Trip.objects.get(pk=src.pk), user), args.runs),
+            "bulk clone": measure(lambda: clone_trip(Trip.objects.get(pk=src.pk), user), args.runs),
+        }
+        report(f"Copy itinerary {args.stops} stops x {args.acts} activities", vendor, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
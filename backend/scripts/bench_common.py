@@ -0,0 +1,62 @@
+"""
+Shared helpers for the scripts/bench_*.py benchmarks.
+
+Each benchmark runs against a throwaway test database created from the active
+settings, so the same script measures SQLite (default) or Postgres
+(DJANGO_USE_POSTGRES=1) without touching the dev database.
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+try:
+    import django
+except ImportError:
+    print("Run from backend with venv: source .venv/bin/activate")
+    sys.exit(1)
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "gt_backend.settings")
+sys.path.insert(0, ".")
+django.setup()
+
+from django.db import connection, reset_queries  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def test_database() -> Iterator[str]:
+    """Create a migrated throwaway database; yields the backend vendor name."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    try:
+        yield connection.vendor
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(fn: Callable[[], object], runs: int = 5) -> Dict[str, float]:
+    """Run ``fn`` ``runs`` times; report median wall time (ms) and queries of the last run."""
+    times: List[float] = []
+    queries = 0
+    for _ in range(runs):
+        # The query log is capped at 9000 entries; start each run from an empty one
+        reset_queries()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        queries = len(ctx.captured_queries)
+    return {"ms": statistics.median(times), "queries": queries}
+
+
+def report(title: str, vendor: str, rows: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n=== {title} ({vendor}) ===")
+    print(f"{'variant':<28}{'queries':>10}{'median ms':>12}")
+    for name, r in rows.items():
+        print(f"{name:<28}{r['queries']:>10}{r['ms']:>12.2f}")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark the itinerary write path used by TripViewSet.generate.
+
+Compares the legacy per-row writes (get_or_create per city, create per stop
+and per activity, no transaction) with trips.generation.persist_itinerary
+(batched city upsert + two bulk_create calls in one transaction).
+
+Usage:
+  python scripts/bench_generate.py [--stops 5] [--acts 5] [--runs 5]
+  DJANGO_USE_POSTGRES=1 python scripts/bench_generate.py
+"""
+from __future__ import annotations
+
+import argparse
+from datetime import date
+
+from bench_common import measure, report, test_database
+
+from accounts.models import User  # noqa: E402
+from trips.generation import PlannedActivity, layout_stops, persist_itinerary  # noqa: E402
+from trips.models import Activity, City, Trip, TripStop  # noqa: E402
+
+
+def legacy_persist(trip, plan, currency):
+    trip.stops.all().delete()
+    for p in plan:
+        city_obj, _ = City.objects.get_or_create(name=p.city_name, defaults={"country": ""})
+        stop = TripStop.objects.create(trip=trip, city=city_obj, start_date=p.start_date, end_date=p.end_date, order=p.order)
+        for a in p.activities:
+            Activity.objects.create(trip_stop=stop, title=a.title, category=a.category, cost_amount=a.cost_amount, currency=currency)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=5)
+    parser.add_argument("--acts", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with test_database() as vendor:
+        user = User.objects.create_user(username="bench", email="bench@example.com", password="x")
+        trip = Trip.objects.create(user=user, name="Bench", start_date=date(2025, 1, 1), end_date=date(2025, 2, 1))
+        plan = layout_stops(trip.start_date, [f"City {i}" for i in range(args.stops)], 2)
+        for p in plan:
+            p.activities = [PlannedActivity(title=f"Act {j}", category="sightseeing", cost_amount=1000) for j in range(args.acts)]
+
+        rows = {
+            "legacy per-row": measure(lambda: legacy_persist(trip, plan, "INR"), args.runs),
+            "bulk + atomic": measure(lambda: persist_itinerary(trip, plan, "INR"), args.runs),
+        }
+        report(f"generate write path: {args.stops} stops x {args.acts} activities", vendor, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON rendering/parsing of a large nested trip.
+
+Serializes one trip (default 50 stops x 10 activities = 500 activities) with
+TripSerializer once, then times DRF's JSONRenderer/JSONParser against
+gt_backend.renderers (orjson) on the same data. Serialization and queries
+are excluded; only the JSON step is measured.
+
+Usage:
+  python scripts/bench_renderer.py [--stops 50] [--acts 10] [--runs 50]
+"""
+from __future__ import annotations
+
+import argparse
+import io
+from datetime import date, time, timedelta
+
+from bench_common import measure, report, test_database
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from accounts.models import User  # noqa: E402
+from gt_backend.renderers import ORJSONParser, ORJSONRenderer  # noqa: E402
+from trips.models import Activity, City, Trip, TripStop  # noqa: E402
+from trips.serializers import TripSerializer  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=50)
+    parser.add_argument("--acts", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with test_database() as vendor:
+        user = User.objects.create_user(username="bench", email="bench@example.com", password="x")
+        start = date(2025, 1, 1)
+        trip = Trip.objects.create(user=user, name="Bench", start_date=start, end_date=start + timedelta(days=args.stops * 2))
+        cities = City.objects.bulk_create([City(name=f"City {i}", country="Country", cost_index=i) for i in range(args.stops)])
+        stops = TripStop.objects.bulk_create([
+            TripStop(trip=trip, city=c, start_date=start + timedelta(days=2 * i), end_date=start + timedelta(days=2 * i + 2), order=i + 1)
+            for i, c in enumerate(cities)
+        ])
+        Activity.objects.bulk_create([
+            Activity(trip_stop=s, title=f"Activity {j} – été", category="sightseeing", start_time=time(9 + j % 8, 30),
+                     cost_amount=1000 + j, currency="EUR", notes="Bring comfortable shoes")
+            for s in stops for j in range(args.acts)
+        ])
+        data = TripSerializer(TripSerializer.setup_eager_loading(Trip.objects.filter(pk=trip.pk)).get()).data
+        body = JSONRenderer().render(data)
+        assert ORJSONRenderer().render(data) == body, "renderers disagree"
+
+        rows = {
+            "render: DRF json": measure(lambda: JSONRenderer().render(data), args.runs),
+            "render: orjson": measure(lambda: ORJSONRenderer().render(data), args.runs),
+            "parse: DRF json": measure(lambda: JSONParser().parse(io.BytesIO(body)), args.runs),
+            "parse: orjson": measure(lambda: ORJSONParser().parse(io.BytesIO(body)), args.runs),
+        }
+        report(f"JSON {args.stops} stops x {args.acts} activities ({len(body) // 1024} KiB)", vendor, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import City, Trip, TripStop, Activity, ActivityCatalog, ExternalPlace, PersonalizedRec
+from .cloning import clone_trip
+from .signals import delete_activities
+from .models import City, Trip, TripStop, Activity, ActivityCatalog, ExternalPlace, PersonalizedRec, GenerationJob, LLMResponseCache, CircuitBreakerState, PublicSnapshot, Tombstone, TripBudgetRollup, FxRate
 
 
 @admin.register(City)
@@ -17,12 +19,22 @@ class TripStopInline(admin.TabularInline):
 class TripAdmin(admin.ModelAdmin):
     list_display = ("name", "user", "origin_city", "start_date", "end_date", "is_public")
     inlines = [TripStopInline]
+    actions = ["duplicate_trips"]
+
+    @admin.action(description="Duplicate selected trips (private copies for the same owner)")
+    def duplicate_trips(self, request, queryset):
+        for trip in queryset:
+            clone_trip(trip, trip.user, name=f"{trip.name} (copy)")
+        self.message_user(request, f"Duplicated {len(queryset)} trip(s).")
 
 
 @admin.register(Activity)
 class ActivityAdmin(admin.ModelAdmin):
     list_display = ("title", "trip_stop", "category", "cost_amount", "currency")
 
+    def delete_queryset(self, request, queryset):
+        delete_activities(queryset)
+
 
 @admin.register(ActivityCatalog)
 class ActivityCatalogAdmin(admin.ModelAdmin):
@@ -40,4 +52,52 @@ class PersonalizedRecAdmin(admin.ModelAdmin):
     list_display = ("user", "signature", "created_at")
     search_fields = ("user__username", "signature")
 
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "trip", "user", "status", "stage", "progress", "source", "idempotency_key", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("idempotency_key",)
+
+
+
+@admin.register(LLMResponseCache)
+class LLMResponseCacheAdmin(admin.ModelAdmin):
+    list_display = ("key", "model", "hits", "latency_ms", "last_used_at", "expires_at")
+    search_fields = ("key", "model")
+
+
+@admin.register(CircuitBreakerState)
+class CircuitBreakerStateAdmin(admin.ModelAdmin):
+    list_display = ("name", "state", "failures", "opened_at", "updated_at")
+
+
+@admin.register(PublicSnapshot)
+class PublicSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("slug", "trip", "version", "stale", "rendered_at", "updated_at")
+    list_filter = ("stale",)
+    search_fields = ("slug",)
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ("kind", "object_id", "user", "deleted_at")
+    list_filter = ("kind",)
+
+
+
+@admin.register(TripBudgetRollup)
+class TripBudgetRollupAdmin(admin.ModelAdmin):
+    list_display = ("trip", "stop", "budget_category", "currency", "amount", "count")
+    list_filter = ("budget_category",)
+
+
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate", "as_of", "updated_at")
+    search_fields = ("currency",)
+
+
 # Register your models here.
+
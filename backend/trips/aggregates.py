@@ -0,0 +1,19 @@
+"""Database aggregates not shipped by Django for every backend we run on."""
+from django.db.models import Aggregate, CharField, Value
+
+
+class GroupConcat(Aggregate):
+    """Concatenate the grouped values with ``separator``.
+
+    ``group_concat`` on SQLite and ``STRING_AGG`` on PostgreSQL. Order
+    of the values is unspecified; callers that need one should sort after
+    splitting.
+    """
+    function = "GROUP_CONCAT"
+    output_field = CharField()
+
+    def __init__(self, expression, separator=",", **extra):
+        super().__init__(expression, Value(separator), **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function="STRING_AGG", **extra_context)
@@ -0,0 +1,250 @@
+"""Trip budget figures read from ``TripBudgetRollup``.
+
+Rollup rows (per stop, budget category and currency) are maintained on every
+activity write, so the budget endpoints read a few rows per stop no matter
+how many activities a trip has.
+
+Amounts are summed per currency first and then converted to the target
+currency (``?currency=``, else the trip's currency) with one factor per
+currency from ``FxRate``, so the query count stays constant however many
+currencies a trip mixes. Amounts stay in minor units, scaled by each
+currency's number of minor-unit digits; currencies without a rate are
+reported under ``unconverted_minor`` and left out of the totals. Only an
+explicitly requested target currency without a rate is an error.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Dict, Iterable, Optional
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from .categories import BUDGET_CATEGORIES
+from .models import FxRate, TripBudgetRollup, TripStop
+
+DEFAULT_CURRENCY = 'INR'
+
+# Minor-unit digits of currencies that do not use 2 (IDR amounts are whole rupiah)
+CURRENCY_EXPONENTS = {
+    'BHD': 3, 'CLP': 0, 'IDR': 0, 'ISK': 0, 'JOD': 3, 'JPY': 0, 'KRW': 0, 'KWD': 3, 'OMR': 3, 'TND': 3, 'VND': 0,
+}
+
+
+class UnknownCurrency(ValueError):
+    pass
+
+
+def normalize_currency(code: Optional[str]) -> str:
+    return (code or '').strip().upper()
+
+
+def minor_exponent(code: str) -> int:
+    return CURRENCY_EXPONENTS.get(code, 2)
+
+
+def empty_categories() -> dict:
+    return {c: 0 for c in BUDGET_CATEGORIES}
+
+
+def fx_factors(target: str, currencies: Iterable[str], strict: bool = True) -> Dict[str, Decimal]:
+    """Minor-unit multiplier from each of ``currencies`` to ``target`` (one query).
+
+    Currencies without a rate are omitted. A ``target`` without a rate raises
+    UnknownCurrency when ``strict`` (checked even when there is nothing to
+    convert, so the answer does not depend on the data), else only ``target``
+    itself converts.
+    """
+    currencies = set(currencies)
+    if currencies <= {target} and not strict:
+        return {target: Decimal(1)}
+    rates = dict(FxRate.objects.filter(currency__in=currencies | {target}).values_list('currency', 'rate'))
+    if target not in rates:
+        if strict:
+            raise UnknownCurrency(f"no FX rate for {target}")
+        return {target: Decimal(1)}
+    factors = {
+        code: (rates[target] / rates[code]).scaleb(minor_exponent(target) - minor_exponent(code))
+        for code in currencies if code in rates
+    }
+    factors[target] = Decimal(1)
+    return factors
+
+
+class Converter:
+    """Native-currency sums keyed by ``(group, currency)``, converted in one pass."""
+
+    def __init__(self):
+        self.native = defaultdict(int)
+
+    def add(self, group, currency: str, amount: int) -> None:
+        self.native[group, normalize_currency(currency)] += amount
+
+    def currencies(self) -> set:
+        return {cur for _, cur in self.native}
+
+    def convert(self, target: str, tally=None, strict: bool = True):
+        """``({group: target_minor}, {currency: unconverted_minor})``.
+
+        ``tally(group)`` picks the groups counted in the unconverted totals
+        (default: all), for callers that add the same amount to several groups.
+        ``strict`` is passed on to ``fx_factors``.
+        """
+        factors = fx_factors(target, self.currencies(), strict=strict)
+        converted = defaultdict(int)
+        unconverted = defaultdict(int)
+        for (group, cur), amount in self.native.items():
+            factor = factors.get(cur)
+            if factor is None:
+                if tally is None or tally(group):
+                    unconverted[cur] += amount
+            else:
+                converted[group] += int((amount * factor).to_integral_value(ROUND_HALF_EVEN))
+        return converted, dict(unconverted)
+
+
+def _currency(first) -> str:
+    # The trip's currency is the one on its first activity
+    return normalize_currency(first and first[1]) or DEFAULT_CURRENCY
+
+
+def trip_total(trip, currency: Optional[str] = None) -> dict:
+    """Payload for ``GET /trips/{id}/budget``: one rollup query plus at most one rate query."""
+    converter = Converter()
+    first = None
+    for amount, cur, first_id in TripBudgetRollup.objects.filter(trip=trip).values_list('amount', 'currency', 'first_activity_id'):
+        converter.add('total', cur, amount)
+        if first is None or first_id < first[0]:
+            first = (first_id, cur)
+    requested = normalize_currency(currency)
+    target = requested or _currency(first)
+    # Without an explicit currency, missing rates degrade to per-currency totals
+    converted, unconverted = converter.convert(target, strict=bool(requested))
+    return {
+        "trip_id": trip.id,
+        "currency": target,
+        "total_cost_minor": converted['total'],
+        "unconverted_minor": unconverted,
+    }
+
+
+def trip_summary(trip, currency: Optional[str] = None) -> dict:
+    """Payload for ``GET /trips/{id}/budget/summary``: one rollup query plus at most one rate query."""
+    rows = (
+        TripStop.objects.filter(trip=trip)
+        # LEFT JOIN keeps stops without activities (no rollup rows)
+        .values('id', 'city_id', 'city__name', 'city__country', 'budget_rollups__budget_category',
+                'budget_rollups__currency', 'budget_rollups__amount', 'budget_rollups__count',
+                'budget_rollups__first_activity_id')
+        .order_by('order', 'start_date', 'id')
+    )
+    converter = Converter()
+    per_city = {}
+    num_activities = 0
+    first = None
+    for row in rows:
+        if row['id'] not in per_city:
+            per_city[row['id']] = {
+                'city': {'id': row['city_id'], 'name': row['city__name'], 'country': row['city__country']},
+                'total_minor': 0,
+                'categories': empty_categories(),
+            }
+        if not row['budget_rollups__count']:
+            continue
+        converter.add((row['id'], row['budget_rollups__budget_category']), row['budget_rollups__currency'], row['budget_rollups__amount'])
+        num_activities += row['budget_rollups__count']
+        if first is None or row['budget_rollups__first_activity_id'] < first[0]:
+            first = (row['budget_rollups__first_activity_id'], row['budget_rollups__currency'])
+
+    requested = normalize_currency(currency)
+    target = requested or _currency(first)
+    converted, unconverted = converter.convert(target, strict=bool(requested))
+    categories = empty_categories()
+    for (stop_id, bucket), amount in converted.items():
+        city = per_city[stop_id]
+        city['total_minor'] += amount
+        city['categories'][bucket] += amount
+        categories[bucket] += amount
+
+    total = sum(categories.values())
+    days = max((trip.end_date - trip.start_date).days, 1)
+    return {
+        'trip_id': trip.id,
+        'currency': target,
+        'total_minor': total,
+        'avg_per_day_minor': total // days if total else 0,
+        'num_activities': num_activities,
+        'categories': categories,
+        'per_city': list(per_city.values()),
+        'days': days,
+        'unconverted_minor': unconverted,
+    }
+
+
+def spend_rows(user, start=None, end=None):
+    """``user``'s rollup rows, optionally limited to stops starting within ``[start, end]``."""
+    rows = TripBudgetRollup.objects.filter(trip__user=user)
+    if start is not None:
+        rows = rows.filter(stop__start_date__gte=start)
+    if end is not None:
+        rows = rows.filter(stop__start_date__lte=end)
+    return rows
+
+
+def spend_overview(user, trips, start=None, end=None, currency: Optional[str] = None) -> dict:
+    """Spend across all of ``user``'s trips, plus per-trip totals for the ``trips`` page.
+
+    Spend is dated by the start date of its stop. Three grouped queries
+    (all-trip categories x months, the page's trips, FX rates) whatever the
+    number of trips, stops or activities.
+    """
+    requested = normalize_currency(currency)
+    rows = spend_rows(user, start, end)
+    converter = Converter()
+    num_activities = 0
+    for row in (
+        rows.values('budget_category', 'currency', month=TruncMonth('stop__start_date'))
+        .annotate(amount=Sum('amount'), n=Sum('count'))
+        .order_by()
+    ):
+        converter.add(('category', row['budget_category']), row['currency'], row['amount'])
+        converter.add(('month', row['month'].strftime('%Y-%m')), row['currency'], row['amount'])
+        num_activities += row['n']
+
+    trip_counts = defaultdict(int)
+    by_trip = rows.filter(trip__in=[t.id for t in trips]).values('trip_id', 'currency').annotate(amount=Sum('amount'), n=Sum('count')).order_by()
+    for row in by_trip:
+        converter.add(('trip', row['trip_id']), row['currency'], row['amount'])
+        trip_counts[row['trip_id']] += row['n']
+
+    spent = converter.currencies()
+    # Without an explicit currency: the one all spend is in, so nothing needs a rate
+    target = requested or (next(iter(spent)) if len(spent) == 1 else DEFAULT_CURRENCY)
+    converted, unconverted = converter.convert(target, tally=lambda group: group[0] == 'category', strict=bool(requested))
+    categories = empty_categories()
+    months = {}
+    for (kind, key), amount in converted.items():
+        if kind == 'category':
+            categories[key] += amount
+        elif kind == 'month':
+            months[key] = amount
+    return {
+        'currency': target,
+        'total_minor': sum(categories.values()),
+        'num_activities': num_activities,
+        'categories': categories,
+        'months': [{'month': m, 'total_minor': months[m]} for m in sorted(months)],
+        'unconverted_minor': unconverted,
+        'trips': [
+            {
+                'id': t.id,
+                'name': t.name,
+                'start_date': t.start_date,
+                'end_date': t.end_date,
+                'total_minor': converted.get(('trip', t.id), 0),
+                'num_activities': trip_counts[t.id],
+            }
+            for t in trips
+        ],
+    }
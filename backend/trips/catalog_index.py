@@ -0,0 +1,121 @@
+"""In-process index of ``ActivityCatalog`` grouped by city and category.
+
+Loaded with a single query the first time it is needed and kept per process,
+so the heuristic itinerary generator needs no catalog queries per stop.
+Saving or deleting a catalog row drops the local copy and bumps a version in
+the Django cache so other processes reload on their next lookup; the index
+is also reloaded after ``CATALOG_INDEX_TTL_SECONDS`` as a safety net.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ActivityCatalog
+
+VERSION_KEY = "catalog-index:version"
+
+
+class CatalogItem(NamedTuple):
+    title: str
+    category: str
+    avg_cost: int
+    duration_minutes: Optional[int]
+
+
+def _rank(item: CatalogItem) -> tuple:
+    return (item.avg_cost, item.duration_minutes if item.duration_minutes is not None else 0)
+
+
+class CatalogIndex:
+    def __init__(self, rows):
+        by_city: Dict[int, Dict[str, List[CatalogItem]]] = defaultdict(lambda: defaultdict(list))
+        city_ids: Dict[str, int] = {}
+        destinations: List[str] = []
+        generic: List[CatalogItem] = []
+        for _id, title, category, avg_cost, duration, city_id, city_name in rows:
+            item = CatalogItem(title, category, avg_cost, duration)
+            if len(generic) < 3:
+                generic.append(item)
+            if city_id is None:
+                continue
+            by_city[city_id][(category or "").lower()].append(item)
+            key = (city_name or "").lower()
+            if key not in city_ids:
+                city_ids[key] = city_id
+                destinations.append(city_name)
+        for categories in by_city.values():
+            for items in categories.values():
+                items.sort(key=_rank)
+        self.by_city = {cid: dict(cats) for cid, cats in by_city.items()}
+        self.city_ids = city_ids
+        self.destinations = destinations
+        self.generic = generic
+
+    @classmethod
+    def load(cls) -> "CatalogIndex":
+        rows = (
+            ActivityCatalog.objects.order_by('id')
+            .values_list('id', 'title', 'category', 'avg_cost', 'duration_minutes', 'city_id', 'city__name')
+            .iterator(chunk_size=5000)
+        )
+        return cls(rows)
+
+    def pick(self, city_name: str, limit: int = 3) -> List[CatalogItem]:
+        """Cheapest/shortest activities for a city, spread across categories.
+
+        Cities without catalog entries get the first catalog rows, as before.
+        """
+        city_id = self.city_ids.get((city_name or "").lower())
+        categories = self.by_city.get(city_id) if city_id is not None else None
+        if not categories:
+            return list(self.generic[:limit])
+        # Round-robin over categories, best-ranked category first
+        queues = sorted(categories.values(), key=lambda items: _rank(items[0]))
+        picked: List[CatalogItem] = []
+        depth = 0
+        while len(picked) < limit:
+            row = [items[depth] for items in queues if depth < len(items)]
+            if not row:
+                break
+            picked.extend(row[:limit - len(picked)])
+            depth += 1
+        return picked
+
+
+_lock = threading.Lock()
+_index: Optional[CatalogIndex] = None
+_loaded_at = 0.0
+_loaded_version = None
+
+
+def get_index() -> CatalogIndex:
+    global _index, _loaded_at, _loaded_version
+    version = cache.get(VERSION_KEY, 0)
+    with _lock:
+        stale = (
+            _index is None
+            or version != _loaded_version
+            or time.monotonic() - _loaded_at > settings.CATALOG_INDEX_TTL_SECONDS
+        )
+        if stale:
+            _index = CatalogIndex.load()
+            _loaded_at = time.monotonic()
+            _loaded_version = version
+        return _index
+
+
+def invalidate() -> None:
+    """Drop this process's index and tell other processes to reload theirs."""
+    global _index
+    with _lock:
+        _index = None
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
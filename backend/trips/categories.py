@@ -0,0 +1,21 @@
+"""Budget buckets for free-text activity categories.
+
+``Activity.budget_category`` stores the bucket, computed on write, so budget
+queries group on a column instead of re-scanning category strings.
+"""
+BUDGET_CATEGORIES = ("activities", "meals", "transport", "stay", "other")
+
+_KEYWORDS = (
+    ("meals", ("food", "meal", "dine", "restaurant")),
+    ("transport", ("transport", "flight", "train", "bus", "cab", "taxi")),
+    ("stay", ("stay", "hotel", "hostel", "accommodation")),
+    ("activities", ("sight", "tour", "museum", "activity", "adventure", "culture")),
+)
+
+
+def normalize_category(raw: str) -> str:
+    r = (raw or "").strip().lower()
+    for bucket, keywords in _KEYWORDS:
+        if any(k in r for k in keywords):
+            return bucket
+    return "activities" if r else "other"
@@ -0,0 +1,98 @@
+"""Circuit breaker shared across worker processes.
+
+After ``LLM_BREAKER_FAILURE_THRESHOLD`` consecutive failures the breaker
+opens and callers skip the remote call entirely (falling back immediately).
+Once ``LLM_BREAKER_RESET_SECONDS`` have passed, exactly one caller is let
+through as a half-open probe: success closes the breaker, failure re-opens it.
+
+State lives in ``CircuitBreakerState`` rows; every transition is a
+conditional UPDATE so concurrent workers cannot both claim the probe.
+"""
+from __future__ import annotations
+
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from gt_backend import metrics
+
+from .models import CircuitBreakerState
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: int, probe_timeout_seconds: int):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = timedelta(seconds=reset_seconds)
+        self.probe_timeout = timedelta(seconds=probe_timeout_seconds)
+        # Set by allow_request when this caller was admitted as the half-open probe
+        self.probing = False
+
+    def _row(self) -> CircuitBreakerState:
+        row, _ = CircuitBreakerState.objects.get_or_create(name=self.name)
+        return row
+
+    def _rows(self):
+        return CircuitBreakerState.objects.filter(name=self.name)
+
+    def allow_request(self) -> bool:
+        row = self._row()
+        if row.state == CircuitBreakerState.STATE_CLOSED:
+            return True
+        now = timezone.now()
+        if row.state == CircuitBreakerState.STATE_OPEN:
+            if row.opened_at and now - row.opened_at < self.reset_timeout:
+                return False
+            # Cool-down elapsed: the first caller to flip open -> half_open is the probe
+            self.probing = bool(self._rows().filter(state=CircuitBreakerState.STATE_OPEN, opened_at=row.opened_at).update(
+                state=CircuitBreakerState.STATE_HALF_OPEN, probe_started_at=now, updated_at=now,
+            ))
+            return self.probing
+        # Half-open with a probe in flight; reclaim it only if that probe never reported back
+        if row.probe_started_at and now - row.probe_started_at < self.probe_timeout:
+            return False
+        self.probing = bool(self._rows().filter(state=CircuitBreakerState.STATE_HALF_OPEN, probe_started_at=row.probe_started_at).update(
+            probe_started_at=now, updated_at=now,
+        ))
+        return self.probing
+
+    def record_success(self) -> None:
+        self._rows().exclude(state=CircuitBreakerState.STATE_CLOSED, failures=0).update(
+            state=CircuitBreakerState.STATE_CLOSED, failures=0, opened_at=None, probe_started_at=None, updated_at=timezone.now(),
+        )
+
+    def record_failure(self) -> None:
+        now = timezone.now()
+        self._row()
+        rows = self._rows()
+        if rows.filter(state=CircuitBreakerState.STATE_HALF_OPEN).update(
+            state=CircuitBreakerState.STATE_OPEN, opened_at=now, probe_started_at=None, updated_at=now,
+        ):
+            metrics.incr(f"breaker.{self.name}.reopened")
+            return
+        rows.update(failures=F("failures") + 1, updated_at=now)
+        if rows.filter(state=CircuitBreakerState.STATE_CLOSED, failures__gte=self.failure_threshold).update(
+            state=CircuitBreakerState.STATE_OPEN, opened_at=now, updated_at=now,
+        ):
+            metrics.incr(f"breaker.{self.name}.opened")
+
+    def state(self) -> dict:
+        row = self._row()
+        return {"state": row.state, "failures": row.failures, "opened_at": row.opened_at}
+
+
+def openrouter_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        "openrouter",
+        failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+        # A probe may legitimately run for the full OpenRouter read timeout
+        probe_timeout_seconds=int(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "60")) + 10,
+    )
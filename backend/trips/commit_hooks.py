@@ -0,0 +1,34 @@
+"""``transaction.on_commit`` callbacks registered at most once per transaction."""
+from __future__ import annotations
+
+from typing import Callable, Hashable
+
+from django.db import transaction
+
+
+class _Callback:
+    def __init__(self, key: Hashable, func: Callable, args: tuple):
+        self.key, self.func, self.args = key, func, args
+        self.ran = False
+
+    def __call__(self):
+        self.ran = True
+        self.func(*self.args)
+
+
+def on_commit_once(key: Hashable, func: Callable, *args) -> None:
+    """Run ``func(*args)`` after commit unless a callback for ``key`` is already pending.
+
+    Lets receivers that fire once per row queue per-trip work (cache version
+    bumps, snapshot invalidation) a single time. Only callbacks queued at the
+    same savepoint level count, as those commit or roll back together with
+    this one.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        # atomic(savepoint=False) blocks push None: they share the enclosing level
+        level = set(connection.savepoint_ids) - {None}
+        for sids, pending, _ in connection.run_on_commit:
+            if sids - {None} == level and isinstance(pending, _Callback) and pending.key == key and not pending.ran:
+                return
+    transaction.on_commit(_Callback(key, func, args))
@@ -0,0 +1,94 @@
+"""Conditional GET (ETag / Last-Modified) for trip trees.
+
+Validators come from one aggregate over the object and its children: the
+newest ``updated_at`` at each level plus the child counts, so a deleted
+child changes the ETag even though no remaining row got newer. Deleting a
+stop or activity also touches its trip (see ``signals``) so Last-Modified
+moves forward for clients that only send ``If-Modified-Since``.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Optional, Sequence, Tuple
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Trip
+
+Validators = Tuple[str, int]
+
+
+def tree_validators(queryset, children: Sequence[str] = ()) -> Optional[Validators]:
+    """``(weak_etag, last_modified_timestamp)`` for the single row in ``queryset``.
+
+    ``children`` are relation paths (e.g. ``"stops__activities"``) whose rows
+    count as part of the object. Returns None when the row does not exist.
+    """
+    aggregates = {"n": Count("id", distinct=True), "modified": Max("updated_at")}
+    for i, path in enumerate(children):
+        aggregates[f"n{i}"] = Count(f"{path}__id", distinct=True)
+        aggregates[f"modified{i}"] = Max(f"{path}__updated_at")
+    state = queryset.order_by().aggregate(**aggregates)
+    if not state["n"]:
+        return None
+    stamps = [v for k, v in state.items() if k.startswith("modified") and v is not None]
+    last_modified = max(stamps)
+    digest = hashlib.sha1(repr(sorted(state.items())).encode()).hexdigest()[:20]
+    return f'W/"{digest}"', int(last_modified.timestamp())
+
+
+def with_variant(validators: Optional[Validators], variant: str) -> Optional[Validators]:
+    """Distinct ETag per representation (e.g. sparse fieldsets) of the same tree."""
+    if validators is None or not variant:
+        return validators
+    etag, last_modified = validators
+    suffix = hashlib.sha1(variant.encode()).hexdigest()[:8]
+    return f'{etag[:-1]}-{suffix}"', last_modified
+
+
+def not_modified(request, validators: Optional[Validators]):
+    """A 304 response if the request's preconditions match ``validators``, else None."""
+    if validators is None:
+        return None
+    etag, last_modified = validators
+    resp = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if resp is not None:
+        set_validators(resp, validators)
+    return resp
+
+
+def set_validators(resp, validators: Optional[Validators]):
+    if validators is not None and resp.status_code in (200, 304):
+        resp["ETag"] = validators[0]
+        resp["Last-Modified"] = http_date(validators[1])
+    return resp
+
+
+def touch_trip(**lookup) -> None:
+    """Bump ``updated_at`` on the trip(s) matching ``lookup`` without loading them."""
+    Trip.objects.filter(**lookup).update(updated_at=timezone.now())
+
+
+class ConditionalRetrieveMixin:
+    """Viewset mixin: ``retrieve`` answers 304 while the object tree is unchanged.
+
+    ``conditional_children`` lists the relation paths included in the tree.
+    The validators query runs against ``get_queryset()``, so objects the user
+    cannot see fall through to the normal 404.
+    """
+    conditional_children: Sequence[str] = ()
+
+    def conditional_variant(self) -> str:
+        return ""
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        rows = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        validators = with_variant(tree_validators(rows, self.conditional_children), self.conditional_variant())
+        resp = not_modified(request, validators)
+        if resp is None:
+            resp = set_validators(super().retrieve(request, *args, **kwargs), validators)
+        return resp
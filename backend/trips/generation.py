@@ -0,0 +1,252 @@
+"""Itinerary generation for ``TripViewSet.generate``.
+
+The itinerary is planned entirely in memory first (LLM proposal or the
+catalog heuristic), then written in a single transaction: one batched city
+lookup/upsert, one ``bulk_create`` for stops and one for activities.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+
+from . import catalog_index, llm, llm_cache
+from .models import Activity, City, Trip, TripStop
+from .signals import delete_stops, trip_tree_changed
+
+logger = logging.getLogger(__name__)
+
+GENERATE_MODEL = llm.DEFAULT_MODEL
+GENERATE_TEMPERATURE = 0.6
+DEFAULT_DESTINATIONS = ["Goa", "Udaipur"]
+MAX_ACTIVITIES_PER_STOP = 5
+HEURISTIC_ACTIVITIES_PER_STOP = 3
+DEFAULT_DAYS_PER_CITY = 2
+MAX_DAYS_PER_CITY = 30
+
+
+@dataclass
+class PlannedActivity:
+    title: str
+    category: str = ""
+    cost_amount: int = 0
+
+
+@dataclass
+class PlannedStop:
+    city_name: str
+    start_date: date
+    end_date: date
+    order: int
+    activities: List[PlannedActivity] = field(default_factory=list)
+
+
+def parse_days_per_city(value) -> int:
+    """Validate ``days_per_city`` from a JSON body or query string.
+
+    Missing or blank means ``DEFAULT_DAYS_PER_CITY``. Raises ValueError for
+    non-integers and values outside ``1..MAX_DAYS_PER_CITY``.
+    """
+    if value is None or value == '':
+        return DEFAULT_DAYS_PER_CITY
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError("days_per_city must be an integer")
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("days_per_city must be an integer")
+    if not 1 <= days <= MAX_DAYS_PER_CITY:
+        raise ValueError(f"days_per_city must be between 1 and {MAX_DAYS_PER_CITY}")
+    return days
+
+
+def default_destinations() -> List[str]:
+    return catalog_index.get_index().destinations[:3] or list(DEFAULT_DESTINATIONS)
+
+
+def layout_stops(start: date, names: Iterable[str], days_per_city: int) -> List[PlannedStop]:
+    """Lay out consecutive stops of ``days_per_city`` days each, starting at ``start``."""
+    plan = []
+    cur = start
+    for order, name in enumerate(names, start=1):
+        end = cur + timedelta(days=days_per_city)
+        plan.append(PlannedStop(city_name=name, start_date=cur, end_date=end, order=order))
+        cur = end
+    return plan
+
+
+def planned_activities(per_city: dict, city_name: str) -> List[PlannedActivity]:
+    """Activities proposed for ``city_name`` in an LLM ``perCity`` mapping."""
+    acts = per_city.get(city_name) or per_city.get(city_name.title()) or {}
+    return [
+        PlannedActivity(
+            title=a.get('title') or 'Activity',
+            category=a.get('category') or '',
+            cost_amount=int(a.get('cost_minor') or 0),
+        )
+        for a in acts.get('activities', [])[:MAX_ACTIVITIES_PER_STOP]
+    ]
+
+
+def plan_from_payload(trip: Trip, payload: dict, dests: List[str], days_per_city: int) -> List[PlannedStop]:
+    """Build a plan from a parsed LLM payload ``{cities: [...], perCity: {...}}``."""
+    proposed = [c.get('name') for c in payload.get('cities', []) if c.get('name')]
+    per_city = payload.get('perCity', {}) or {}
+    plan = layout_stops(trip.start_date, proposed or dests, days_per_city)
+    for stop in plan:
+        stop.activities = planned_activities(per_city, stop.city_name)
+    return plan
+
+
+def itinerary_messages(origin: Optional[str], days_per_city: int, currency: str) -> List[dict]:
+    system = "Return only valid JSON"
+    user_prompt = (
+        "Design a short itinerary. Output JSON: { cities: [{ name, country }], perCity: { cityName: { activities: [{ title, category, cost_minor }] } } }"
+    )
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": f"Origin: {origin}; daysPerCity: {days_per_city}; currency: {currency}. {user_prompt}"},
+    ]
+
+
+def itinerary_cache_key(messages: List[dict]) -> str:
+    return llm_cache.cache_key(GENERATE_MODEL, messages, {"temperature": GENERATE_TEMPERATURE})
+
+
+def request_llm_payload(origin: Optional[str], days_per_city: int, currency: str) -> Optional[dict]:
+    """Ask OpenRouter for an itinerary proposal. Returns None when disabled or on failure.
+
+    Parsed payloads are served from ``trips.llm_cache`` for identical prompts.
+    """
+    if not llm.api_key():
+        return None
+    messages = itinerary_messages(origin, days_per_city, currency)
+    key = itinerary_cache_key(messages)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        t0 = time.perf_counter()
+        content = llm.chat_completion(messages, model=GENERATE_MODEL, temperature=GENERATE_TEMPERATURE)
+        latency_ms = (time.perf_counter() - t0) * 1000
+        payload = json.loads(llm.extract_json(content))
+        if not isinstance(payload, dict):
+            return None
+    except Exception as ex:
+        logger.warning("OpenRouter itinerary generation failed: %s", ex)
+        return None
+    llm_cache.put(key, GENERATE_MODEL, payload, latency_ms)
+    return payload
+
+
+def plan_heuristic(trip: Trip, dests: List[str], days_per_city: int) -> List[PlannedStop]:
+    """Fallback plan: the cheapest/shortest catalog activities of each stop's city.
+
+    Served from the in-process catalog index, so no catalog queries per stop.
+    """
+    index = catalog_index.get_index()
+    plan = layout_stops(trip.start_date, dests, days_per_city)
+    for stop in plan:
+        stop.activities = [
+            PlannedActivity(title=item.title, category=item.category, cost_amount=item.avg_cost)
+            for item in index.pick(stop.city_name, HEURISTIC_ACTIVITIES_PER_STOP)
+        ]
+    return plan
+
+
+def resolve_cities(names: Iterable[str]) -> Dict[str, City]:
+    """Map city names to ``City`` rows with one lookup and one bulk insert for missing names."""
+    wanted = list(dict.fromkeys(names))
+    found: Dict[str, City] = {}
+    for city in City.objects.filter(name__in=wanted).order_by('id'):
+        found.setdefault(city.name, city)
+    missing = [City(name=name, country="") for name in wanted if name not in found]
+    if missing:
+        for city in City.objects.bulk_create(missing):
+            found[city.name] = city
+    return found
+
+
+@transaction.atomic
+def persist_itinerary(trip: Trip, plan: List[PlannedStop], currency: str) -> List[TripStop]:
+    """Replace the trip's stops with ``plan``. All-or-nothing."""
+    # Serialize concurrent regenerations of the same trip (no-op on SQLite)
+    Trip.objects.select_for_update().filter(pk=trip.pk).first()
+    cities = resolve_cities(p.city_name for p in plan)
+    delete_stops(trip.stops.all())
+    stops = TripStop.objects.bulk_create([
+        TripStop(trip=trip, city=cities[p.city_name], start_date=p.start_date, end_date=p.end_date, order=p.order)
+        for p in plan
+    ])
+    Activity.objects.bulk_create([
+        Activity(trip_stop=stop, title=a.title, category=a.category, cost_amount=a.cost_amount, currency=currency)
+        for stop, p in zip(stops, plan)
+        for a in p.activities
+    ])
+    # bulk_create sends no signals
+    trip_tree_changed(trip.pk)
+    return stops
+
+
+@transaction.atomic
+def append_stop(trip: Trip, planned: PlannedStop, currency: str, replace_existing: bool = False) -> TripStop:
+    """Persist a single planned stop (used when streaming). Optionally clears old stops first."""
+    Trip.objects.select_for_update().filter(pk=trip.pk).first()
+    city = resolve_cities([planned.city_name])[planned.city_name]
+    if replace_existing:
+        delete_stops(trip.stops.all())
+    stop = TripStop.objects.create(
+        trip=trip, city=city, start_date=planned.start_date, end_date=planned.end_date, order=planned.order,
+    )
+    Activity.objects.bulk_create([
+        Activity(trip_stop=stop, title=a.title, category=a.category, cost_amount=a.cost_amount, currency=currency)
+        for a in planned.activities
+    ])
+    trip_tree_changed(trip.pk)
+    return stop
+
+
+ProgressCallback = Callable[[str, int], None]
+
+
+def generate_itinerary(
+    trip: Trip,
+    days_per_city: int,
+    currency: str,
+    on_progress: Optional[ProgressCallback] = None,
+) -> Tuple[str, List[TripStop]]:
+    """Plan (LLM first, heuristic fallback) and persist an itinerary for ``trip``.
+
+    ``on_progress(stage, percent)`` is called as generation advances.
+    Returns ``(source, stops)`` where source is ``"openrouter"`` or ``"heuristic"``.
+    """
+    def progress(stage: str, percent: int) -> None:
+        if on_progress is not None:
+            on_progress(stage, percent)
+
+    progress("planning", 10)
+    origin = trip.origin_city.name if trip.origin_city else None
+    dests = default_destinations()
+    plan: List[PlannedStop] = []
+    source = "heuristic"
+    payload = request_llm_payload(origin, days_per_city, currency)
+    if payload is not None:
+        try:
+            plan = plan_from_payload(trip, payload, dests, days_per_city)
+            source = "openrouter"
+        except Exception as ex:
+            logger.warning("OpenRouter itinerary payload unusable: %s", ex)
+            plan = []
+    if not plan:
+        progress("fallback", 60)
+        plan = plan_heuristic(trip, dests, days_per_city)
+        source = "heuristic"
+    progress("persisting", 80)
+    stops = persist_itinerary(trip, plan, currency)
+    progress("done", 100)
+    return source, stops
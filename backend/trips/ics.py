@@ -0,0 +1,153 @@
+"""iCalendar (RFC 5545) export of trip calendars.
+
+Events follow the day distribution of ``GET /trips/{id}/calendar``
+(``trips.schedule``): one all-day event per day range a stop owns and one
+event per activity on its assigned day (timed when ``start_time`` is set).
+Stops are loaded up front (a few per trip); activities are streamed from a
+chunked iterator, so a feed with thousands of activities is written out
+event by event instead of being built in memory.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, Iterator, List
+
+from django.core import signing
+from django.db.models import Count
+from rest_framework.renderers import BaseRenderer
+
+from .models import Activity, TripStop
+from .schedule import StopIndex, bucket_offset, stop_span, trip_days
+
+PRODID = "-//GlobalTrotters//Trip calendar//EN"
+UID_DOMAIN = "globaltrotters"
+CHUNK_SIZE = 500
+FEED_SALT = "trips.ics.feed"
+
+
+class ICalendarRenderer(BaseRenderer):
+    """Lets ``Accept: text/calendar`` pass content negotiation; only errors are rendered through it."""
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return str(data).encode(self.charset)
+
+
+def feed_token(user) -> str:
+    return signing.Signer(salt=FEED_SALT).sign(str(user.pk))
+
+
+def feed_user_id(token: str) -> int:
+    """User id from a feed token; raises ``signing.BadSignature``."""
+    return int(signing.Signer(salt=FEED_SALT).unsign(token))
+
+
+def _escape(text: str) -> str:
+    return (text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    # Lines are limited to 75 octets; continuation lines start with a space
+    out, chunk, size = [], [], 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            out.append("".join(chunk))
+            chunk, size = [" "], 1
+        chunk.append(ch)
+        size += n
+    out.append("".join(chunk))
+    return "\r\n".join(out) + "\r\n"
+
+
+def _event(props: List[tuple]) -> str:
+    return "".join(_fold(f"{k}:{v}") for k, v in [("BEGIN", "VEVENT"), *props, ("END", "VEVENT")])
+
+
+def _stamp(dt) -> str:
+    return dt.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _day(d) -> str:
+    return d.strftime("%Y%m%d")
+
+
+def _stop_events(trip, index: StopIndex) -> Iterator[str]:
+    trip_end = trip.start_date + timedelta(days=trip_days(trip))
+    for start, end, stop in index.segments:
+        start, end = max(start, trip.start_date), min(end, trip_end)
+        if start >= end:
+            continue
+        yield _event([
+            ("UID", f"stop-{stop.id}-{_day(start)}@{UID_DOMAIN}"),
+            ("DTSTAMP", _stamp(stop.updated_at)),
+            ("DTSTART;VALUE=DATE", _day(start)),
+            ("DTEND;VALUE=DATE", _day(end)),
+            ("SUMMARY", _escape(f"{stop.city.name}, {stop.city.country}")),
+            ("DESCRIPTION", _escape(f"{trip.name} - stop {stop.order}")),
+            ("TRANSP", "TRANSPARENT"),
+        ])
+
+
+def _activity_event(activity: Activity, day) -> str:
+    if activity.start_time:
+        start = datetime.combine(day, activity.start_time)
+        when = [("DTSTART", start.strftime("%Y%m%dT%H%M%S"))]
+        if activity.end_time and activity.end_time > activity.start_time:
+            when.append(("DTEND", datetime.combine(day, activity.end_time).strftime("%Y%m%dT%H%M%S")))
+    else:
+        when = [("DTSTART;VALUE=DATE", _day(day)), ("DTEND;VALUE=DATE", _day(day + timedelta(days=1)))]
+    details = [activity.category, f"{activity.cost_amount} {activity.currency}" if activity.cost_amount else "", activity.notes]
+    return _event([
+        ("UID", f"activity-{activity.id}@{UID_DOMAIN}"),
+        ("DTSTAMP", _stamp(activity.updated_at)),
+        *when,
+        ("SUMMARY", _escape(activity.title)),
+        ("DESCRIPTION", _escape("\n".join(d for d in details if d))),
+    ])
+
+
+def calendar_lines(trips: Iterable, name: str) -> Iterator[str]:
+    """VCALENDAR text for ``trips`` (a list or queryset), yielded event by event."""
+    trips = list(trips)
+    by_id = {t.id: t for t in trips}
+    stops_by_trip: Dict[int, list] = defaultdict(list)
+    stops = (
+        TripStop.objects.filter(trip_id__in=by_id).select_related('city')
+        .annotate(activity_count=Count('activities')).order_by('trip_id', 'order', 'start_date')
+    )
+    for stop in stops:
+        stops_by_trip[stop.trip_id].append(stop)
+    indexes = {tid: StopIndex(stops_by_trip[tid]) for tid in by_id}
+    stops_by_id = {s.id: s for ss in stops_by_trip.values() for s in ss}
+
+    yield "".join(_fold(f"{k}:{v}") for k, v in [
+        ("BEGIN", "VCALENDAR"), ("VERSION", "2.0"), ("PRODID", PRODID), ("CALSCALE", "GREGORIAN"),
+        ("METHOD", "PUBLISH"), ("X-WR-CALNAME", _escape(name)),
+    ])
+    for trip in trips:
+        yield from _stop_events(trip, indexes[trip.id])
+
+    activities = (
+        Activity.objects.filter(trip_stop__trip_id__in=by_id)
+        .only('id', 'trip_stop_id', 'title', 'category', 'start_time', 'end_time', 'cost_amount', 'currency', 'notes', 'updated_at')
+        .order_by('trip_stop_id', 'id')
+    )
+    current, idx = None, 0
+    for activity in activities.iterator(chunk_size=CHUNK_SIZE):
+        if activity.trip_stop_id != current:
+            current, idx = activity.trip_stop_id, 0
+        stop = stops_by_id[current]
+        day = stop.start_date + timedelta(days=bucket_offset(idx, stop.activity_count, stop_span(stop)))
+        idx += 1
+        trip = by_id[stop.trip_id]
+        # Same visibility as the calendar: the day must belong to the trip and to this stop
+        if not (trip.start_date <= day < trip.start_date + timedelta(days=trip_days(trip))):
+            continue
+        if indexes[trip.id].stop_at(day) is not stop:
+            continue
+        yield _activity_event(activity, day)
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,177 @@
+"""DB-backed job queue for itinerary generation.
+
+Every generate request goes through a ``GenerationJob``: async requests
+queue one for the ``run_generation_jobs`` worker, synchronous ones run it
+inline. Jobs double as the per-trip single-flight lock and the
+``Idempotency-Key`` replay record, so retries and double-clicks attach to
+the in-flight or finished job instead of starting another LLM call.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .generation import generate_itinerary
+from .models import GenerationJob, Trip, TripStop
+
+logger = logging.getLogger(__name__)
+
+SUPERSEDED_ERROR = "The itinerary this job generated has since been replaced"
+
+
+def attachable_job(trip: Trip, idempotency_key: str = '') -> Optional[GenerationJob]:
+    """Job a new generate request for ``trip`` should attach to instead of starting work.
+
+    That is the job created with the same ``Idempotency-Key`` within the
+    replay window (finished or not), else the trip's in-flight job.
+    """
+    if idempotency_key:
+        job = GenerationJob.objects.filter(trip=trip, idempotency_key=idempotency_key).first()
+        if job is not None:
+            window = timedelta(seconds=settings.GENERATE_IDEMPOTENCY_WINDOW_SECONDS)
+            if job.status in GenerationJob.ACTIVE_STATUSES or job.created_at >= timezone.now() - window:
+                return job
+            # Expired: release the key so it can start a fresh job
+            GenerationJob.objects.filter(pk=job.pk).update(idempotency_key='')
+    return GenerationJob.objects.filter(trip=trip, status__in=GenerationJob.ACTIVE_STATUSES).first()
+
+
+def submit_generation(
+    trip: Trip,
+    user,
+    days_per_city: int,
+    currency: str,
+    idempotency_key: str = '',
+    inline: bool = False,
+) -> Tuple[GenerationJob, bool]:
+    """Create the trip's generation job, or return the job to attach to.
+
+    ``inline`` jobs start as running (the caller executes them in-process);
+    others are queued for the worker. Returns ``(job, created)``. The
+    partial unique constraints on ``GenerationJob`` make this race-free.
+    """
+    job = attachable_job(trip, idempotency_key)
+    if job is not None:
+        return job, False
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            job = GenerationJob.objects.create(
+                trip=trip,
+                user=user,
+                idempotency_key=idempotency_key,
+                params={"days_per_city": days_per_city, "currency": currency},
+                status=GenerationJob.STATUS_RUNNING if inline else GenerationJob.STATUS_QUEUED,
+                stage='running' if inline else GenerationJob.STATUS_QUEUED,
+                started_at=now if inline else None,
+                inline=inline,
+            )
+    except IntegrityError:
+        # Lost the race to a concurrent request for this trip/key
+        job = attachable_job(trip, idempotency_key)
+        if job is None:
+            raise
+        return job, False
+    return job, True
+
+
+def claim_next_job() -> Optional[GenerationJob]:
+    """Atomically move the oldest queued job to running and return it.
+
+    The conditional UPDATE acts as a compare-and-swap, so several workers can
+    poll the same table (SQLite or Postgres) without running a job twice.
+    """
+    candidates = GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED).order_by('id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = GenerationJob.objects.filter(pk=job_id, status=GenerationJob.STATUS_QUEUED).update(
+            status=GenerationJob.STATUS_RUNNING,
+            stage='claimed',
+            progress=5,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('trip__origin_city').get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Return running jobs whose worker died (no progress for ``older_than``) to the queue.
+
+    Only worker-claimed jobs are requeued; inline ones belong to a web
+    request that may still be running them and are left to ``fail_abandoned_jobs``.
+    """
+    cutoff = timezone.now() - older_than
+    return GenerationJob.objects.filter(status=GenerationJob.STATUS_RUNNING, inline=False, updated_at__lt=cutoff).update(
+        status=GenerationJob.STATUS_QUEUED, stage=GenerationJob.STATUS_QUEUED, progress=0, updated_at=timezone.now(),
+    )
+
+
+def fail_abandoned_jobs(older_than: timedelta) -> int:
+    """Fail inline jobs whose web request died without reporting back.
+
+    They are not retried (the client is gone); failing them frees the trip's
+    single-flight slot.
+    """
+    cutoff = timezone.now() - older_than
+    return GenerationJob.objects.filter(status=GenerationJob.STATUS_RUNNING, inline=True, updated_at__lt=cutoff).update(
+        status=GenerationJob.STATUS_FAILED, stage='failed', error="abandoned by its request",
+        finished_at=timezone.now(), updated_at=timezone.now(),
+    )
+
+
+def finish_job(job: GenerationJob, source: str, stop_ids: List[int]) -> GenerationJob:
+    job.status = GenerationJob.STATUS_SUCCEEDED
+    job.stage = 'done'
+    job.progress = 100
+    job.source = source
+    job.result = {"stop_ids": stop_ids}
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'stage', 'progress', 'source', 'result', 'finished_at', 'updated_at'])
+    return job
+
+
+def fail_job(job: GenerationJob, error: str) -> GenerationJob:
+    job.status = GenerationJob.STATUS_FAILED
+    job.stage = 'failed'
+    job.error = error[:1000]
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'stage', 'error', 'finished_at', 'updated_at'])
+    return job
+
+
+def job_stops(job: GenerationJob) -> Optional[List[TripStop]]:
+    """Stops a succeeded ``job`` produced, or None once its itinerary has been replaced.
+
+    Replays must not report a later regeneration's (or an empty) stop list
+    as this job's result.
+    """
+    stop_ids = (job.result or {}).get('stop_ids', [])
+    stops = list(TripStop.objects.filter(trip_id=job.trip_id, id__in=stop_ids).select_related('city').prefetch_related('activities'))
+    if len(stops) != len(stop_ids):
+        return None
+    return stops
+
+
+def run_job(job: GenerationJob) -> GenerationJob:
+    """Execute a claimed (or inline) job and record its outcome."""
+    def on_progress(stage: str, percent: int) -> None:
+        GenerationJob.objects.filter(pk=job.pk).update(stage=stage, progress=percent, updated_at=timezone.now())
+
+    params = job.params or {}
+    try:
+        source, stops = generate_itinerary(
+            job.trip,
+            int(params.get('days_per_city') or 2),
+            params.get('currency') or 'INR',
+            on_progress=on_progress,
+        )
+    except Exception as ex:
+        logger.exception("Generation job %s failed", job.pk)
+        return fail_job(job, str(ex))
+    return finish_job(job, source, [s.id for s in stops])
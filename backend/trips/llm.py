@@ -0,0 +1,117 @@
+"""OpenRouter chat-completions client shared by the LLM-backed endpoints."""
+from __future__ import annotations
+
+import json
+import os
+from typing import Iterator, List
+
+from gt_backend import http_client, metrics
+
+from .circuit_breaker import CircuitOpenError, openrouter_breaker
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "deepseek/deepseek-r1-0528:free"
+
+
+def api_key() -> str:
+    return os.getenv("OPENROUTER_API_KEY") or ""
+
+
+def openrouter_headers(key: str) -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {key}",
+        "HTTP-Referer": os.getenv("OPENROUTER_SITE_URL", "http://localhost:3000"),
+        "X-Title": os.getenv("OPENROUTER_APP_NAME", "GlobalTrotters"),
+    }
+
+
+def timeout() -> tuple:
+    return (10, int(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "60")))
+
+
+def chat_completion(messages: List[dict], *, model: str = DEFAULT_MODEL, temperature: float = 0.6) -> str:
+    """Return the assistant message content.
+
+    Raises on HTTP/transport errors, or ``CircuitOpenError`` without calling
+    OpenRouter while the breaker is open so callers fall back immediately.
+    """
+    breaker = openrouter_breaker()
+    if not breaker.allow_request():
+        metrics.incr("llm.short_circuited")
+        raise CircuitOpenError("OpenRouter circuit open")
+    try:
+        r = http_client.post(
+            OPENROUTER_URL,
+            headers=openrouter_headers(api_key()),
+            json={"model": model, "temperature": temperature, "messages": messages},
+            timeout=timeout(),
+        )
+        r.raise_for_status()
+        data = r.json()
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+
+def stream_chat_completion(messages: List[dict], *, model: str = DEFAULT_MODEL, temperature: float = 0.6) -> Iterator[str]:
+    """Yield assistant content deltas from OpenRouter's streaming (SSE) API.
+
+    Same breaker semantics as ``chat_completion``: a failure before or during
+    the stream counts against the breaker, a completed stream closes it. A
+    half-open probe whose consumer stops iterating (client disconnect) counts
+    as a failure, so the breaker does not wait out the probe timeout.
+    """
+    breaker = openrouter_breaker()
+    if not breaker.allow_request():
+        metrics.incr("llm.short_circuited")
+        raise CircuitOpenError("OpenRouter circuit open")
+    settled = False
+    try:
+        r = http_client.post(
+            OPENROUTER_URL,
+            headers=openrouter_headers(api_key()),
+            json={"model": model, "temperature": temperature, "messages": messages, "stream": True},
+            timeout=timeout(),
+            stream=True,
+        )
+        r.raise_for_status()
+        with r:
+            for line in r.iter_lines(decode_unicode=True):
+                # Blank lines separate events; ':'-prefixed lines are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+                delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+                if delta.get("content"):
+                    yield delta["content"]
+    except Exception:
+        settled = True
+        breaker.record_failure()
+        raise
+    else:
+        settled = True
+        breaker.record_success()
+    finally:
+        # GeneratorExit: closed mid-stream without an outcome
+        if not settled and breaker.probing:
+            breaker.record_failure()
+
+
+def extract_json(s: str) -> str:
+    """Strip code fences / chatter around a JSON object returned by an LLM."""
+    s = s.strip()
+    if s.startswith("```"):
+        s = s.strip('`')
+        if s.lower().startswith("json\n"):
+            s = s[5:]
+    start = s.find("{")
+    end = s.rfind("}")
+    return s[start:end + 1] if start != -1 and end != -1 and end >= start else s
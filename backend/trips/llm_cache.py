@@ -0,0 +1,97 @@
+"""Persistent, TTL + LRU bounded cache of parsed LLM payloads.
+
+Keys are a SHA-256 over a normalized JSON document of model, messages and
+sampling parameters, so whitespace-only prompt differences share an entry.
+Hit/miss counts are recorded in ``gt_backend.metrics`` (per process) and
+per-entry ``hits`` (persistent).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from gt_backend import metrics
+
+from .models import LLMResponseCache
+
+_WS = re.compile(r"\s+")
+
+
+def cache_key(model: str, messages: List[dict], params: Optional[dict] = None) -> str:
+    normalized = {
+        "model": model.strip().lower(),
+        "messages": [
+            {"role": (m.get("role") or "").strip().lower(), "content": _WS.sub(" ", m.get("content") or "").strip()}
+            for m in messages
+        ],
+        "params": params or {},
+    }
+    raw = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[dict]:
+    """Return the cached payload for ``key`` if present and fresh."""
+    now = timezone.now()
+    entry = LLMResponseCache.objects.filter(key=key, expires_at__gt=now).only("id", "payload", "latency_ms").first()
+    if entry is None:
+        metrics.incr("llm_cache.misses")
+        return None
+    LLMResponseCache.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, last_used_at=now)
+    metrics.incr("llm_cache.hits")
+    metrics.incr("llm_cache.saved_ms", entry.latency_ms)
+    return entry.payload
+
+
+def put(key: str, model: str, payload: dict, latency_ms: int = 0) -> None:
+    now = timezone.now()
+    LLMResponseCache.objects.update_or_create(
+        key=key,
+        defaults={
+            "model": model,
+            "payload": payload,
+            "latency_ms": max(0, int(latency_ms)),
+            "expires_at": now + timedelta(seconds=settings.LLM_CACHE_TTL_SECONDS),
+            "last_used_at": now,
+        },
+    )
+    evict(now)
+
+
+def evict(now=None) -> int:
+    """Drop expired entries, then least recently used ones beyond the size bound."""
+    now = now or timezone.now()
+    removed, _ = LLMResponseCache.objects.filter(expires_at__lte=now).delete()
+    limit = max(1, settings.LLM_CACHE_MAX_ENTRIES)
+    if LLMResponseCache.objects.count() > limit:
+        # last_used_at of the oldest entry we keep; everything used before it goes
+        cutoff = LLMResponseCache.objects.order_by("-last_used_at").values_list("last_used_at", flat=True)[limit - 1]
+        extra, _ = LLMResponseCache.objects.filter(last_used_at__lt=cutoff).delete()
+        removed += extra
+    if removed:
+        metrics.incr("llm_cache.evictions", removed)
+    return removed
+
+
+def stats() -> dict:
+    agg = LLMResponseCache.objects.aggregate(
+        n_entries=Count("id"), n_hits=Sum("hits"), saved_ms=Sum(F("hits") * F("latency_ms")),
+    )
+    snap = metrics.snapshot()["counters"]
+    return {
+        "entries": agg["n_entries"],
+        "max_entries": settings.LLM_CACHE_MAX_ENTRIES,
+        "ttl_seconds": settings.LLM_CACHE_TTL_SECONDS,
+        "stored_hits": agg["n_hits"] or 0,
+        "stored_latency_saved_ms": agg["saved_ms"] or 0,
+        "process_hits": int(snap.get("llm_cache.hits", 0)),
+        "process_misses": int(snap.get("llm_cache.misses", 0)),
+        "process_latency_saved_ms": int(snap.get("llm_cache.saved_ms", 0)),
+    }
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from trips.models import TripBudgetRollup
+
+
+class Command(BaseCommand):
+    help = "Verify TripBudgetRollup rows against activities; --rebuild repairs drifted stops"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Rewrite the rollups of every stop that drifted")
+        parser.add_argument("--all", action="store_true", help="With --rebuild, rewrite every rollup row")
+
+    def handle(self, *args, **options):
+        if options["rebuild"] and options["all"]:
+            rows = TripBudgetRollup.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup row(s)."))
+            return
+
+        expected = TripBudgetRollup.objects.expected()
+        stored = TripBudgetRollup.objects.stored()
+        drifted = {}
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                drifted.setdefault(key[0], []).append((key, stored.get(key), expected.get(key)))
+        for stop_id, diffs in sorted(drifted.items()):
+            for (_, category, currency), have, want in diffs:
+                self.stdout.write(f"stop {stop_id} {category}/{currency}: stored {have} expected {want}")
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Budget rollups match activities."))
+            return
+        if options["rebuild"]:
+            rows = TripBudgetRollup.objects.rebuild(set(drifted))
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drifted)} stop(s), {rows} rollup row(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} stop(s) drifted; run with --rebuild to repair."))
@@ -0,0 +1,55 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from trips.budget import normalize_currency
+from trips.models import FxRate
+
+DEFAULT_PATH = Path(__file__).resolve().parents[2] / "data" / "fx_rates.json"
+
+
+def read_rates(path: Path):
+    """``(as_of, {currency: rate}, base)`` from a JSON file (``{"base", "as_of", "rates"}``) or a ``currency,rate`` CSV."""
+    if path.suffix.lower() == ".csv":
+        with path.open(newline="") as fh:
+            rows = [r for r in csv.reader(fh) if r and not r[0].startswith("#")]
+        if rows and rows[0][0].strip().lower() == "currency":
+            rows = rows[1:]
+        return None, {r[0]: r[1] for r in rows}, None
+    data = json.loads(path.read_text())
+    as_of = date.fromisoformat(data["as_of"]) if data.get("as_of") else None
+    return as_of, data["rates"], data.get("base")
+
+
+class Command(BaseCommand):
+    help = "Replace the FX rate table from a local JSON or CSV file (rates share one base currency)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=str(DEFAULT_PATH), help="Rates file (default: trips/data/fx_rates.json)")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        try:
+            as_of, raw, base = read_rates(path)
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        rates = {}
+        for code, value in raw.items():
+            try:
+                rate = Decimal(str(value))
+            except InvalidOperation:
+                raise CommandError(f"Invalid rate for {code}: {value!r}")
+            if rate <= 0:
+                raise CommandError(f"Rate for {code} must be positive")
+            rates[normalize_currency(code)] = rate
+        if base:
+            rates.setdefault(normalize_currency(base), Decimal(1))
+        with transaction.atomic():
+            FxRate.objects.all().delete()
+            FxRate.objects.bulk_create([FxRate(currency=c, rate=r, as_of=as_of) for c, r in sorted(rates.items())])
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rates)} FX rate(s) from {path}."))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.snapshots import mark_all_public_stale, render_stale, storage
+
+
+class Command(BaseCommand):
+    help = "Render stale public itinerary snapshots to storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-render every public trip (e.g. after a serializer change)")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for stale snapshots instead of exiting")
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds to sleep when nothing is stale")
+        parser.add_argument("--batch-size", type=int, default=100, help="Snapshots rendered per pass")
+
+    def handle(self, *args, **options):
+        try:
+            storage()
+        except ImproperlyConfigured as ex:
+            raise CommandError(str(ex))
+        if options["all"]:
+            queued = mark_all_public_stale()
+            self.stdout.write(f"Queued {queued} snapshot(s) for re-rendering")
+        processed = 0
+        # Rows that failed are skipped until the next sleep (without --loop: for the rest of the run)
+        failed = set()
+        while True:
+            n = render_stale(limit=options["batch_size"], failed=failed)
+            processed += n
+            if n == options["batch_size"]:
+                continue
+            if not options["loop"]:
+                break
+            failed.clear()
+            time.sleep(options["poll_interval"])
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{len(failed)} snapshot(s) failed and stay stale"))
+        self.stdout.write(self.style.SUCCESS(f"Rendered {processed - len(failed)} snapshot(s)."))
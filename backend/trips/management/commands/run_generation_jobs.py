@@ -0,0 +1,36 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from trips.jobs import claim_next_job, fail_abandoned_jobs, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "Worker: run queued itinerary generation jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--stale-minutes", type=int, default=10, help="Requeue (or, for inline jobs, fail) running jobs with no progress for this long")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options["stale_minutes"])
+        processed = 0
+        while True:
+            requeued = requeue_stale_jobs(stale_after)
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)"))
+            abandoned = fail_abandoned_jobs(stale_after)
+            if abandoned:
+                self.stdout.write(self.style.WARNING(f"Failed {abandoned} abandoned inline job(s)"))
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+            job = run_job(job)
+            processed += 1
+            self.stdout.write(f"Job {job.pk} (trip {job.trip_id}): {job.status}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
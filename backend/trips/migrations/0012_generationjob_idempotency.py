@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0011_circuitbreakerstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name='generationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('trip',), name='one_active_generation_per_trip'),
+        ),
+        migrations.AddConstraint(
+            model_name='generationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key', ''), _negated=True), fields=('trip', 'idempotency_key'), name='unique_generation_idempotency_key'),
+        ),
+    ]
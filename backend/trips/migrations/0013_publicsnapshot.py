@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0012_generationjob_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=255)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('stale', models.BooleanField(db_index=True, default=True)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='trips.trip')),
+            ],
+        ),
+    ]
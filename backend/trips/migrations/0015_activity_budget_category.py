@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+from trips.categories import normalize_category
+
+
+def backfill_budget_category(apps, schema_editor):
+    # One UPDATE per distinct category string rather than per row
+    Activity = apps.get_model('trips', 'Activity')
+    for category in Activity.objects.values_list('category', flat=True).distinct().order_by():
+        bucket = normalize_category(category)
+        if bucket != 'other':
+            Activity.objects.filter(category=category).update(budget_category=bucket)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0014_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='budget_category',
+            field=models.CharField(choices=[('activities', 'Activities'), ('meals', 'Meals'), ('transport', 'Transport'), ('stay', 'Stay'), ('other', 'Other')], default='other', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_budget_category, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-18 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def build_rollups(apps, schema_editor):
+    Activity = apps.get_model('trips', 'Activity')
+    TripBudgetRollup = apps.get_model('trips', 'TripBudgetRollup')
+    rows = (
+        Activity.objects.values('trip_stop_id', 'trip_stop__trip_id', 'budget_category', 'currency')
+        .annotate(amount=Sum('cost_amount'), count=Count('id'), first=Min('id'))
+        .order_by()
+    )
+    TripBudgetRollup.objects.bulk_create([
+        TripBudgetRollup(
+            trip_id=r['trip_stop__trip_id'], stop_id=r['trip_stop_id'], budget_category=r['budget_category'],
+            currency=r['currency'], amount=r['amount'], count=r['count'], first_activity_id=r['first'],
+        )
+        for r in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0015_activity_budget_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripBudgetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('budget_category', models.CharField(choices=[('activities', 'Activities'), ('meals', 'Meals'), ('transport', 'Transport'), ('stay', 'Stay'), ('other', 'Other')], max_length=20)),
+                ('currency', models.CharField(max_length=10)),
+                ('amount', models.BigIntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('first_activity_id', models.BigIntegerField(null=True)),
+                ('stop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_rollups', to='trips.tripstop')),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_rollups', to='trips.trip')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stop', 'budget_category', 'currency'), name='unique_budget_rollup')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
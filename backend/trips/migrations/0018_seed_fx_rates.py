@@ -0,0 +1,33 @@
+import json
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+from django.db import migrations
+
+RATES_FILE = Path(__file__).resolve().parents[1] / 'data' / 'fx_rates.json'
+
+
+def seed_fx_rates(apps, schema_editor):
+    # Bundled rates so budgets convert on a fresh deploy; rates already
+    # loaded with `manage.py load_fx_rates` are left alone
+    FxRate = apps.get_model('trips', 'FxRate')
+    if FxRate.objects.exists():
+        return
+    data = json.loads(RATES_FILE.read_text())
+    as_of = date.fromisoformat(data['as_of']) if data.get('as_of') else None
+    FxRate.objects.bulk_create([
+        FxRate(currency=code.strip().upper(), rate=Decimal(str(rate)), as_of=as_of)
+        for code, rate in sorted(data['rates'].items())
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0017_fxrate'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_fx_rates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 03:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0018_seed_fx_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='inline',
+            field=models.BooleanField(default=False),
+        ),
+    ]
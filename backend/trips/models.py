@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Min, Sum, Value
+from django.db.models.functions import Least
 from django.conf import settings
 from django.utils.text import slugify
 from decimal import Decimal
 
+from .categories import BUDGET_CATEGORIES, normalize_category
+
 
 class City(models.Model):
     name = models.CharField(max_length=100)
@@ -28,6 +32,12 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Delta sync: a user's trips changed since a cursor
+            models.Index(fields=['user', 'updated_at']),
+        ]
+
     def save(self, *args, **kwargs):
         # Ensure slug only generated when sharing, and uniqueness by suffixing
         generating = self.is_public and not self.public_slug
@@ -51,23 +61,249 @@ class TripStop(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     order = models.PositiveIntegerField(default=0)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['order', 'start_date']
 
 
+# Activity fields that decide its TripBudgetRollup row and contribution
+BUDGET_KEY_FIELDS = ('trip_stop_id', 'budget_category', 'currency', 'cost_amount')
+
+
+class ActivityQuerySet(models.QuerySet):
+    """Keeps ``budget_category`` and the budget rollups in step on bulk writes."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.budget_category = normalize_category(obj.category)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            TripBudgetRollup.objects.rebuild({obj.trip_stop_id for obj in objs})
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'category' in fields:
+            for obj in objs:
+                obj.budget_category = normalize_category(obj.category)
+            fields = [*fields, 'budget_category']
+        with transaction.atomic(using=self.db):
+            stop_ids = self._stop_ids_of(obj.pk for obj in objs) | {obj.trip_stop_id for obj in objs}
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            TripBudgetRollup.objects.rebuild(stop_ids)
+        return updated
+
+    def update(self, **kwargs):
+        if isinstance(kwargs.get('category'), str):
+            kwargs['budget_category'] = normalize_category(kwargs['category'])
+        if not {'trip_stop', 'trip_stop_id', 'category', 'budget_category', 'currency', 'cost_amount'} & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            stop_ids = set(self.order_by().values_list('trip_stop_id', flat=True).distinct())
+            updated = super().update(**kwargs)
+            new_stop = kwargs.get('trip_stop_id', kwargs.get('trip_stop'))
+            if new_stop is not None:
+                stop_ids.add(getattr(new_stop, 'pk', new_stop))
+            TripBudgetRollup.objects.rebuild(stop_ids)
+        return updated
+
+    def _stop_ids_of(self, pks):
+        return set(Activity.objects.filter(pk__in=[pk for pk in pks if pk is not None]).values_list('trip_stop_id', flat=True))
+
+
 class Activity(models.Model):
+    BUDGET_CATEGORY_CHOICES = [(c, c.title()) for c in BUDGET_CATEGORIES]
+
     trip_stop = models.ForeignKey(TripStop, on_delete=models.CASCADE, related_name='activities')
     title = models.CharField(max_length=200)
     category = models.CharField(max_length=50, blank=True)
+    # Derived from category on save (see trips.categories)
+    budget_category = models.CharField(max_length=20, choices=BUDGET_CATEGORY_CHOICES, default='other', editable=False)
     start_time = models.TimeField(null=True, blank=True)
     end_time = models.TimeField(null=True, blank=True)
     cost_amount = models.IntegerField(default=0)
     currency = models.CharField(max_length=10, default='INR')
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ActivityQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rollup key so save() can move the amount without re-reading the row
+        if all(f in field_names for f in BUDGET_KEY_FIELDS):
+            instance._stored_budget_key = instance.budget_key()
+        return instance
+
+    def budget_key(self):
+        return tuple(getattr(self, f) for f in BUDGET_KEY_FIELDS)
+
+    def save(self, *args, **kwargs):
+        self.budget_category = normalize_category(self.category)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'category' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'budget_category'}
+        previous = None
+        if not self._state.adding:
+            previous = getattr(self, '_stored_budget_key', None)
+            if previous is None:
+                previous = Activity.objects.filter(pk=self.pk).values_list(*BUDGET_KEY_FIELDS).first()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            TripBudgetRollup.objects.move(self.pk, previous, self.budget_key())
+        self._stored_budget_key = self.budget_key()
+
+
+class TripBudgetRollupQuerySet(models.QuerySet):
+    def move(self, activity_id, old, new) -> None:
+        """Shift one activity's contribution between rollup rows (``old``/``new`` are ``BUDGET_KEY_FIELDS`` tuples)."""
+        if old == new:
+            return
+        if old is not None:
+            self.remove(activity_id, *old)
+        if new is not None:
+            self.add(activity_id, *new)
+
+    def add(self, activity_id, stop_id, budget_category, currency, amount) -> None:
+        rows = self.filter(stop_id=stop_id, budget_category=budget_category, currency=currency)
+        changes = dict(
+            amount=F('amount') + amount, count=F('count') + 1,
+            first_activity_id=Least('first_activity_id', Value(activity_id)),
+        )
+        if rows.update(**changes):
+            return
+        trip_id = TripStop.objects.filter(pk=stop_id).values_list('trip_id', flat=True).first()
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(
+                    trip_id=trip_id, stop_id=stop_id, budget_category=budget_category, currency=currency,
+                    amount=amount, count=1, first_activity_id=activity_id,
+                )
+        except IntegrityError:
+            # Inserted concurrently by another writer
+            rows.update(**changes)
+
+    def remove(self, activity_id, stop_id, budget_category, currency, amount) -> None:
+        rows = self.filter(stop_id=stop_id, budget_category=budget_category, currency=currency)
+        rows.update(amount=F('amount') - amount, count=F('count') - 1)
+        rows.filter(count__lte=0).delete()
+        rest = Activity.objects.filter(trip_stop_id=stop_id, budget_category=budget_category, currency=currency)
+        rows.filter(first_activity_id=activity_id).update(
+            first_activity_id=models.Subquery(rest.order_by('id').values('id')[:1])
+        )
+
+    def expected(self, stop_ids=None) -> dict:
+        """Rollup rows recomputed from activities: ``{(stop, category, currency): (trip, amount, count, first)}``."""
+        activities = Activity.objects.all() if stop_ids is None else Activity.objects.filter(trip_stop_id__in=stop_ids)
+        rows = (
+            activities.values('trip_stop_id', 'trip_stop__trip_id', 'budget_category', 'currency')
+            .annotate(amount=Sum('cost_amount'), count=Count('id'), first=Min('id'))
+            .order_by()
+        )
+        return {
+            (r['trip_stop_id'], r['budget_category'], r['currency']): (r['trip_stop__trip_id'], r['amount'], r['count'], r['first'])
+            for r in rows
+        }
+
+    def stored(self, stop_ids=None) -> dict:
+        """Current rollup rows, keyed like ``expected``."""
+        qs = self if stop_ids is None else self.filter(stop_id__in=stop_ids)
+        return {
+            (r[0], r[1], r[2]): r[3:]
+            for r in qs.values_list('stop_id', 'budget_category', 'currency', 'trip_id', 'amount', 'count', 'first_activity_id')
+        }
+
+    def rebuild(self, stop_ids=None) -> int:
+        """Recompute the rollups of ``stop_ids`` (all stops when None) from their activities."""
+        if stop_ids is not None and not stop_ids:
+            return 0
+        with transaction.atomic(using=self.db):
+            (self if stop_ids is None else self.filter(stop_id__in=stop_ids)).delete()
+            rows = [
+                TripBudgetRollup(
+                    trip_id=trip_id, stop_id=stop_id, budget_category=category, currency=currency,
+                    amount=amount, count=count, first_activity_id=first,
+                )
+                for (stop_id, category, currency), (trip_id, amount, count, first) in self.expected(stop_ids).items()
+            ]
+            self.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+
+class TripBudgetRollup(models.Model):
+    """Activity cost totals per trip stop, budget category and currency.
+
+    Maintained on every activity write (``Activity.save``, the bulk paths of
+    ``ActivityQuerySet`` and a post_delete receiver), so budget endpoints read
+    a handful of rows instead of aggregating activities. ``manage.py
+    budget_rollups`` verifies and repairs them.
+    """
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='budget_rollups')
+    stop = models.ForeignKey(TripStop, on_delete=models.CASCADE, related_name='budget_rollups')
+    budget_category = models.CharField(max_length=20, choices=Activity.BUDGET_CATEGORY_CHOICES)
+    currency = models.CharField(max_length=10)
+    amount = models.BigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+    # Lowest activity id in the row: the trip currency is that of its first activity
+    first_activity_id = models.BigIntegerField(null=True)
+
+    objects = TripBudgetRollupQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stop', 'budget_category', 'currency'], name='unique_budget_rollup'),
+        ]
+
+    def __str__(self) -> str:
+        return f"BudgetRollup[stop={self.stop_id}] {self.budget_category} {self.amount} {self.currency}"
+
+
+class FxRate(models.Model):
+    """Exchange rate: units of ``currency`` per one unit of the loaded file's base currency.
+
+    Loaded from a local file by ``manage.py load_fx_rates``; every row shares
+    the same base, so any pair converts as ``rate[target] / rate[source]``.
+    """
+    currency = models.CharField(max_length=10, unique=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=8)
+    as_of = models.DateField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def __str__(self) -> str:
+        return f"{self.currency} {self.rate}"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted trip, stop or activity for ``/api/sync`` clients.
+
+    Only the root of a deletion is recorded: deleting a trip leaves one trip
+    tombstone (clients drop its stops and activities with it), not one per row.
+    """
+    KIND_TRIP = 'trip'
+    KIND_STOP = 'stop'
+    KIND_ACTIVITY = 'activity'
+    KIND_CHOICES = [
+        (KIND_TRIP, 'Trip'),
+        (KIND_STOP, 'Stop'),
+        (KIND_ACTIVITY, 'Activity'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Tombstone[{self.kind}:{self.object_id}] user={self.user_id}"
+
 
 class ActivityCatalog(models.Model):
     title = models.CharField(max_length=200)
@@ -122,3 +358,124 @@ class PersonalizedRec(models.Model):
 
     def __str__(self) -> str:
         return f"Rec[{self.user_id}] {self.signature[:8]}... at {self.created_at}"
+
+
+class GenerationJob(models.Model):
+    """DB-backed queue entry for asynchronous itinerary generation.
+
+    Created by ``POST /trips/{id}/generate`` in job mode and executed by the
+    ``run_generation_jobs`` management command.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='generation_jobs')
+    idempotency_key = models.CharField(max_length=255, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='generation_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=50, default=STATUS_QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    params = models.JSONField(default=dict)
+    source = models.CharField(max_length=50, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Run by the submitting web request rather than claimed by the worker
+    inline = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+        constraints = [
+            # Single-flight: at most one queued/running generation per trip
+            models.UniqueConstraint(
+                fields=['trip'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='one_active_generation_per_trip',
+            ),
+            models.UniqueConstraint(
+                fields=['trip', 'idempotency_key'],
+                condition=~models.Q(idempotency_key=''),
+                name='unique_generation_idempotency_key',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"GenerationJob[{self.pk}] trip={self.trip_id} {self.status}"
+
+
+class LLMResponseCache(models.Model):
+    """Parsed LLM payloads keyed by a normalized hash of model, prompt and parameters.
+
+    Entries expire after a TTL and the table is bounded by evicting the least
+    recently used rows (see ``trips.llm_cache``).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    payload = models.JSONField()
+    latency_ms = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"LLMCache[{self.key[:8]}...] {self.model} hits={self.hits}"
+
+
+class CircuitBreakerState(models.Model):
+    """Shared state of a circuit breaker (see ``trips.circuit_breaker``).
+
+    Kept in the database so every worker process sees the same state;
+    transitions are conditional UPDATEs.
+    """
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+    STATE_CHOICES = [
+        (STATE_CLOSED, 'Closed'),
+        (STATE_OPEN, 'Open'),
+        (STATE_HALF_OPEN, 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=50, unique=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_CLOSED)
+    failures = models.PositiveIntegerField(default=0)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    probe_started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.state} ({self.failures} failures)"
+
+
+class PublicSnapshot(models.Model):
+    """Pre-rendered JSON of a shared trip, written to storage (see ``trips.snapshots``).
+
+    ``stale`` is set whenever the trip tree changes and cleared by the
+    ``render_snapshots`` worker when it writes the next ``version``.
+    """
+    trip = models.OneToOneField(Trip, on_delete=models.CASCADE, related_name='snapshot')
+    slug = models.SlugField(max_length=255)
+    version = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True)
+    stale = models.BooleanField(default=True, db_index=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"PublicSnapshot[{self.slug}] v{self.version}{' (stale)' if self.stale else ''}"
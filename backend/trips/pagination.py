@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TripCursorPagination(CursorPagination):
+    """Newest trips first; cursors stay stable while trips are added or removed."""
+    ordering = "-id"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -0,0 +1,152 @@
+"""Response cache for shared (public) itineraries.
+
+Entries are keyed by a fixed-length hash of the slug plus response shape
+(see ``entry_key_for``), so arbitrary request text never reaches the cache
+backend's key limits (250 characters on memcached, 255 on the db cache),
+and stamped with a per-trip version counter. Any
+save/delete of the trip, its stops or activities bumps the version (see
+``signals``); bulk paths that bypass signals call ``invalidate_trip``
+explicitly. A stale entry is simply never served again and expires after
+``PUBLIC_ITINERARY_CACHE_SECONDS``.
+
+On a miss only one request per slug rebuilds the entry (a short ``cache.add``
+lock); concurrent misses wait briefly for it instead of all hitting the
+database at once.
+
+Versions and locks only work when every process shares the cache; with
+``PUBLIC_ITINERARY_CACHE_ENABLED`` off (production without
+``DJANGO_CACHE_URL``) every request renders the itinerary.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from gt_backend import metrics
+
+from .commit_hooks import on_commit_once
+
+ENTRY_KEY = "public-itinerary:{slug}"
+VERSION_KEY = "public-itinerary:v:{trip_id}"
+LOCK_KEY = "public-itinerary:lock:{slug}"
+LOCK_SECONDS = 10
+WAIT_SECONDS = 2.0
+WAIT_INTERVAL = 0.05
+
+
+def _digest(slug: str) -> str:
+    return hashlib.sha256(slug.encode()).hexdigest()
+
+
+def entry_key_for(slug: str) -> str:
+    return ENTRY_KEY.format(slug=_digest(slug))
+
+
+def lock_key_for(slug: str) -> str:
+    return LOCK_KEY.format(slug=_digest(slug))
+
+
+def _version(trip_id: int) -> int:
+    return cache.get(VERSION_KEY.format(trip_id=trip_id), 0)
+
+
+def _bump(trip_id: int) -> None:
+    key = VERSION_KEY.format(trip_id=trip_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    metrics.incr("public_cache.invalidations")
+
+
+def invalidate_trip(trip_id: Optional[int]) -> None:
+    """Mark every cached public itinerary of ``trip_id`` stale.
+
+    Deferred until the surrounding transaction commits, so a concurrent
+    rebuild cannot re-cache the pre-commit rows under the new version; one
+    bump per trip and transaction however many rows changed.
+    """
+    if trip_id is not None:
+        on_commit_once(("public_cache", trip_id), _bump, trip_id)
+
+
+def _fresh(entry) -> Optional[dict]:
+    if entry and entry["version"] == _version(entry["trip_id"]):
+        return entry
+    return None
+
+
+def get_or_build(
+    slug: str,
+    resolve: Callable[[], Optional[int]],
+    render: Callable[[int], dict],
+) -> Optional[dict]:
+    """Cached entry for ``slug``, rebuilding it on a miss.
+
+    ``resolve()`` returns the public trip id for the slug (None: not found,
+    nothing is cached); ``render(trip_id)`` returns the picklable payload
+    (response data, validators...). Returns that payload plus ``trip_id``,
+    ``version`` and ``build_ms``.
+    """
+    entry_key = entry_key_for(slug)
+    if not settings.PUBLIC_ITINERARY_CACHE_ENABLED:
+        return _build(entry_key, resolve, render, store=False)
+    entry = _fresh(cache.get(entry_key))
+    if entry is not None:
+        metrics.incr("public_cache.hits")
+        metrics.incr("public_cache.saved_ms", entry["build_ms"])
+        return entry
+
+    lock_key = lock_key_for(slug)
+    have_lock = cache.add(lock_key, 1, LOCK_SECONDS)
+    if not have_lock:
+        # Someone else is rebuilding this slug; wait for their entry
+        deadline = time.monotonic() + WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = _fresh(cache.get(entry_key))
+            if entry is not None:
+                metrics.incr("public_cache.waited_hits")
+                return entry
+    metrics.incr("public_cache.misses")
+    try:
+        return _build(entry_key, resolve, render)
+    finally:
+        if have_lock:
+            cache.delete(lock_key)
+
+
+def _build(entry_key: str, resolve: Callable[[], Optional[int]], render: Callable[[int], dict], store: bool = True) -> Optional[dict]:
+    t0 = time.perf_counter()
+    trip_id = resolve()
+    if trip_id is None:
+        return None
+    # Stamp with the version seen *before* reading the rows: a change made
+    # while rendering bumps the version past it, so the entry is never served.
+    version = _version(trip_id) if store else 0
+    payload = render(trip_id)
+    build_ms = (time.perf_counter() - t0) * 1000
+    metrics.observe("public_cache.build_ms", build_ms)
+    entry = {**payload, "trip_id": trip_id, "version": version, "build_ms": build_ms}
+    if store:
+        cache.set(entry_key, entry, settings.PUBLIC_ITINERARY_CACHE_SECONDS)
+    return entry
+
+
+def stats() -> dict:
+    """This process's hit ratio and serialization time saved."""
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("public_cache.hits", 0) + counters.get("public_cache.waited_hits", 0)
+    misses = counters.get("public_cache.misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_ms": counters.get("public_cache.saved_ms", 0.0),
+        "invalidations": counters.get("public_cache.invalidations", 0),
+        "enabled": settings.PUBLIC_ITINERARY_CACHE_ENABLED,
+        "ttl_seconds": settings.PUBLIC_ITINERARY_CACHE_SECONDS,
+    }
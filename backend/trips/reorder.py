@@ -0,0 +1,81 @@
+"""Stop ordering for ``POST /trips/{id}/stops/reorder``.
+
+Both operations run in one transaction holding a row lock on the trip, so
+concurrent reorders of the same trip are applied one after the other:
+
+* ``apply_order`` renumbers every stop from a submitted id list with one
+  ``bulk_update`` of the rows whose position changed; ``gap`` > 1 spaces
+  the positions out (1024, 2048, ...) for later moves.
+* ``move_stop`` places one stop between two neighbours by giving it an
+  order value in the gap between theirs, touching a single row. When the
+  neighbours are adjacent integers the trip is renumbered with gaps first.
+"""
+from __future__ import annotations
+
+from typing import List, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Trip, TripStop
+
+ORDER_GAP = 1024
+
+
+class ReorderError(ValueError):
+    pass
+
+
+def _lock(trip) -> List[TripStop]:
+    Trip.objects.select_for_update().filter(pk=trip.pk).values_list('pk', flat=True).get()
+    return list(TripStop.objects.filter(trip=trip).only('id', 'order').order_by('order', 'start_date', 'id'))
+
+
+def _renumber(stops: List[TripStop], gap: int) -> int:
+    now = timezone.now()
+    changed = []
+    for position, stop in enumerate(stops, start=1):
+        if stop.order != position * gap:
+            stop.order = position * gap
+            stop.updated_at = now
+            changed.append(stop)
+    TripStop.objects.bulk_update(changed, ['order', 'updated_at'])
+    return len(changed)
+
+
+@transaction.atomic
+def apply_order(trip, ids, gap: int = 1) -> int:
+    """Order stops as listed in ``ids``; unlisted stops follow in their current order. Returns rows updated."""
+    stops = _lock(trip)
+    by_id = {s.id: s for s in stops}
+    listed = list(dict.fromkeys(i for i in ids if i in by_id))
+    ordered = [by_id[i] for i in listed] + [s for s in stops if s.id not in set(listed)]
+    return _renumber(ordered, gap)
+
+
+@transaction.atomic
+def move_stop(trip, stop_id, after: Optional[int] = None, before: Optional[int] = None) -> int:
+    """Move ``stop_id`` right after ``after`` (None: to the front) or right before ``before``. Returns rows updated."""
+    stops = _lock(trip)
+    moving = next((s for s in stops if s.id == stop_id), None)
+    if moving is None:
+        raise ReorderError("unknown stop")
+    rest = [s for s in stops if s is not moving]
+    anchor = before if before is not None else after
+    if anchor is not None:
+        index = next((i for i, s in enumerate(rest) if s.id == anchor), None)
+        if index is None or anchor == stop_id:
+            raise ReorderError("unknown anchor stop")
+        slot = index if before is not None else index + 1
+    else:
+        slot = 0
+    low = rest[slot - 1].order if slot > 0 else 0
+    high = rest[slot].order if slot < len(rest) else low + 2 * ORDER_GAP
+    if low < moving.order < high:
+        return 0
+    if high - low <= 1:
+        # No integer between the neighbours: space everything out, placing the stop in its slot
+        return _renumber(rest[:slot] + [moving] + rest[slot:], ORDER_GAP)
+    moving.order = (low + high) // 2
+    TripStop.objects.filter(pk=moving.pk).update(order=moving.order, updated_at=timezone.now())
+    return 1
@@ -0,0 +1,200 @@
+"""Demo itinerary served by ``/api/public/itineraries/sample`` (homepage preview).
+
+The itinerary is synthesized from query parameters; only the city details
+come from the database, in one batched query. Those city payloads are
+memoized per process in a bounded LRU keyed on the lowercased name, so
+repeat homepage traffic never reaches the database while each memo entry
+stays a small fixed-size dict however long the requested itinerary is.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+from .models import City
+
+SAMPLE_ACTIVITIES = [
+    ("Walking Tour", "sightseeing", 2000),
+    ("Museum Pass", "culture", 2500),
+    ("Food Crawl", "food", 3500),
+]
+TRANSPORT_PER_LEG = 5000
+MAX_DESTINATIONS = 20
+MAX_DAYS_PER_CITY = 30
+BEST_TIME = "Shoulder seasons for fewer crowds and mild weather"
+TIPS = [
+    "Adjust days per city based on interests",
+    "Book intercity transport in advance",
+    "Keep buffer time for popular attractions",
+]
+
+
+class SampleParams(NamedTuple):
+    slug: str
+    origin: str
+    destinations: tuple
+    start: date
+    days_per_city: int
+    currency: str
+
+
+def _clean(name: str) -> str:
+    return " ".join((name or "").split())
+
+
+def parse_params(slug: str, query_params) -> SampleParams:
+    """Normalize the query string.
+
+    Raises ValueError for malformed dates/numbers, more than
+    ``MAX_DESTINATIONS`` destinations or ``daysPerCity`` outside
+    ``1..MAX_DAYS_PER_CITY``.
+    """
+    origin = _clean(query_params.get("origin") or query_params.get("from") or "London")
+    dest_param = query_params.get("dest") or query_params.get("to") or "Paris"
+    destinations = tuple(d for d in (_clean(p) for p in dest_param.split(",")) if d) or ("Paris",)
+    if len(destinations) > MAX_DESTINATIONS:
+        raise ValueError(f"at most {MAX_DESTINATIONS} destinations")
+    days_per_city = int(query_params.get("daysPerCity") or 2)
+    if not 1 <= days_per_city <= MAX_DAYS_PER_CITY:
+        raise ValueError(f"daysPerCity must be between 1 and {MAX_DAYS_PER_CITY}")
+    start = datetime.fromisoformat(query_params.get("start") or "2025-09-05").date()
+    try:
+        start + timedelta(days=days_per_city * len(destinations))
+    except OverflowError:
+        raise ValueError("start is out of range")
+    return SampleParams(
+        slug=slug,
+        origin=origin,
+        destinations=destinations,
+        start=start,
+        days_per_city=days_per_city,
+        currency=(query_params.get("currency") or "USD").strip(),
+    )
+
+
+def city_dicts(names) -> Dict[str, dict]:
+    """City payloads for ``names`` (case-insensitive) in one query; unknown names get a stub."""
+    wanted = {n.lower(): n for n in names}
+    found: Dict[str, dict] = {}
+    if wanted:
+        for c in City.objects.annotate(name_lower=Lower("name")).filter(name_lower__in=list(wanted)).order_by("id"):
+            found.setdefault(c.name.lower(), {
+                "id": c.id,
+                "name": c.name,
+                "country": c.country,
+                "region": c.region,
+                "cost_index": c.cost_index,
+                "popularity": c.popularity,
+            })
+    return {
+        key: found.get(key) or {"id": 0, "name": name, "country": "", "region": ""}
+        for key, name in wanted.items()
+    }
+
+
+def build_sample(params: SampleParams, cities: Dict[str, dict]) -> dict:
+    """Sample payload for ``params``; ``cities`` maps lowercased names to city payloads."""
+    cur = params.start
+    stops: List[dict] = []
+    act_total = food_total = transport_total = other_total = 0
+    for order, name in enumerate(params.destinations, start=1):
+        end = cur + timedelta(days=params.days_per_city)
+        acts = []
+        for idx, (title, cat, cost) in enumerate(SAMPLE_ACTIVITIES, start=1):
+            acts.append({
+                "id": order * 10 + idx,
+                "trip_stop": order,
+                "title": title,
+                "category": cat,
+                "start_time": None,
+                "end_time": None,
+                "cost_amount": cost,
+                "currency": params.currency,
+                "notes": "",
+            })
+            if cat == "food":
+                food_total += cost
+            else:
+                act_total += cost
+        stops.append({
+            "id": order,
+            "trip": 0,
+            "city": cities[name.lower()],
+            "start_date": cur.isoformat(),
+            "end_date": end.isoformat(),
+            "order": order,
+            "activities": acts,
+        })
+        # rough transport per leg
+        transport_total += TRANSPORT_PER_LEG
+        cur = end
+
+    total_days = params.days_per_city * len(params.destinations)
+    return {
+        "id": 0,
+        "name": f"{params.origin} → {' → '.join(params.destinations)}",
+        "start_date": params.start.isoformat(),
+        "end_date": (params.start + timedelta(days=total_days)).isoformat(),
+        "origin_city": cities[params.origin.lower()],
+        "description": "Auto‑generated sample itinerary",
+        "cover_image": "",
+        "is_public": True,
+        "public_slug": params.slug,
+        "best_time_to_visit": BEST_TIME,
+        "tips": list(TIPS),
+        "budget_breakdown_minor": {
+            "activities": act_total,
+            "food": food_total,
+            "transport": transport_total,
+            "stay": 0,
+            "other": other_total,
+        },
+        "stops": stops,
+    }
+
+
+_lock = threading.Lock()
+_memo: "OrderedDict[str, tuple]" = OrderedDict()
+# Longer names cannot match a City row; they are stubbed without being memoized
+MAX_NAME_LENGTH = City._meta.get_field("name").max_length
+
+
+def memoized_city_dicts(names) -> Dict[str, dict]:
+    """``city_dicts`` through the per-process memo; only misses reach the database."""
+    now = time.monotonic()
+    found: Dict[str, dict] = {}
+    with _lock:
+        for name in names:
+            key = name.lower()
+            hit: Optional[tuple] = _memo.get(key)
+            if hit is not None and now - hit[0] < settings.SAMPLE_ITINERARY_CACHE_SECONDS:
+                _memo.move_to_end(key)
+                found[key] = hit[1]
+    missing = [n for n in names if n.lower() not in found]
+    if not missing:
+        return found
+    fetched = city_dicts(missing)
+    with _lock:
+        for key, city in fetched.items():
+            if len(key) <= MAX_NAME_LENGTH:
+                _memo[key] = (now, city)
+                _memo.move_to_end(key)
+        while len(_memo) > settings.SAMPLE_ITINERARY_CACHE_SIZE:
+            _memo.popitem(last=False)
+    return {**found, **fetched}
+
+
+def get_sample(params: SampleParams) -> dict:
+    """``build_sample`` with memoized city lookups. The city dicts are shared: do not mutate them."""
+    return build_sample(params, memoized_city_dicts([params.origin, *params.destinations]))
+
+
+def clear() -> None:
+    with _lock:
+        _memo.clear()
@@ -0,0 +1,125 @@
+"""Day-by-day trip calendar (``GET /trips/{id}/calendar``).
+
+Stops are flattened into a sorted list of disjoint ``[start, end)``
+segments, resolving overlaps in favour of the earlier stop by
+``(order, start_date)``, so the stop covering a day is one ``bisect`` away.
+A stop's activities (ordered by id) are spread evenly over its days.
+Only stops overlapping the requested window are loaded.
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from django.db.models import Prefetch
+
+from .models import Activity
+
+
+class StopIndex:
+    def __init__(self, stops):
+        """``stops`` in priority order; earlier stops win where date ranges overlap."""
+        self.starts: List[date] = []
+        self.segments: List[tuple] = []
+        for stop in stops:
+            self._cover(stop)
+
+    def _cover(self, stop) -> None:
+        # Insert the parts of [start, end) no earlier stop already covers
+        cursor, end = stop.start_date, stop.end_date
+        i = bisect_right(self.starts, cursor) - 1
+        if i >= 0 and self.segments[i][1] > cursor:
+            cursor = self.segments[i][1]
+        i += 1
+        while cursor < end:
+            next_start = self.starts[i] if i < len(self.starts) else end
+            if cursor < next_start:
+                piece_end = min(next_start, end)
+                self.segments.insert(i, (cursor, piece_end, stop))
+                self.starts.insert(i, cursor)
+                i += 1
+                cursor = piece_end
+            else:
+                cursor = max(cursor, self.segments[i][1])
+                i += 1
+
+    def stop_at(self, day: date):
+        i = bisect_right(self.starts, day) - 1
+        if i >= 0 and day < self.segments[i][1]:
+            return self.segments[i][2]
+        return None
+
+
+def stop_span(stop) -> int:
+    return max((stop.end_date - stop.start_date).days, 1)
+
+
+def bucket_offset(idx: int, total: int, span: int) -> int:
+    """Day offset within its stop of the ``idx``-th of ``total`` activities (id order)."""
+    return min((idx * span) // total, span - 1)
+
+
+def trip_days(trip) -> int:
+    return max((trip.end_date - trip.start_date).days, 1)
+
+
+def _buckets(stop) -> List[list]:
+    """Activities split evenly (in id order) over the stop's days."""
+    span = stop_span(stop)
+    acts = list(stop.activities.all())
+    buckets: List[list] = [[] for _ in range(span)]
+    for idx, a in enumerate(acts):
+        buckets[bucket_offset(idx, len(acts), span)].append({
+            'id': a.id,
+            'title': a.title,
+            'category': a.category,
+            'start_time': a.start_time,
+            'end_time': a.end_time,
+            'cost_amount': a.cost_amount,
+            'currency': a.currency,
+        })
+    return buckets
+
+
+def build_calendar(trip, start: Optional[date] = None, end: Optional[date] = None) -> dict:
+    """Calendar payload, limited to days in ``[start, end]`` when given (two queries)."""
+    total_days = trip_days(trip)
+    first = max(start, trip.start_date) if start else trip.start_date
+    last = trip.start_date + timedelta(days=total_days - 1)
+    if end:
+        last = min(end, last)
+
+    stops = trip.stops.select_related('city').prefetch_related(
+        Prefetch('activities', queryset=Activity.objects.order_by('id'))
+    ).filter(start_date__lte=last, end_date__gt=first).order_by('order', 'start_date')
+    index = StopIndex(stops) if first <= last else StopIndex(())
+
+    buckets: Dict[int, List[list]] = {}
+    timeline = []
+    day = first
+    while day <= last:
+        s = index.stop_at(day)
+        entry = {
+            'date': day.isoformat(),
+            'day_index': (day - trip.start_date).days + 1,
+            'stop_id': s.id if s else None,
+            'stop_order': s.order if s else None,
+            'city': ({'id': s.city.id, 'name': s.city.name, 'country': s.city.country} if s else None),
+            'activities': [],
+        }
+        if s:
+            if s.id not in buckets:
+                buckets[s.id] = _buckets(s)
+            offset = max(0, min((day - s.start_date).days, stop_span(s) - 1))
+            entry['activities'] = buckets[s.id][offset]
+        timeline.append(entry)
+        day += timedelta(days=1)
+
+    return {
+        'trip_id': trip.id,
+        'start_date': trip.start_date.isoformat(),
+        'end_date': trip.end_date.isoformat(),
+        'total_days': total_days,
+        'days': timeline,
+    }
@@ -1,14 +1,128 @@
+from functools import lru_cache
+
+from django.db.models import CharField, Count, IntegerField, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
 from rest_framework import serializers
-from .models import Trip, TripStop, Activity, City
+from .aggregates import GroupConcat
+from .models import Trip, TripStop, Activity, City, GenerationJob
+
+# Separates "<order>:<city name>" items in TripSummarySerializer.city_names
+CITY_NAME_SEPARATOR = "\x1f"
+
+
+def parse_paths(raw):
+    """``"name,stops.city"`` -> ``{"name": {}, "stops": {"city": {}}}``; None if the parameter is absent."""
+    if raw is None:
+        return None
+    tree = {}
+    for path in raw.split(","):
+        node = tree
+        for part in (p.strip() for p in path.split(".")):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+@lru_cache(maxsize=None)
+def _schema(serializer_class):
+    """``{name: (nested schema or None, expandable)}`` for the readable fields of ``serializer_class``."""
+    def walk(serializer):
+        out = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            nested = getattr(field, "child", field)
+            out[name] = (
+                walk(nested) if isinstance(nested, serializers.BaseSerializer) else None,
+                name in getattr(serializer, "expandable_fields", ()),
+            )
+        return out
+    return walk(serializer_class())
+
+
+def _prune(tree, schema, expand=False):
+    # Drop names the serializer does not have (or cannot expand)
+    if tree is None:
+        return None
+    out = {}
+    for name, sub in tree.items():
+        if name not in schema or (expand and not schema[name][1]):
+            continue
+        nested = schema[name][0]
+        out[name] = _prune(sub, nested, expand) if nested is not None else {}
+    return out
+
+
+def request_shape(request, serializer_class=None):
+    """``(fields, expand)`` trees from ``?fields=``/``?expand=`` on GET requests, else ``(None, None)``.
+
+    With ``serializer_class`` names it does not know are dropped, which keeps
+    the shape (and so ``shape_key``) bounded by the serializer's fields.
+    """
+    if request is None or request.method not in ("GET", "HEAD"):
+        return None, None
+    fields, expand = parse_paths(request.query_params.get("fields")), parse_paths(request.query_params.get("expand"))
+    if serializer_class is not None:
+        schema = _schema(serializer_class)
+        fields, expand = _prune(fields, schema), _prune(expand, schema, expand=True)
+    return fields, expand
+
+
+def shape_key(request, serializer_class=None) -> str:
+    """Canonical ``fields``/``expand`` string for cache keys and ETags ('' for the default shape)."""
+    fields, expand = request_shape(request, serializer_class)
+
+    def flat(tree, prefix=""):
+        return sorted(p for name, sub in tree.items() for p in [prefix + name, *flat(sub, f"{prefix}{name}.")])
+
+    parts = [f"{key}={','.join(flat(tree))}" for key, tree in (("fields", fields), ("expand", expand)) if tree is not None]
+    return "&".join(parts)
 
 
-class CitySerializer(serializers.ModelSerializer):
+def _includes(fields, expand, name):
+    return (fields is None or name in fields) and (expand is None or name in expand)
+
+
+def _subtrees(fields, expand, name):
+    # An empty fields subtree means "all fields"; an empty expand subtree means "expand nothing further"
+    return (fields.get(name) or None) if fields is not None else None, expand.get(name, {}) if expand is not None else None
+
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets and relation expansion.
+
+    ``fields`` limits the serialized fields, ``expand`` the nested relations
+    listed in ``expandable_fields`` (both as ``parse_paths`` trees, None =
+    everything, which is the default). Subtrees are passed down to nested
+    serializers, so ``fields=stops.city`` or ``expand=stops.activities`` work
+    at any depth.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.restrict(fields, expand)
+
+    def restrict(self, fields, expand):
+        for name in list(self.fields):
+            if not self.fields[name].write_only and not _includes(
+                fields, expand if name in self.expandable_fields else None, name
+            ):
+                self.fields.pop(name)
+        for name in self.expandable_fields:
+            if name in self.fields:
+                nested = getattr(self.fields[name], "child", self.fields[name])
+                if isinstance(nested, DynamicFieldsMixin):
+                    nested.restrict(*_subtrees(fields, expand, name))
+
+
+class CitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ["id", "name", "country", "region", "cost_index", "popularity"]
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = [
@@ -25,7 +139,7 @@ class ActivitySerializer(serializers.ModelSerializer):
         read_only_fields = ["trip_stop"]
 
 
-class TripStopSerializer(serializers.ModelSerializer):
+class TripStopSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     activities = ActivitySerializer(many=True, read_only=True)
     city = CitySerializer(read_only=True)
     city_id = serializers.PrimaryKeyRelatedField(
@@ -46,8 +160,22 @@ class TripStopSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["trip"]
 
+    expandable_fields = ("city", "activities")
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=None):
+        """Load city and ordered activities up front (constant queries for any number of stops).
+
+        Relations left out by ``fields``/``expand`` are not loaded at all.
+        """
+        if _includes(fields, expand, "city"):
+            queryset = queryset.select_related("city")
+        if _includes(fields, expand, "activities"):
+            queryset = queryset.prefetch_related(Prefetch("activities", queryset=Activity.objects.order_by("id")))
+        return queryset
 
-class TripSerializer(serializers.ModelSerializer):
+
+class TripSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     stops = TripStopSerializer(many=True, read_only=True)
     origin_city = CitySerializer(read_only=True)
     origin_city_id = serializers.PrimaryKeyRelatedField(
@@ -70,4 +198,100 @@ class TripSerializer(serializers.ModelSerializer):
             "stops",
         ]
 
+    expandable_fields = ("origin_city", "stops")
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=None):
+        """Load origin city, ordered stops, their cities and activities in three queries total.
+
+        Relations left out by ``fields``/``expand`` are not loaded at all.
+        """
+        if _includes(fields, expand, "origin_city"):
+            queryset = queryset.select_related("origin_city")
+        if _includes(fields, expand, "stops"):
+            stops = TripStopSerializer.setup_eager_loading(
+                TripStop.objects.order_by("order", "start_date", "id"), *_subtrees(fields, expand, "stops")
+            )
+            queryset = queryset.prefetch_related(Prefetch("stops", queryset=stops))
+        return queryset
+
+
+class TripSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Trip list row: no nested stops, just the counts and totals a list needs."""
+    origin_city = CitySerializer(read_only=True)
+    stop_count = serializers.IntegerField(read_only=True)
+    total_cost = serializers.IntegerField(read_only=True)
+    cities = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Trip
+        fields = [
+            "id",
+            "name",
+            "start_date",
+            "end_date",
+            "origin_city",
+            "is_public",
+            "public_slug",
+            "stop_count",
+            "cities",
+            "total_cost",
+        ]
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Annotate stop count, city names and activity cost total as correlated subqueries (one query)."""
+        stops = TripStop.objects.filter(trip=OuterRef("pk")).order_by().values("trip")
+        costs = Activity.objects.filter(trip_stop__trip=OuterRef("pk")).order_by().values("trip_stop__trip")
+        # Prefix each name with its zero-padded stop order so the names can be sorted after splitting
+        ordered_name = Concat(LPad(Cast("order", CharField()), 6, Value("0")), Value(":"), "city__name", output_field=CharField())
+        return queryset.select_related("origin_city").annotate(
+            stop_count=Coalesce(Subquery(stops.annotate(n=Count("id")).values("n"), output_field=IntegerField()), 0),
+            total_cost=Coalesce(Subquery(costs.annotate(total=Sum("cost_amount")).values("total"), output_field=IntegerField()), 0),
+            city_names=Subquery(stops.annotate(names=GroupConcat(ordered_name, CITY_NAME_SEPARATOR)).values("names")),
+        )
+
+    def get_cities(self, trip):
+        names = getattr(trip, "city_names", None)
+        if not names:
+            return []
+        return [item.split(":", 1)[1] for item in sorted(names.split(CITY_NAME_SEPARATOR))]
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source="id", read_only=True)
+    stops = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GenerationJob
+        fields = [
+            "job_id",
+            "trip",
+            "status",
+            "stage",
+            "progress",
+            "source",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "stops",
+        ]
+
+    def get_stops(self, job):
+        # jobs -> generation -> signals -> snapshots imports this module
+        from .jobs import job_stops
+
+        if job.status != GenerationJob.STATUS_SUCCEEDED:
+            return None
+        stops = job_stops(job)
+        return None if stops is None else TripStopSerializer(stops, many=True).data
+
+    def to_representation(self, job):
+        from .jobs import SUPERSEDED_ERROR
 
+        data = super().to_representation(job)
+        if job.status == GenerationJob.STATUS_SUCCEEDED and data["stops"] is None:
+            # Its itinerary was regenerated since: report it the way a replay does
+            data.update(status="superseded", error=SUPERSEDED_ERROR)
+        return data
@@ -0,0 +1,137 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog_index, public_cache, samples, snapshots, sync
+from .conditional import touch_trip
+from .models import Activity, ActivityCatalog, City, PublicSnapshot, Tombstone, Trip, TripBudgetRollup, TripStop
+
+
+@receiver(post_save, sender=ActivityCatalog)
+@receiver(post_delete, sender=ActivityCatalog)
+def refresh_catalog_index(sender, **kwargs):
+    catalog_index.invalidate()
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def refresh_samples(sender, **kwargs):
+    samples.clear()
+
+
+def _deleted_directly(instance, origin) -> bool:
+    # Rows removed by a cascade or a queryset .delete() are handled once per
+    # trip by whoever started the delete (delete_stops / delete_activities)
+    return origin is instance
+
+
+@receiver(post_delete, sender=TripStop)
+def touch_trip_on_stop_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(instance, origin):
+        touch_trip(pk=instance.trip_id)
+
+
+@receiver(post_delete, sender=Activity)
+def touch_trip_on_activity_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(instance, origin):
+        touch_trip(stops__id=instance.trip_stop_id)
+
+
+@receiver(post_delete, sender=Trip)
+def tombstone_trip(sender, instance, **kwargs):
+    sync.record_deletion(instance.user_id, Tombstone.KIND_TRIP, instance.pk)
+
+
+@receiver(post_delete, sender=TripStop)
+def tombstone_stop(sender, instance, origin=None, **kwargs):
+    # Cascades from a trip are covered by the trip's tombstone
+    if _deleted_directly(instance, origin):
+        user_id = Trip.objects.filter(pk=instance.trip_id).values_list('user_id', flat=True).first()
+        sync.record_deletion(user_id, Tombstone.KIND_STOP, instance.pk)
+
+
+@receiver(post_delete, sender=Activity)
+def tombstone_activity(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(instance, origin):
+        user_id = TripStop.objects.filter(pk=instance.trip_stop_id).values_list('trip__user_id', flat=True).first()
+        sync.record_deletion(user_id, Tombstone.KIND_ACTIVITY, instance.pk)
+
+
+@receiver(post_delete, sender=Activity)
+def remove_from_budget_rollup(sender, instance, origin=None, **kwargs):
+    # Rollup rows of a deleted stop or trip go with it (FK cascade); queryset
+    # deletes rebuild the affected stops once (delete_activities)
+    if _deleted_directly(instance, origin):
+        key = getattr(instance, '_stored_budget_key', None) or instance.budget_key()
+        TripBudgetRollup.objects.remove(instance.pk, *key)
+
+
+def trip_tree_changed(trip_id) -> None:
+    """Notify caches of a change to a trip, its stops or activities.
+
+    Called by the receivers below and directly by bulk paths (bulk_create,
+    queryset updates) that send no model signals.
+    """
+    public_cache.invalidate_trip(trip_id)
+    snapshots.mark_stale(trip_id)
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def trip_changed(sender, instance, **kwargs):
+    trip_tree_changed(instance.pk)
+
+
+@receiver(post_save, sender=TripStop)
+@receiver(post_delete, sender=TripStop)
+def stop_changed(sender, instance, signal=None, origin=None, **kwargs):
+    if signal is post_save or _deleted_directly(instance, origin):
+        trip_tree_changed(instance.trip_id)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def activity_changed(sender, instance, signal=None, origin=None, **kwargs):
+    if signal is post_save or _deleted_directly(instance, origin):
+        trip_tree_changed(TripStop.objects.filter(pk=instance.trip_stop_id).values_list('trip_id', flat=True).first())
+
+
+def _bulk_deleted(trip_ids) -> None:
+    if trip_ids:
+        touch_trip(pk__in=trip_ids)
+    for trip_id in trip_ids:
+        trip_tree_changed(trip_id)
+
+
+@transaction.atomic(savepoint=False)
+def delete_stops(stops) -> int:
+    """Delete the ``stops`` queryset with its activities; returns the number of stops.
+
+    Does the per-trip bookkeeping the row receivers skip for queryset deletes,
+    with the owners read in the same query as the ids.
+    """
+    rows = list(stops.order_by().values_list('id', 'trip_id', 'trip__user_id'))
+    # Budget rollups of the stops go with them (FK cascade, one DELETE)
+    deleted = stops.delete()[1].get(TripStop._meta.label, 0)
+    # Activities of the stops are covered by the stop tombstones
+    sync.record_deletions(Tombstone.KIND_STOP, [(user_id, pk) for pk, _, user_id in rows])
+    _bulk_deleted({trip_id for _, trip_id, _ in rows})
+    return deleted
+
+
+@transaction.atomic(savepoint=False)
+def delete_activities(activities) -> int:
+    """Delete the ``activities`` queryset; returns the number deleted. See ``delete_stops``."""
+    rows = list(activities.order_by().values_list('id', 'trip_stop_id', 'trip_stop__trip_id', 'trip_stop__trip__user_id'))
+    deleted = activities.delete()[1].get(Activity._meta.label, 0)
+    TripBudgetRollup.objects.rebuild({stop_id for _, stop_id, _, _ in rows})
+    sync.record_deletions(Tombstone.KIND_ACTIVITY, [(user_id, pk) for pk, _, _, user_id in rows])
+    _bulk_deleted({trip_id for _, _, trip_id, _ in rows})
+    return deleted
+
+
+@receiver(post_delete, sender=PublicSnapshot)
+def delete_snapshot_files(sender, instance, **kwargs):
+    if instance.slug and instance.version:
+        slug, versions = instance.slug, range(max(1, instance.version - snapshots.KEEP_VERSIONS + 1), instance.version + 1)
+        transaction.on_commit(lambda: snapshots.delete_files(slug, versions))
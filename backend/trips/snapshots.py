@@ -0,0 +1,164 @@
+"""Static JSON snapshots of shared itineraries.
+
+Sharing a trip renders its public itinerary (the same payload as
+``/api/public/itineraries/<slug>``) into storage:
+
+* ``<prefix>/v/<slug>/<version>.json`` - immutable, cache forever
+* ``<prefix>/latest/<slug>.json`` - overwritten on each render, short TTL
+
+so a CDN in front of the storage can serve public reads without reaching
+Django. Changes to the trip, its stops or activities only mark the snapshot
+stale (one UPDATE per trip when the transaction commits); the ``render_snapshots`` worker writes the
+next version. ``render_snapshots --all`` re-renders every public trip, e.g.
+after a serializer change.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Iterable, Optional, Set
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .commit_hooks import on_commit_once
+from .models import PublicSnapshot, Trip
+from .serializers import TripSerializer
+
+logger = logging.getLogger(__name__)
+
+# Older versions kept around for clients still holding their URL
+KEEP_VERSIONS = 2
+
+
+def storage():
+    """The ``PUBLIC_SNAPSHOT_STORAGE`` backend; refuses local disk unless explicitly allowed.
+
+    Files written to one process's local disk are invisible to the web
+    dynos and CDN, so rendering there would only produce broken URLs.
+    """
+    store = storages[settings.PUBLIC_SNAPSHOT_STORAGE]
+    if isinstance(store, FileSystemStorage) and not settings.PUBLIC_SNAPSHOT_ALLOW_LOCAL_STORAGE:
+        raise ImproperlyConfigured(
+            f"PUBLIC_SNAPSHOT_STORAGE={settings.PUBLIC_SNAPSHOT_STORAGE!r} is local FileSystemStorage; "
+            "configure shared object storage (PUBLIC_SNAPSHOT_STORAGE_BACKEND) for snapshots"
+        )
+    return store
+
+
+def version_path(slug: str, version: int) -> str:
+    return f"{settings.PUBLIC_SNAPSHOT_PREFIX}/v/{slug}/{version}.json"
+
+
+def latest_path(slug: str) -> str:
+    return f"{settings.PUBLIC_SNAPSHOT_PREFIX}/latest/{slug}.json"
+
+
+def snapshot_url(snapshot: PublicSnapshot) -> str:
+    return storage().url(version_path(snapshot.slug, snapshot.version))
+
+
+def _write(path: str, body: bytes) -> None:
+    store = storage()
+    # Storage.save() renames on conflict; these paths must be exact
+    if store.exists(path):
+        store.delete(path)
+    store.save(path, ContentFile(body))
+
+
+def _delete(paths: Iterable[str]) -> None:
+    store = storage()
+    for path in paths:
+        if store.exists(path):
+            store.delete(path)
+
+
+def delete_files(slug: str, versions: Iterable[int]) -> None:
+    _delete([latest_path(slug), *(version_path(slug, v) for v in versions)])
+
+
+def _mark_stale_now(trip_id: int) -> None:
+    PublicSnapshot.objects.filter(trip_id=trip_id, stale=False).update(stale=True, updated_at=timezone.now())
+
+
+def mark_stale(trip_id: Optional[int]) -> None:
+    """Queue ``trip_id``'s snapshot for re-rendering once the transaction commits (once per trip)."""
+    if trip_id is not None:
+        on_commit_once(("snapshot", trip_id), _mark_stale_now, trip_id)
+
+
+def ensure_snapshot(trip: Trip) -> PublicSnapshot:
+    snapshot, _ = PublicSnapshot.objects.get_or_create(trip=trip, defaults={"slug": trip.public_slug or ""})
+    return snapshot
+
+
+def render_snapshot(trip_id: int) -> Optional[PublicSnapshot]:
+    """Write the next version of ``trip_id``'s snapshot, or remove it if the trip is no longer public."""
+    snapshot = PublicSnapshot.objects.filter(trip_id=trip_id).first()
+    if snapshot is None:
+        return None
+    # Clear the flag before reading the rows: a change made while rendering
+    # marks it stale again and the next pass picks it up.
+    PublicSnapshot.objects.filter(pk=snapshot.pk).update(stale=False)
+    trip = TripSerializer.setup_eager_loading(Trip.objects.filter(pk=trip_id, is_public=True)).first()
+    if trip is None or not trip.public_slug:
+        snapshot.delete()
+        return None
+
+    body = json.dumps(TripSerializer(trip).data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    digest = hashlib.sha256(body).hexdigest()
+    old_slug, old_version = snapshot.slug, snapshot.version
+    if digest == snapshot.content_hash and trip.public_slug == old_slug:
+        PublicSnapshot.objects.filter(pk=snapshot.pk).update(rendered_at=timezone.now())
+        snapshot.stale = False
+        return snapshot
+
+    version = old_version + 1
+    _write(version_path(trip.public_slug, version), body)
+    _write(latest_path(trip.public_slug), body)
+    if old_slug and old_slug != trip.public_slug:
+        delete_files(old_slug, range(max(1, old_version - KEEP_VERSIONS + 1), old_version + 1))
+    elif old_version >= KEEP_VERSIONS:
+        _delete([version_path(old_slug, old_version - KEEP_VERSIONS + 1)])
+
+    PublicSnapshot.objects.filter(pk=snapshot.pk).update(
+        slug=trip.public_slug, version=version, content_hash=digest, rendered_at=timezone.now(), updated_at=timezone.now(),
+    )
+    snapshot.refresh_from_db()
+    return snapshot
+
+
+def render_stale(limit: int = 100, failed: Optional[Set[int]] = None) -> int:
+    """Render up to ``limit`` stale snapshots; returns how many were processed.
+
+    Trip ids that fail are added to ``failed`` (when given) and skipped by
+    later calls with the same set, so one bad batch cannot be retried forever.
+    """
+    stale = PublicSnapshot.objects.filter(stale=True)
+    if failed:
+        stale = stale.exclude(trip_id__in=failed)
+    ids = list(stale.order_by('updated_at').values_list('trip_id', flat=True)[:limit])
+    for trip_id in ids:
+        try:
+            render_snapshot(trip_id)
+        except Exception:
+            logger.exception("Rendering public snapshot for trip %s failed", trip_id)
+            # Retry on a later pass, behind the rest of the queue
+            PublicSnapshot.objects.filter(trip_id=trip_id).update(stale=True, updated_at=timezone.now())
+            if failed is not None:
+                failed.add(trip_id)
+    return len(ids)
+
+
+@transaction.atomic
+def mark_all_public_stale() -> int:
+    """Queue every public trip for re-rendering (creating missing snapshots)."""
+    missing = Trip.objects.filter(is_public=True, snapshot__isnull=True).exclude(public_slug=None).values_list('id', 'public_slug')
+    PublicSnapshot.objects.bulk_create([PublicSnapshot(trip_id=tid, slug=slug) for tid, slug in missing], batch_size=500)
+    return PublicSnapshot.objects.update(stale=True, updated_at=timezone.now())
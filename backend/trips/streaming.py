@@ -0,0 +1,265 @@
+"""Server-Sent Events variant of itinerary generation.
+
+OpenRouter's streaming API is consumed token by token. An incremental JSON
+scanner reports each completed ``perCity`` entry, so every stop (with its
+activities) is persisted and pushed to the client as soon as it is known
+instead of after the whole 30-60s completion.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from contextlib import closing
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+from . import llm, llm_cache
+from .generation import (
+    GENERATE_MODEL,
+    GENERATE_TEMPERATURE,
+    PlannedStop,
+    append_stop,
+    default_destinations,
+    itinerary_cache_key,
+    itinerary_messages,
+    persist_itinerary,
+    plan_from_payload,
+    plan_heuristic,
+    planned_activities,
+)
+from .jobs import SUPERSEDED_ERROR, fail_job, finish_job, job_stops
+from .models import GenerationJob, Trip, TripStop
+from .serializers import TripStopSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets ``Accept: text/event-stream`` (EventSource) pass content negotiation.
+
+    Only non-streaming responses (errors) are rendered through it.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse('error', data).encode(self.charset)
+
+
+class IncrementalJSONScanner:
+    """Report JSON objects/arrays as they close, for a document fed in chunks.
+
+    ``feed`` returns ``(path, raw_json)`` for each container completed by the
+    new text, where ``path`` is the tuple of keys/indices from the root.
+    Only containers at most ``max_depth`` levels deep are reported. Text
+    before the first ``{``/``[`` (code fences, chatter) is ignored.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.text = ""
+        self.complete = False
+        self._pos = 0
+        self._started = False
+        self._stack: List[dict] = []
+        self._in_string = False
+        self._escape = False
+        self._str_start = 0
+        self._last_string = '""'
+
+    def feed(self, chunk: str) -> List[Tuple[tuple, str]]:
+        self.text += chunk
+        done: List[Tuple[tuple, str]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.complete:
+                break
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._str_start:i + 1]
+                continue
+            if not self._started:
+                if ch in '{[':
+                    self._started = True
+                    self._stack.append({'kind': ch, 'start': i, 'path': (), 'key': None, 'index': 0})
+                continue
+            frame = self._stack[-1]
+            if ch == '"':
+                self._in_string = True
+                self._str_start = i
+            elif ch in '{[':
+                step = frame['key'] if frame['kind'] == '{' else frame['index']
+                self._stack.append({'kind': ch, 'start': i, 'path': frame['path'] + (step,), 'key': None, 'index': 0})
+            elif ch in '}]':
+                closed = self._stack.pop()
+                if len(closed['path']) <= self.max_depth:
+                    done.append((closed['path'], text[closed['start']:i + 1]))
+                if not self._stack:
+                    self.complete = True
+            elif ch == ':' and frame['kind'] == '{':
+                frame['key'] = json.loads(self._last_string)
+            elif ch == ',':
+                if frame['kind'] == '{':
+                    frame['key'] = None
+                else:
+                    frame['index'] += 1
+        self._pos = len(text)
+        return done
+
+
+class StreamingPlanBuilder:
+    """Turn scanner events for ``{cities: [...], perCity: {...}}`` into stops.
+
+    Stops are released in ``cities`` order, each as soon as its ``perCity``
+    entry has closed, so the result matches ``plan_from_payload``.
+    """
+
+    def __init__(self, start: date, days_per_city: int, fallback_names: List[str]):
+        self.start = start
+        self.days_per_city = days_per_city
+        self.fallback_names = fallback_names
+        self.cities: Optional[List[str]] = None
+        self.per_city: dict = {}
+        self.per_city_closed = False
+        self.emitted = 0
+
+    def on_container(self, path: tuple, raw: str) -> None:
+        if path == ('cities',):
+            names = [c.get('name') for c in json.loads(raw) if isinstance(c, dict) and c.get('name')]
+            self.cities = names or None
+        elif path == ('perCity',):
+            self.per_city_closed = True
+        elif len(path) == 2 and path[0] == 'perCity':
+            self.per_city[path[1]] = json.loads(raw)
+
+    def ready(self, final: bool = False) -> List[PlannedStop]:
+        names = self.cities
+        if names is None:
+            if not final:
+                return []
+            names = self.fallback_names
+        out = []
+        while self.emitted < len(names):
+            name = names[self.emitted]
+            known = name in self.per_city or name.title() in self.per_city
+            if not (known or self.per_city_closed or final):
+                break
+            start = self.start + timedelta(days=self.days_per_city * self.emitted)
+            self.emitted += 1
+            out.append(PlannedStop(
+                city_name=name,
+                start_date=start,
+                end_date=start + timedelta(days=self.days_per_city),
+                order=self.emitted,
+                activities=planned_activities(self.per_city, name),
+            ))
+        return out
+
+
+def _stop_event(stop_id: int) -> str:
+    stop = TripStop.objects.select_related('city').prefetch_related('activities').get(pk=stop_id)
+    return sse('stop', TripStopSerializer(stop).data)
+
+
+def stream_itinerary(trip: Trip, days_per_city: int, currency: str, job: Optional[GenerationJob] = None) -> Iterator[str]:
+    """Yield SSE frames: ``status`` updates, one ``stop`` per persisted stop, then ``done``.
+
+    ``done`` carries the same ``{status, stops}`` payload as the JSON endpoint.
+    If the stream breaks after some stops were persisted those stops are
+    kept; if it breaks before the first one the heuristic fallback runs.
+    ``job`` (the trip's single-flight job) is finished or failed at the end.
+    """
+    source = 'heuristic'
+    persisted: List[int] = []
+    try:
+        yield sse('status', {'stage': 'planning'})
+        origin = trip.origin_city.name if trip.origin_city else None
+        dests = default_destinations()
+        messages = itinerary_messages(origin, days_per_city, currency)
+
+        if llm.api_key():
+            key = itinerary_cache_key(messages)
+            cached = llm_cache.get(key)
+            if cached is not None:
+                source = 'openrouter'
+                yield sse('status', {'stage': 'persisting', 'source': source, 'cached': True})
+                stops = persist_itinerary(trip, plan_from_payload(trip, cached, dests, days_per_city), currency)
+                for stop in stops:
+                    persisted.append(stop.id)
+                    yield _stop_event(stop.id)
+            else:
+                yield sse('status', {'stage': 'streaming', 'source': 'openrouter'})
+                scanner = IncrementalJSONScanner()
+                builder = StreamingPlanBuilder(trip.start_date, days_per_city, dests)
+                try:
+                    t0 = time.perf_counter()
+                    # Closed explicitly so a client disconnect reaches the breaker right away
+                    with closing(llm.stream_chat_completion(messages, model=GENERATE_MODEL, temperature=GENERATE_TEMPERATURE)) as deltas:
+                        for delta in deltas:
+                            for path, raw in scanner.feed(delta):
+                                builder.on_container(path, raw)
+                            for planned in builder.ready():
+                                stop = append_stop(trip, planned, currency, replace_existing=not persisted)
+                                persisted.append(stop.id)
+                                yield _stop_event(stop.id)
+                    if scanner.complete:
+                        for planned in builder.ready(final=True):
+                            stop = append_stop(trip, planned, currency, replace_existing=not persisted)
+                            persisted.append(stop.id)
+                            yield _stop_event(stop.id)
+                        payload = json.loads(llm.extract_json(scanner.text))
+                        if isinstance(payload, dict):
+                            llm_cache.put(key, GENERATE_MODEL, payload, (time.perf_counter() - t0) * 1000)
+                except Exception as ex:
+                    logger.warning("OpenRouter itinerary stream failed: %s", ex)
+                if persisted:
+                    source = 'openrouter'
+
+        if not persisted:
+            source = 'heuristic'
+            yield sse('status', {'stage': 'fallback', 'source': source})
+            for stop in persist_itinerary(trip, plan_heuristic(trip, dests, days_per_city), currency):
+                persisted.append(stop.id)
+                yield _stop_event(stop.id)
+
+        if job is not None:
+            finish_job(job, source, persisted)
+        stops = trip.stops.select_related('city').prefetch_related('activities')
+        yield sse('done', {"status": "generated", "stops": TripStopSerializer(stops, many=True).data})
+    finally:
+        # Client went away or persisting failed: release the trip's single-flight slot
+        if job is not None and job.status in GenerationJob.ACTIVE_STATUSES:
+            fail_job(job, "stream ended before completion")
+
+
+def attached_events(job: GenerationJob, poll_url: str) -> Iterator[str]:
+    """SSE frames for a request that attached to another request's job.
+
+    A finished job is replayed; an active one is reported once with its
+    ``poll_url`` rather than holding the connection until it completes.
+    """
+    if job.status == GenerationJob.STATUS_SUCCEEDED:
+        stops = job_stops(job)
+        if stops is None:
+            yield sse('error', {"status": "superseded", "job_id": job.id, "error": SUPERSEDED_ERROR})
+        else:
+            yield sse('done', {"status": "generated", "stops": TripStopSerializer(stops, many=True).data})
+    elif job.status == GenerationJob.STATUS_FAILED:
+        yield sse('error', {"status": "failed", "job_id": job.id, "error": job.error})
+    else:
+        yield sse('status', {'stage': 'attached', 'job_id': job.id, 'status': job.status, 'poll_url': poll_url})
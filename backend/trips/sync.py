@@ -0,0 +1,100 @@
+"""Delta sync for offline clients (``GET /api/sync?since=<cursor>``).
+
+A response carries the user's trips, stops and activities whose
+``updated_at`` is after the cursor, the ids deleted since then (from
+``Tombstone``) and the cursor for the next call. Each list is one indexed
+query, so the cost follows edit volume rather than how much a user owns.
+
+Cursors are opaque to clients. Internally they hold the server time at which
+the previous response was read; rows are matched from
+``SYNC_CURSOR_OVERLAP_SECONDS`` before that, so a write committed just after
+the read (with an older ``updated_at``) is still delivered. Clients therefore
+apply changes as idempotent upserts. A missing cursor, or one older than the
+tombstone retention window, yields a full sync (``"full": true``): the client
+replaces its local copy instead of merging.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Activity, Tombstone, Trip, TripStop
+from .serializers import ActivitySerializer, TripSerializer, TripStopSerializer
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(at: datetime) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"t": at.isoformat()}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        at = datetime.fromisoformat(json.loads(raw)["t"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("invalid sync cursor")
+    if timezone.is_naive(at):
+        raise InvalidCursor("invalid sync cursor")
+    return at
+
+
+def retention_cutoff() -> datetime:
+    return timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+
+def changes(user, cursor: Optional[str]) -> dict:
+    """Changes to ``user``'s trips since ``cursor``; raises InvalidCursor."""
+    now = timezone.now()
+    since = decode_cursor(cursor) if cursor else None
+    full = since is None or since < retention_cutoff()
+
+    trips = Trip.objects.filter(user=user).select_related("origin_city").order_by("id")
+    stops = TripStop.objects.filter(trip__user=user).select_related("city").order_by("id")
+    activities = Activity.objects.filter(trip_stop__trip__user=user).order_by("id")
+    deleted = {"trips": [], "stops": [], "activities": []}
+    if not full:
+        after = since - timedelta(seconds=settings.SYNC_CURSOR_OVERLAP_SECONDS)
+        trips = trips.filter(updated_at__gt=after)
+        stops = stops.filter(updated_at__gt=after)
+        activities = activities.filter(updated_at__gt=after)
+        keys = {Tombstone.KIND_TRIP: "trips", Tombstone.KIND_STOP: "stops", Tombstone.KIND_ACTIVITY: "activities"}
+        rows = Tombstone.objects.filter(user=user, deleted_at__gt=after).order_by("id").values_list("kind", "object_id")
+        for kind, object_id in rows:
+            deleted[keys[kind]].append(object_id)
+
+    return {
+        "cursor": encode_cursor(now),
+        "full": full,
+        # Flat lists linked by id (stop.trip, activity.trip_stop); cities are embedded
+        "trips": TripSerializer(trips, many=True, expand={"origin_city": {}}).data,
+        "stops": TripStopSerializer(stops, many=True, expand={"city": {}}).data,
+        "activities": ActivitySerializer(activities, many=True).data,
+        "deleted": deleted,
+    }
+
+
+def record_deletion(user_id, kind: str, object_id) -> None:
+    if user_id is not None:
+        Tombstone.objects.create(user_id=user_id, kind=kind, object_id=object_id)
+
+
+def record_deletions(kind: str, rows) -> None:
+    """One tombstone per ``(user_id, object_id)`` in ``rows``, written with a single insert."""
+    Tombstone.objects.bulk_create(
+        [Tombstone(user_id=user_id, kind=kind, object_id=object_id) for user_id, object_id in rows],
+        batch_size=500,
+    )
+
+
+def prune_tombstones() -> int:
+    """Drop tombstones past the retention window; clients that old get a full sync anyway."""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=retention_cutoff()).delete()
+    return deleted
@@ -1,3 +1,1663 @@
-from django.test import TestCase
+import importlib
+import importlib.util
+import io
+import json
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from gt_backend import http_client, metrics
+from . import budget, catalog_index, generation, jobs, llm, llm_cache, public_cache, samples, signals, snapshots, sync
+from .circuit_breaker import CircuitBreaker
+from .cloning import clone_trip
+from .jobs import submit_generation
+from .models import (
+    Activity, ActivityCatalog, CircuitBreakerState, City, FxRate, GenerationJob, LLMResponseCache, PublicSnapshot, Tombstone, Trip, TripBudgetRollup, TripStop,
+)
+from .serializers import TripSerializer
+from .streaming import IncrementalJSONScanner, stream_itinerary
+
+
+def make_trips(user, n_trips, n_stops=3, n_activities=3):
+    cities = [City.objects.create(name=f"City {i}", country="X") for i in range(n_stops + 1)]
+    for t in range(n_trips):
+        trip = Trip.objects.create(
+            user=user, name=f"Trip {t}", start_date=date(2025, 1, 1), end_date=date(2025, 1, 10),
+            origin_city=cities[-1], is_public=True,
+        )
+        for s in range(n_stops):
+            stop = TripStop.objects.create(
+                trip=trip, city=cities[s], start_date=date(2025, 1, 1 + s), end_date=date(2025, 1, 2 + s), order=s + 1,
+            )
+            for a in range(n_activities):
+                Activity.objects.create(trip_stop=stop, title=f"Activity {a}", cost_amount=100)
+
+
+class TripQueryCountTests(TestCase):
+    # trips, origin cities (joined), stops + cities (joined), activities
+    TRIP_QUERIES = 3
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="q", email="q@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_trip_list_query_count_is_constant(self):
+        make_trips(self.user, 2)
+        with self.assertNumQueries(self.TRIP_QUERIES):
+            small = self.client.get("/api/trips/?view=full")
+        make_trips(self.user, 8, n_stops=4, n_activities=5)
+        with self.assertNumQueries(self.TRIP_QUERIES):
+            large = self.client.get("/api/trips/?view=full")
+        self.assertEqual(len(small.json()["results"]), 2)
+        self.assertEqual(len(large.json()["results"]), 10)
+        self.assertEqual(len(large.json()["results"][0]["stops"][0]["activities"]), 5)
+
+    def test_trip_summary_list_is_one_query(self):
+        make_trips(self.user, 3, n_stops=3, n_activities=2)
+        TripStop.objects.filter(order=1).update(order=9)
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/trips/")
+        row = resp.json()["results"][0]
+        self.assertNotIn("stops", row)
+        self.assertEqual(row["stop_count"], 3)
+        self.assertEqual(row["total_cost"], 600)
+        self.assertEqual(row["cities"], ["City 1", "City 2", "City 0"])
+        self.assertEqual(row["origin_city"]["name"], "City 3")
+
+    def test_trip_summary_list_cursor_pagination(self):
+        make_trips(self.user, 5, n_stops=1, n_activities=0)
+        Trip.objects.create(user=self.user, name="Empty", start_date=date(2025, 1, 1), end_date=date(2025, 1, 2))
+        first = self.client.get("/api/trips/?page_size=4").json()
+        self.assertEqual([t["name"] for t in first["results"]], ["Empty", "Trip 4", "Trip 3", "Trip 2"])
+        self.assertEqual(first["results"][0]["stop_count"], 0)
+        self.assertEqual(first["results"][0]["cities"], [])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([t["name"] for t in second["results"]], ["Trip 1", "Trip 0"])
+        self.assertIsNone(second["next"])
+
+    def test_trip_detail_query_count(self):
+        make_trips(self.user, 1, n_stops=5, n_activities=4)
+        trip = Trip.objects.get()
+        # + the ETag/Last-Modified aggregate
+        with self.assertNumQueries(self.TRIP_QUERIES + 1):
+            resp = self.client.get(f"/api/trips/{trip.id}/")
+        stops = resp.json()["stops"]
+        self.assertEqual([s["order"] for s in stops], [1, 2, 3, 4, 5])
+        self.assertEqual(resp.json()["origin_city"]["name"], "City 5")
+
+    def test_public_itinerary_query_count(self):
+        make_trips(self.user, 1, n_stops=4)
+        trip = Trip.objects.get()
+        # Cold cache: + slug lookup and the ETag/Last-Modified aggregate
+        with self.assertNumQueries(self.TRIP_QUERIES + 2):
+            resp = APIClient().get(f"/api/public/itineraries/{trip.public_slug}")
+        self.assertEqual(len(resp.json()["stops"]), 4)
+
+    def test_stop_list_query_count_is_constant(self):
+        make_trips(self.user, 1, n_stops=5, n_activities=4)
+        trip = Trip.objects.get()
+        # stops + cities (joined), activities
+        with self.assertNumQueries(2):
+            resp = self.client.get(f"/api/trips/{trip.id}/stops/")
+        self.assertEqual(len(resp.json()), 5)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="f", email="f@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 1, n_stops=3, n_activities=2)
+        self.trip = Trip.objects.get()
+        self.url = f"/api/trips/{self.trip.id}/"
+
+    def test_fields_skip_unrequested_relations(self):
+        # trip row + the ETag/Last-Modified aggregate
+        with self.assertNumQueries(2):
+            resp = self.client.get(self.url + "?fields=id,name")
+        self.assertEqual(resp.json(), {"id": self.trip.id, "name": "Trip 0"})
+
+    def test_expand_limits_nesting(self):
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.url + "?expand=stops")
+        stop = resp.json()["stops"][0]
+        self.assertNotIn("origin_city", resp.json())
+        self.assertNotIn("activities", stop)
+        self.assertNotIn("city", stop)
+        self.assertIn("start_date", stop)
+
+        deep = self.client.get(self.url + "?expand=stops.activities").json()
+        self.assertEqual(len(deep["stops"][0]["activities"]), 2)
+        self.assertNotIn("city", deep["stops"][0])
+
+    def test_dotted_fields(self):
+        resp = self.client.get(self.url + "?fields=name,stops.city.name").json()
+        self.assertEqual(resp["stops"][0], {"city": {"name": "City 0"}})
+        self.assertEqual(set(resp), {"name", "stops"})
+
+    def test_default_shape_and_etag_per_shape(self):
+        full = self.client.get(self.url)
+        self.assertIn("activities", full.json()["stops"][0])
+        self.assertEqual(full.json()["origin_city"]["name"], "City 3")
+        sparse = self.client.get(self.url + "?fields=id")
+        self.assertNotEqual(sparse["ETag"], full["ETag"])
+        self.assertEqual(self.client.get(self.url + "?fields=id", HTTP_IF_NONE_MATCH=full["ETag"]).status_code, 200)
+
+    def test_public_itinerary_shapes_cached_separately(self):
+        url = f"/api/public/itineraries/{self.trip.public_slug}"
+        anon = APIClient()
+        sparse = anon.get(url + "?expand=stops").json()
+        self.assertNotIn("activities", sparse["stops"][0])
+        full = anon.get(url).json()
+        self.assertIn("activities", full["stops"][0])
+        with self.assertNumQueries(0):
+            again = anon.get(url + "?expand=stops").json()
+        self.assertEqual(again, sparse)
+
+    def test_public_itinerary_ignores_unknown_shape_names(self):
+        url = f"/api/public/itineraries/{self.trip.public_slug}"
+        anon = APIClient()
+        sparse = anon.get(url + "?fields=stops.city.name,name").json()
+        junk = ",".join(f"junk{i}" for i in range(500))
+        with self.assertNumQueries(0):
+            again = anon.get(f"{url}?fields=name,{junk},stops.city.name,stops.{junk}").json()
+        self.assertEqual(again, sparse)
+        expanded = anon.get(url + "?expand=stops").json()
+        with self.assertNumQueries(0):
+            self.assertEqual(anon.get(f"{url}?expand=stops,stops.{junk},{junk}").json(), expanded)
+        # Fixed-length key however long the query string is (memcached allows 250 characters)
+        self.assertLessEqual(len(public_cache.entry_key_for(f"{self.trip.public_slug}?fields={junk}")), 100)
+
+    def test_writes_return_full_representation(self):
+        resp = self.client.patch(self.url + "?fields=id", {"name": "Renamed"}, format="json")
+        self.assertEqual(resp.json()["name"], "Renamed")
+        self.assertIn("stops", resp.json())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="c", email="c@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 1, n_stops=2, n_activities=2)
+        self.trip = Trip.objects.get()
+        self.url = f"/api/trips/{self.trip.id}/"
+
+    def test_trip_detail_304_skips_serialization(self):
+        first = self.client.get(self.url)
+        self.assertTrue(first["ETag"].startswith('W/"'))
+        self.assertIn("Last-Modified", first)
+        # Only the validators aggregate runs
+        with self.assertNumQueries(1):
+            again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+        by_date = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(by_date.status_code, 304)
+
+    def test_child_changes_change_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        activity = Activity.objects.first()
+        activity.delete()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+        etag = resp["ETag"]
+        stop = TripStop.objects.first()
+        self.client.post(f"/api/trips/{self.trip.id}/stops/{stop.id}/activities/", {"title": "New"}, format="json")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bulk_delete_touches_trip_once(self):
+        before = Trip.objects.get().updated_at
+        with CaptureQueriesContext(connection) as ctx:
+            signals.delete_stops(self.trip.stops.all())
+        touches = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "trips_trip"')]
+        self.assertEqual(len(touches), 1)
+        self.assertGreater(Trip.objects.get().updated_at, before)
+
+    def test_stop_activity_and_public_routes(self):
+        stop = TripStop.objects.first()
+        activity = stop.activities.first()
+        for url, client in (
+            (f"/api/trips/{self.trip.id}/stops/{stop.id}/", self.client),
+            (f"/api/trips/{self.trip.id}/stops/{stop.id}/activities/{activity.id}/", self.client),
+            (f"/api/public/itineraries/{self.trip.public_slug}", APIClient()),
+        ):
+            etag = client.get(url)["ETag"]
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+
+    def test_other_users_trip_is_404_not_304(self):
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username="o", email="o@example.com", password="x"))
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(other.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class PublicItineraryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.user = User.objects.create_user(username="p", email="p@example.com", password="x")
+        # Committed fixtures: invalidations are queued once per trip and transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            make_trips(self.user, 1, n_stops=2, n_activities=2)
+        self.trip = Trip.objects.get()
+        self.url = f"/api/public/itineraries/{self.trip.public_slug}"
+        self.client = APIClient()
+
+    def test_hit_skips_database(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["public_cache.misses"], 1)
+        self.assertEqual(counters["public_cache.hits"], 1)
+        self.assertGreater(counters["public_cache.saved_ms"], 0)
+
+    @override_settings(PUBLIC_ITINERARY_CACHE_ENABLED=False)
+    def test_disabled_cache_renders_every_request(self):
+        first = self.client.get(self.url)
+        # slug lookup, validators aggregate, trip tree (3)
+        with self.assertNumQueries(5):
+            second = self.client.get(self.url)
+        self.assertEqual(first.json(), second.json())
+        self.assertIsNone(cache.get(public_cache.entry_key_for(self.trip.public_slug)))
+
+    def test_child_save_and_delete_invalidate(self):
+        self.client.get(self.url)
+        activity = Activity.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.title = "Renamed"
+            activity.save()
+        titles = [a["title"] for s in self.client.get(self.url).json()["stops"] for a in s["activities"]]
+        self.assertIn("Renamed", titles)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TripStop.objects.first().delete()
+        self.assertEqual(len(self.client.get(self.url).json()["stops"]), 1)
+
+    def test_bulk_delete_invalidates_once(self):
+        self.client.get(self.url)
+        metrics.reset()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            signals.delete_stops(self.trip.stops.all())
+        # one version bump and one snapshot mark for the trip
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(metrics.snapshot()["counters"]["public_cache.invalidations"], 1)
+        self.assertEqual(self.client.get(self.url).json()["stops"], [])
+
+    def test_unsharing_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.is_public = False
+            self.trip.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_concurrent_miss_waits_for_rebuild(self):
+        # Another request holds the rebuild lock and publishes the entry while we wait
+        cache.add(public_cache.lock_key_for(self.trip.public_slug), 1, 10)
+        rendered = []
+        original_sleep = public_cache.time.sleep
+
+        def publish_then_sleep(seconds):
+            if not rendered:
+                rendered.append(public_cache._build(
+                    public_cache.entry_key_for(self.trip.public_slug),
+                    lambda: self.trip.id,
+                    lambda trip_id: {"data": {"id": trip_id}, "validators": None},
+                ))
+            original_sleep(0)
+
+        public_cache.time.sleep = publish_then_sleep
+        try:
+            resp = self.client.get(self.url)
+        finally:
+            public_cache.time.sleep = original_sleep
+        self.assertEqual(resp.json(), {"id": self.trip.id})
+        self.assertEqual(metrics.snapshot()["counters"]["public_cache.waited_hits"], 1)
+
+
+class PublicSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(username="s", email="s@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_trips(self.user, 1, n_stops=2, n_activities=1)
+        self.trip = Trip.objects.get()
+        Trip.objects.filter(pk=self.trip.pk).update(is_public=False)
+
+    def read(self, path):
+        with snapshots.storage().open(path) as f:
+            return json.loads(f.read())
+
+    def test_share_renders_snapshot(self):
+        resp = self.client.post(f"/api/trips/{self.trip.id}/share/")
+        slug = resp.json()["public_slug"]
+        self.assertTrue(resp.json()["snapshot_url"].endswith(f"/snapshots/v/{slug}/1.json"))
+        snap = PublicSnapshot.objects.get()
+        self.assertFalse(snap.stale)
+        public = APIClient().get(f"/api/public/itineraries/{slug}").json()
+        self.assertEqual(self.read(snapshots.latest_path(slug)), public)
+        self.assertEqual(self.read(snapshots.version_path(slug, 1)), public)
+
+    def test_changes_mark_stale_and_worker_rerenders(self):
+        slug = self.client.post(f"/api/trips/{self.trip.id}/share/").json()["public_slug"]
+        Activity.objects.update(title="Changed")  # queryset update: no signal
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.first().save()
+        self.assertTrue(PublicSnapshot.objects.get().stale)
+        call_command("render_snapshots", stdout=io.StringIO())
+        snap = PublicSnapshot.objects.get()
+        self.assertEqual((snap.version, snap.stale), (2, False))
+        titles = {a["title"] for s in self.read(snapshots.latest_path(slug))["stops"] for a in s["activities"]}
+        self.assertEqual(titles, {"Changed"})
+        # Unchanged content does not write a new version
+        call_command("render_snapshots", "--all", stdout=io.StringIO())
+        self.assertEqual(PublicSnapshot.objects.get().version, 2)
+
+    def test_bulk_delete_marks_stale_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/trips/{self.trip.id}/share/")
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            signals.delete_stops(self.trip.stops.all())
+        marks = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "trips_publicsnapshot"')]
+        self.assertEqual(len(marks), 1)
+        self.assertTrue(PublicSnapshot.objects.get().stale)
+
+    @override_settings(PUBLIC_SNAPSHOT_ALLOW_LOCAL_STORAGE=False)
+    def test_refuses_local_storage(self):
+        with self.assertLogs("trips.views", "WARNING"):
+            resp = self.client.post(f"/api/trips/{self.trip.id}/share/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNone(resp.json()["snapshot_url"])
+        with self.assertRaises(CommandError):
+            call_command("render_snapshots", stdout=io.StringIO())
+
+    def test_one_shot_run_stops_when_a_batch_keeps_failing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_trips(self.user, 2, n_stops=1, n_activities=0)
+        call_command("render_snapshots", "--all", stdout=io.StringIO())
+        out = io.StringIO()
+        with mock.patch.object(snapshots, "render_snapshot", side_effect=RuntimeError("storage down")) as render, \
+                self.assertLogs("trips.snapshots", "ERROR"):
+            call_command("render_snapshots", "--all", "--batch-size", "1", stdout=out)
+        # Each stale row is tried once, then the run ends
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(PublicSnapshot.objects.filter(stale=True).count(), 2)
+        self.assertIn("2 snapshot(s) failed", out.getvalue())
+
+    def test_unsharing_removes_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            slug = self.client.post(f"/api/trips/{self.trip.id}/share/").json()["public_slug"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/trips/{self.trip.id}/", {"is_public": False}, format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("render_snapshots", stdout=io.StringIO())
+        self.assertFalse(PublicSnapshot.objects.exists())
+        self.assertFalse(snapshots.storage().exists(snapshots.latest_path(slug)))
+
+
+class SampleItineraryTests(TestCase):
+    def setUp(self):
+        samples.clear()
+        City.objects.create(name="Paris", country="France")
+        City.objects.create(name="Rome", country="Italy")
+
+    def test_one_query_cold_zero_warm(self):
+        url = "/api/public/itineraries/sample?origin=London&dest=paris,%20Rome&start=2025-09-05&daysPerCity=3"
+        with self.assertNumQueries(1):
+            cold = APIClient().get(url).json()
+        with self.assertNumQueries(0):
+            warm = APIClient().get(url).json()
+        self.assertEqual(cold, warm)
+        self.assertEqual([s["city"]["name"] for s in cold["stops"]], ["Paris", "Rome"])
+        self.assertEqual(cold["stops"][0]["city"]["country"], "France")
+        self.assertEqual(cold["origin_city"]["id"], 0)
+        self.assertEqual(cold["end_date"], "2025-09-11")
+        self.assertEqual(cold["budget_breakdown_minor"]["transport"], 10000)
+
+    def test_memo_is_bounded(self):
+        with self.settings(SAMPLE_ITINERARY_CACHE_SIZE=2):
+            for dest in ("Paris", "Rome", "Oslo"):
+                APIClient().get(f"/api/public/itineraries/demo?dest={dest}")
+            self.assertEqual(len(samples._memo), 2)
+
+    def test_memo_holds_cities_not_payloads(self):
+        many = ",".join(f"Town {i}" for i in range(samples.MAX_DESTINATIONS - 1))
+        long_name = "x" * (samples.MAX_NAME_LENGTH + 1)
+        with self.settings(SAMPLE_ITINERARY_CACHE_SIZE=10):
+            data = APIClient().get(f"/api/public/itineraries/sample?dest={many},{long_name}").json()
+        self.assertEqual(len(data["stops"]), samples.MAX_DESTINATIONS)
+        self.assertEqual(len(samples._memo), 10)
+        self.assertNotIn(long_name, samples._memo)
+        self.assertTrue(all(set(city) <= {"id", "name", "country", "region", "cost_index", "popularity"} for _, city in samples._memo.values()))
+
+    def test_city_edits_invalidate_memo(self):
+        url = "/api/public/itineraries/sample?dest=Paris"
+        self.assertEqual(APIClient().get(url).json()["stops"][0]["city"]["country"], "France")
+        paris = City.objects.get(name="Paris")
+        paris.country = "FR"
+        paris.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(APIClient().get(url).json()["stops"][0]["city"]["country"], "FR")
+        paris.delete()
+        self.assertEqual(APIClient().get(url).json()["stops"][0]["city"]["id"], 0)
+        City.objects.create(name="Oslo", country="Norway")
+        self.assertEqual(APIClient().get("/api/public/itineraries/sample?dest=oslo").json()["stops"][0]["city"]["country"], "Norway")
+
+    def test_bad_params(self):
+        too_many = ",".join(f"Town {i}" for i in range(samples.MAX_DESTINATIONS + 1))
+        for query in (
+            "start=soon", "daysPerCity=abc", "daysPerCity=0", "daysPerCity=-3", "daysPerCity=31",
+            "daysPerCity=999999999", "start=9999-12-30&daysPerCity=30", f"dest={too_many}",
+        ):
+            with self.subTest(query=query), self.assertNumQueries(0):
+                self.assertEqual(APIClient().get(f"/api/public/itineraries/sample?{query}").status_code, 400)
+
+    def test_city_lookup_is_case_insensitive_in_one_query(self):
+        names = ",".join(["PARIS", "rome", *(f"Town {i}" for i in range(samples.MAX_DESTINATIONS - 2))])
+        with self.assertNumQueries(1):
+            data = APIClient().get(f"/api/public/itineraries/sample?dest={names}").json()
+        self.assertEqual([s["city"]["country"] for s in data["stops"][:2]], ["France", "Italy"])
+
+
+@override_settings(SYNC_CURSOR_OVERLAP_SECONDS=0)
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="s", email="s@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 2, n_stops=2, n_activities=2)
+        other = User.objects.create_user(username="s2", email="s2@example.com", password="x")
+        make_trips(other, 1, n_stops=1, n_activities=1)
+
+    def sync(self, cursor=None):
+        resp = self.client.get("/api/sync", {"since": cursor} if cursor else {})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_full_then_empty_delta(self):
+        full = self.sync()
+        self.assertTrue(full["full"])
+        self.assertEqual((len(full["trips"]), len(full["stops"]), len(full["activities"])), (2, 4, 8))
+        self.assertEqual(full["stops"][0]["trip"], full["trips"][0]["id"])
+        self.assertNotIn("stops", full["trips"][0])
+        # trips, stops, activities, tombstones
+        with self.assertNumQueries(4):
+            delta = self.sync(full["cursor"])
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["trips"] + delta["stops"] + delta["activities"], [])
+
+    def test_delta_contains_only_changes(self):
+        cursor = self.sync()["cursor"]
+        activity = Activity.objects.filter(trip_stop__trip__user=self.user).first()
+        activity.title = "Changed"
+        activity.save()
+        delta = self.sync(cursor)
+        self.assertEqual([a["title"] for a in delta["activities"]], ["Changed"])
+        self.assertEqual(delta["stops"], [])
+
+    def test_deletions_record_root_tombstones(self):
+        cursor = self.sync()["cursor"]
+        trip, keep = Trip.objects.filter(user=self.user).order_by("id")
+        stop = keep.stops.first()
+        activity = keep.stops.last().activities.first()
+        expected = {"trips": [trip.id], "stops": [stop.id], "activities": [activity.id]}
+        trip.delete()
+        stop.delete()
+        activity.delete()
+        # One row per deleted root, none for the cascaded children
+        self.assertEqual(Tombstone.objects.count(), 3)
+        deleted = self.sync(cursor)["deleted"]
+        self.assertEqual(deleted, expected)
+
+    def test_bulk_delete_writes_tombstones_in_one_insert(self):
+        cursor = self.sync()["cursor"]
+        trip = Trip.objects.filter(user=self.user).order_by("id").first()
+        stop_ids = sorted(trip.stops.values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            signals.delete_stops(trip.stops.all())
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "trips_tombstone"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.sync(cursor)["deleted"], {"trips": [], "stops": stop_ids, "activities": []})
+
+    def test_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get("/api/sync", {"since": "nope"}).status_code, 400)
+        old = sync.encode_cursor(sync.retention_cutoff() - timedelta(days=1))
+        self.assertTrue(self.sync(old)["full"])
+
+
+class BudgetSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="b", email="b@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 1, n_stops=3, n_activities=0)
+        self.trip = Trip.objects.get()
+        first, second, _empty = self.trip.stops.order_by("order")
+        Activity.objects.create(trip_stop=first, title="Lunch", category="Food", cost_amount=300, currency="EUR")
+        Activity.objects.bulk_create([
+            Activity(trip_stop=first, title="Louvre", category="museum", cost_amount=200, currency="EUR"),
+            Activity(trip_stop=second, title="TGV", category="Train ride", cost_amount=1000, currency="EUR"),
+            Activity(trip_stop=second, title="Misc", category="", cost_amount=50, currency="EUR"),
+        ])
+
+    def test_budget_category_kept_on_writes(self):
+        self.assertEqual(
+            dict(Activity.objects.values_list("title", "budget_category")),
+            {"Lunch": "meals", "Louvre": "activities", "TGV": "transport", "Misc": "other"},
+        )
+        misc = Activity.objects.get(title="Misc")
+        misc.category = "hotel"
+        misc.save(update_fields=["category"])
+        self.assertEqual(Activity.objects.get(pk=misc.pk).budget_category, "stay")
+        Activity.objects.filter(title="Misc").update(category="taxi")
+        self.assertEqual(Activity.objects.get(pk=misc.pk).budget_category, "transport")
+
+    def test_summary_is_one_grouped_query(self):
+        # trip lookup + the rollup rows (single currency: no FX lookup)
+        with self.assertNumQueries(2):
+            data = self.client.get(f"/api/trips/{self.trip.id}/budget/summary/").json()
+        self.assertEqual(data["currency"], "EUR")
+        self.assertEqual(data["total_minor"], 1550)
+        self.assertEqual(data["num_activities"], 4)
+        self.assertEqual(data["days"], 9)
+        self.assertEqual(data["avg_per_day_minor"], 172)
+        self.assertEqual(data["categories"], {"activities": 200, "meals": 300, "transport": 1000, "stay": 0, "other": 50})
+        self.assertEqual([c["city"]["name"] for c in data["per_city"]], ["City 0", "City 1", "City 2"])
+        self.assertEqual([c["total_minor"] for c in data["per_city"]], [500, 1050, 0])
+        self.assertEqual(data["per_city"][1]["categories"]["transport"], 1000)
+
+    def test_budget_total_reads_rollups(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(f"/api/trips/{self.trip.id}/budget/").json()
+        self.assertEqual(data, {"trip_id": self.trip.id, "currency": "EUR", "total_cost_minor": 1550, "unconverted_minor": {}})
+
+
+class BudgetRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="r", email="r@example.com", password="x")
+        make_trips(self.user, 2, n_stops=2, n_activities=3)
+        self.stop, self.other_stop = TripStop.objects.filter(trip__name="Trip 0").order_by("order")
+
+    def assertInSync(self):
+        self.assertEqual(TripBudgetRollup.objects.stored(), TripBudgetRollup.objects.expected())
+
+    def test_single_row_writes(self):
+        self.assertInSync()
+        activity = Activity.objects.create(trip_stop=self.stop, title="Hotel", category="hotel", cost_amount=900, currency="EUR")
+        self.assertInSync()
+        activity.cost_amount = 1000
+        activity.category = "food"
+        activity.save()
+        self.assertInSync()
+        activity.trip_stop = self.other_stop
+        activity.save()
+        self.assertInSync()
+        # First activity of a row deleted: the row's first id moves on
+        Activity.objects.filter(trip_stop=self.stop).order_by("id").first().delete()
+        self.assertInSync()
+        Activity.objects.get(pk=activity.pk).delete()
+        self.assertInSync()
+
+    def test_bulk_writes_and_cascades(self):
+        Activity.objects.filter(trip_stop=self.stop).update(cost_amount=5, currency="USD")
+        self.assertInSync()
+        Activity.objects.filter(trip_stop=self.stop).update(trip_stop=self.other_stop)
+        self.assertInSync()
+        acts = list(Activity.objects.filter(trip_stop=self.other_stop))
+        for a in acts:
+            a.category = "train"
+        Activity.objects.bulk_update(acts, ["category"])
+        self.assertInSync()
+        Activity.objects.filter(trip_stop=self.other_stop)[:1].get().delete()
+        self.other_stop.delete()
+        Trip.objects.filter(name="Trip 1").delete()
+        self.assertInSync()
+        self.assertFalse(TripBudgetRollup.objects.filter(trip__name="Trip 1").exists())
+
+    def test_queryset_delete_rebuilds_affected_stops_once(self):
+        doomed = Activity.objects.filter(trip_stop__trip__name="Trip 0", title__in=["Activity 0", "Activity 1"])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(signals.delete_activities(doomed), 4)
+        rollup_deletes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('DELETE FROM "trips_tripbudgetrollup"')]
+        self.assertEqual(len(rollup_deletes), 1)
+        self.assertInSync()
+        signals.delete_stops(TripStop.objects.filter(trip__name="Trip 1"))
+        self.assertInSync()
+        self.assertFalse(TripBudgetRollup.objects.filter(trip__name="Trip 1").exists())
+
+    def test_command_reports_and_repairs_drift(self):
+        TripBudgetRollup.objects.filter(stop=self.stop).update(amount=1)
+        out = io.StringIO()
+        call_command("budget_rollups", stdout=out)
+        self.assertIn("1 stop(s) drifted", out.getvalue())
+        call_command("budget_rollups", "--rebuild", stdout=io.StringIO())
+        self.assertInSync()
+        out = io.StringIO()
+        call_command("budget_rollups", stdout=out)
+        self.assertIn("match", out.getvalue())
+
+
+class MultiCurrencyBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fx", email="fx@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 1, n_stops=2, n_activities=0)
+        self.trip = Trip.objects.get()
+        first, second = self.trip.stops.order_by("order")
+        for stop, title, category, amount, currency in (
+            (first, "Dinner", "food", 10000, "EUR"),
+            (first, "Tour", "tour", 5000, "usd"),
+            (second, "Hotel", "hotel", 200000, "INR"),
+            (second, "Odd", "", 700, "XYZ"),
+        ):
+            Activity.objects.create(trip_stop=stop, title=title, category=category, cost_amount=amount, currency=currency)
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as fh:
+            fh.write("currency,rate\nUSD,1\nEUR,0.8\nINR,80\n")
+        call_command("load_fx_rates", fh.name, stdout=io.StringIO())
+
+    def test_converts_per_currency_in_constant_queries(self):
+        # trip, rollup rows, FX rates
+        with self.assertNumQueries(3):
+            data = self.client.get(f"/api/trips/{self.trip.id}/budget/summary/", {"currency": "usd"}).json()
+        self.assertEqual(data["currency"], "USD")
+        self.assertEqual(data["categories"], {"activities": 5000, "meals": 12500, "transport": 0, "stay": 2500, "other": 0})
+        self.assertEqual(data["total_minor"], 20000)
+        self.assertEqual([c["total_minor"] for c in data["per_city"]], [17500, 2500])
+        self.assertEqual(data["unconverted_minor"], {"XYZ": 700})
+        self.assertEqual(data["num_activities"], 4)
+
+    def test_defaults_to_trip_currency(self):
+        data = self.client.get(f"/api/trips/{self.trip.id}/budget/").json()
+        self.assertEqual(data["currency"], "EUR")
+        self.assertEqual(data["total_cost_minor"], 10000 + 4000 + 2000)
+
+    def test_unknown_target_is_400(self):
+        resp = self.client.get(f"/api/trips/{self.trip.id}/budget/", {"currency": "ABC"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_unknown_target_is_400_without_spend(self):
+        empty = Trip.objects.create(user=self.user, name="Empty", start_date=date(2025, 1, 1), end_date=date(2025, 1, 2))
+        for path in ("budget/", "budget/summary/"):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(f"/api/trips/{empty.id}/{path}", {"currency": "XYZ"}).status_code, 400)
+                self.assertEqual(self.client.get(f"/api/trips/{empty.id}/{path}", {"currency": "usd"}).json()["currency"], "USD")
+        # Without an explicit currency nothing is looked up
+        with self.assertNumQueries(0):
+            self.assertEqual(budget.fx_factors("XYZ", [], strict=False), {"XYZ": Decimal(1)})
+
+    def test_missing_rates_fall_back_to_per_currency_totals(self):
+        FxRate.objects.all().delete()
+        data = self.client.get(f"/api/trips/{self.trip.id}/budget/").json()
+        self.assertEqual(data["total_cost_minor"], 10000)
+        self.assertEqual(data["unconverted_minor"], {"USD": 5000, "INR": 200000, "XYZ": 700})
+        summary = self.client.get(f"/api/trips/{self.trip.id}/budget/summary/")
+        self.assertEqual(summary.status_code, 200)
+        self.assertEqual(summary.json()["total_minor"], 10000)
+        # An explicitly requested currency still needs a rate
+        self.assertEqual(self.client.get(f"/api/trips/{self.trip.id}/budget/", {"currency": "USD"}).status_code, 400)
+
+    def test_minor_units_scale_by_currency_exponent(self):
+        FxRate.objects.update_or_create(currency="JPY", defaults={"rate": 150})
+        Activity.objects.filter(title="Odd").update(currency="JPY", cost_amount=1500)
+        data = self.client.get(f"/api/trips/{self.trip.id}/budget/", {"currency": "USD"}).json()
+        # 1500 yen (no minor unit) = 10.00 USD = 1000 cents
+        self.assertEqual(data["total_cost_minor"], 12500 + 5000 + 2500 + 1000)
+        self.assertEqual(data["unconverted_minor"], {})
+        self.assertEqual(budget.fx_factors("JPY", ["USD"])["USD"], Decimal("1.5"))
+
+    def test_migration_seeds_an_empty_rate_table(self):
+        seed = importlib.import_module("trips.migrations.0018_seed_fx_rates").seed_fx_rates
+        seed(django_apps, None)
+        # Loaded rates are kept
+        self.assertEqual(FxRate.objects.get(currency="EUR").rate, Decimal("0.8"))
+        FxRate.objects.all().delete()
+        seed(django_apps, None)
+        self.assertEqual(FxRate.objects.get(currency="JPY").rate, Decimal("157.32"))
+
+    def test_bundled_rates_file_loads(self):
+        call_command("load_fx_rates", stdout=io.StringIO())
+        data = self.client.get(f"/api/trips/{self.trip.id}/budget/", {"currency": "INR"}).json()
+        self.assertGreater(data["total_cost_minor"], 200000)
+
+
+class BudgetOverviewTests(TestCase):
+    url = "/api/trips/budget/overview/"
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="o", email="o@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # 3 trips x 2 stops (Jan 1 and Jan 2) x 2 activities of 100 INR
+        make_trips(self.user, 3, n_stops=2, n_activities=2)
+        late = Trip.objects.create(user=self.user, name="March", start_date=date(2025, 3, 1), end_date=date(2025, 3, 5))
+        stop = TripStop.objects.create(trip=late, city=City.objects.first(), start_date=date(2025, 3, 1), end_date=date(2025, 3, 3))
+        Activity.objects.create(trip_stop=stop, title="Hotel", category="hotel", cost_amount=1000)
+        other = User.objects.create_user(username="o2", email="o2@example.com", password="x")
+        make_trips(other, 1, n_stops=1, n_activities=1)
+
+    def test_totals_months_and_trips_in_constant_queries(self):
+        # trips page, category x month aggregate, per-trip aggregate (single currency: no FX lookup)
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url).json()
+        self.assertEqual(data["currency"], "INR")
+        self.assertEqual(data["total_minor"], 2200)
+        self.assertEqual(data["num_activities"], 13)
+        self.assertEqual(data["categories"]["stay"], 1000)
+        self.assertEqual(data["months"], [{"month": "2025-01", "total_minor": 1200}, {"month": "2025-03", "total_minor": 1000}])
+        self.assertEqual([(t["name"], t["total_minor"]) for t in data["trips"]], [("March", 1000), ("Trip 2", 400), ("Trip 1", 400), ("Trip 0", 400)])
+
+    def test_without_rates(self):
+        FxRate.objects.all().delete()
+        Activity.objects.filter(trip_stop__trip__user=self.user).update(currency="EUR")
+        data = self.client.get(self.url).json()
+        # Everything in one currency: reported in it, no rate needed
+        self.assertEqual((data["currency"], data["total_minor"], data["unconverted_minor"]), ("EUR", 2200, {}))
+        Activity.objects.filter(title="Hotel").update(currency="INR")
+        data = self.client.get(self.url).json()
+        self.assertEqual((data["currency"], data["total_minor"], data["unconverted_minor"]), ("INR", 1000, {"EUR": 1200}))
+        self.assertEqual(self.client.get(self.url, {"currency": "USD"}).status_code, 400)
+
+    def test_unknown_currency_is_400_without_spend(self):
+        newcomer = User.objects.create_user(username="o3", email="o3@example.com", password="x")
+        self.client.force_authenticate(newcomer)
+        self.assertEqual(self.client.get(self.url, {"currency": "XYZ"}).status_code, 400)
+        data = self.client.get(self.url, {"currency": "EUR"}).json()
+        self.assertEqual((data["currency"], data["total_minor"]), ("EUR", 0))
+
+    def test_pagination_and_date_range(self):
+        first = self.client.get(self.url, {"page_size": 2}).json()
+        self.assertEqual(len(first["trips"]), 2)
+        self.assertEqual(first["total_minor"], 2200)
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([t["name"] for t in second["trips"]], ["Trip 1", "Trip 0"])
+
+        jan2 = self.client.get(self.url, {"from": "2025-01-02", "to": "2025-01-31"}).json()
+        self.assertEqual(jan2["total_minor"], 600)
+        self.assertEqual([t["total_minor"] for t in jan2["trips"]], [200, 200, 200])
+        self.assertEqual(self.client.get(self.url, {"from": "January"}).status_code, 400)
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="cal", email="cal@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Stops [Jan 1, Jan 3), [Jan 2, Jan 3), [Jan 3, Jan 4) in a trip of Jan 1-10
+        make_trips(self.user, 1, n_stops=3, n_activities=4)
+        TripStop.objects.filter(order=1).update(end_date=date(2025, 1, 3))
+        self.trip = Trip.objects.get()
+        self.url = f"/api/trips/{self.trip.id}/calendar/"
+
+    def test_full_calendar_in_constant_queries(self):
+        # trip, stops + cities, activities
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url).json()
+        self.assertEqual(data["total_days"], 9)
+        days = data["days"]
+        self.assertEqual(len(days), 9)
+        # Overlaps go to the earlier stop by order
+        self.assertEqual([d["city"]["name"] if d["city"] else None for d in days[:4]], ["City 0", "City 0", "City 2", None])
+        first_stop = TripStop.objects.get(order=1)
+        ids = list(first_stop.activities.order_by("id").values_list("id", flat=True))
+        # 4 activities spread over the stop's 2 days
+        self.assertEqual([a["id"] for a in days[0]["activities"]], ids[:2])
+        self.assertEqual([a["id"] for a in days[1]["activities"]], ids[2:])
+
+    def test_window(self):
+        data = self.client.get(self.url, {"from": "2025-01-03", "to": "2025-01-04"}).json()
+        self.assertEqual([(d["date"], d["day_index"]) for d in data["days"]], [("2025-01-03", 3), ("2025-01-04", 4)])
+        self.assertEqual(data["total_days"], 9)
+        self.assertEqual(self.client.get(self.url, {"from": "2026-01-01"}).json()["days"], [])
+        self.assertEqual(self.client.get(self.url, {"to": "soon"}).status_code, 400)
+
+
+class CalendarExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ics", email="ics@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_trips(self.user, 2, n_stops=2, n_activities=2)
+        self.trip = Trip.objects.order_by("id").first()
+        self.url = f"/api/trips/{self.trip.id}/calendar.ics"
+
+    def body(self, resp):
+        self.assertTrue(resp.streaming)
+        return b"".join(resp.streaming_content).decode()
+
+    def test_trip_ics_matches_calendar(self):
+        activity = Activity.objects.filter(trip_stop__trip=self.trip).order_by("id").first()
+        activity.start_time = time(9, 30)
+        activity.title = "Louvre, early; entry"
+        activity.save()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp["Content-Type"], "text/calendar; charset=utf-8")
+        text = self.body(resp)
+        self.assertTrue(text.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(text.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(text.count("BEGIN:VEVENT"), 2 + 4)
+        self.assertIn("SUMMARY:Louvre\\, early\\; entry", text)
+        self.assertIn("DTSTART:20250101T093000", text)
+        calendar = self.client.get(f"/api/trips/{self.trip.id}/calendar/").json()
+        for day in calendar["days"]:
+            for a in day["activities"]:
+                self.assertIn(f"UID:activity-{a['id']}@", text)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in text.split("\r\n")))
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Activity.objects.filter(trip_stop__trip=self.trip).first().delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_signed_feed(self):
+        url = self.client.get("/api/trips/calendar-feed/").json()["url"]
+        anon = APIClient()
+        resp = anon.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.body(resp).count("BEGIN:VEVENT"), 2 * (2 + 4))
+        self.assertEqual(anon.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+        self.assertEqual(anon.get(url.replace(".ics", "x.ics")).status_code, 404)
+
+
+class ReorderStopsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="ro", email="ro@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def trip_with(self, n_stops):
+        make_trips(self.user, 1, n_stops=n_stops, n_activities=1)
+        trip = Trip.objects.latest("id")
+        return trip, f"/api/trips/{trip.id}/stops/reorder/", list(trip.stops.order_by("order").values_list("id", flat=True))
+
+    def orders(self, trip):
+        return list(trip.stops.order_by("order").values_list("id", "order"))
+
+    def test_query_count_does_not_grow_with_stops(self):
+        counts = []
+        for n in (3, 12):
+            trip, url, ids = self.trip_with(n)
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(url, {"order": ids[::-1]}, format="json")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([s["id"] for s in resp.json()["stops"]], ids[::-1])
+            counts.append(len(ctx))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_duplicates_and_unlisted_stops(self):
+        trip, url, ids = self.trip_with(4)
+        self.client.post(url, {"order": [ids[2], ids[2], 999999, ids[0]]}, format="json")
+        self.assertEqual(self.orders(trip), [(ids[2], 1), (ids[0], 2), (ids[1], 3), (ids[3], 4)])
+        self.assertEqual(self.client.post(url, {"order": []}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(url, {"order": ["x"]}, format="json").status_code, 400)
+
+    def test_move_touches_one_row(self):
+        trip, url, ids = self.trip_with(4)
+        self.client.post(url, {"order": ids, "mode": "gap"}, format="json")
+        self.assertEqual([o for _, o in self.orders(trip)], [1024, 2048, 3072, 4096])
+        before = dict(trip.stops.values_list("id", "updated_at"))
+        resp = self.client.post(url, {"move": ids[3], "after": ids[0]}, format="json")
+        self.assertEqual([s["id"] for s in resp.json()["stops"]], [ids[0], ids[3], ids[1], ids[2]])
+        after = dict(trip.stops.values_list("id", "updated_at"))
+        self.assertEqual([i for i in ids if after[i] != before[i]], [ids[3]])
+        self.client.post(url, {"move": ids[1], "before": ids[0]}, format="json")
+        self.client.post(url, {"move": ids[2], "after": None}, format="json")
+        self.assertEqual([i for i, _ in self.orders(trip)], [ids[2], ids[1], ids[0], ids[3]])
+
+    def test_move_without_gap_renumbers(self):
+        trip, url, ids = self.trip_with(3)
+        self.client.post(url, {"move": ids[2], "after": ids[0]}, format="json")
+        self.assertEqual(self.orders(trip), [(ids[0], 1024), (ids[2], 2048), (ids[1], 3072)])
+        self.assertEqual(self.client.post(url, {"move": ids[0], "after": ids[0]}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(url, {"move": 999999}, format="json").status_code, 400)
+
+
+class CloneTripTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", email="owner@example.com", password="x")
+        self.user = User.objects.create_user(username="copier", email="copier@example.com", password="x")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tree(self, trip):
+        return [
+            (s.city_id, s.start_date, s.end_date, s.order, [(a.title, a.category, a.cost_amount, a.currency) for a in s.activities.order_by("id")])
+            for s in trip.stops.order_by("order")
+        ]
+
+    def copy(self, trip):
+        return self.client.post(f"/api/public/itineraries/{trip.public_slug}/copy")
+
+    def test_copy_in_constant_queries(self):
+        make_trips(self.owner, 1, n_stops=2, n_activities=2)
+        small = Trip.objects.latest("id")
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.copy(small).status_code, 200)
+        make_trips(self.owner, 1, n_stops=8, n_activities=6)
+        large = Trip.objects.latest("id")
+        with CaptureQueriesContext(connection) as many:
+            new_id = self.copy(large).json()["trip_id"]
+        self.assertEqual(len(few), len(many))
+        copy = Trip.objects.get(pk=new_id)
+        self.assertEqual((copy.user, copy.is_public, copy.public_slug, copy.origin_city_id), (self.user, False, None, large.origin_city_id))
+        self.assertEqual(self.tree(copy), self.tree(large))
+        stop_ids = set(copy.stops.values_list("id", flat=True))
+        self.assertEqual(TripBudgetRollup.objects.stored(stop_ids), TripBudgetRollup.objects.expected(stop_ids))
+        self.assertEqual(self.client.get(f"/api/trips/{copy.id}/budget/").json()["total_cost_minor"], 8 * 6 * 100)
+
+    def test_duplicate_own_trip(self):
+        make_trips(self.user, 1, n_stops=2, n_activities=3)
+        trip = Trip.objects.get()
+        resp = self.client.post(f"/api/trips/{trip.id}/duplicate/", {}, format="json")
+        copy = Trip.objects.get(pk=resp.json()["trip_id"])
+        self.assertEqual(copy.name, "Trip 0 (copy)")
+        self.assertEqual(self.tree(copy), self.tree(trip))
+        other = Trip.objects.create(user=self.owner, name="Theirs", start_date=date(2025, 1, 1), end_date=date(2025, 1, 2))
+        self.assertEqual(self.client.post(f"/api/trips/{other.id}/duplicate/").status_code, 404)
+
+    def test_admin_action(self):
+        make_trips(self.owner, 2, n_stops=1, n_activities=1)
+        admin_user = User.objects.create_superuser(username="admin", email="admin@example.com", password="x")
+        self.client.force_login(admin_user)
+        ids = list(Trip.objects.values_list("id", flat=True))
+        resp = self.client.post("/admin/trips/trip/", {"action": "duplicate_trips", "_selected_action": ids})
+        self.assertEqual(resp.status_code, 302)
+        copies = Trip.objects.exclude(id__in=ids)
+        self.assertEqual(sorted(copies.values_list("name", flat=True)), ["Trip 0 (copy)", "Trip 1 (copy)"])
+        self.assertTrue(all(c.user == self.owner and c.stops.count() == 1 for c in copies))
+
+
+class GenerationWriteTests(TestCase):
+    # Lock, city lookup, stop/activity inserts and the rollup rebuild (with savepoints)
+    GENERATE_QUERIES = 15
+    # + the old tree: ids/owners, collector reads, rollup/activity/stop deletes, tombstones, touch
+    REGENERATE_QUERIES = 21
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="g", email="g@example.com", password="x")
+        for i in range(10):
+            City.objects.create(name=f"City {i}", country="X")
+
+    def trip(self):
+        return Trip.objects.create(user=self.user, name="Gen", start_date=date(2025, 1, 1), end_date=date(2025, 3, 1))
+
+    def plan(self, trip, n_stops, n_activities):
+        plan = generation.layout_stops(trip.start_date, [f"City {i}" for i in range(n_stops)], 2)
+        for p in plan:
+            p.activities = [generation.PlannedActivity(title=f"Act {j}", category="food", cost_amount=100) for j in range(n_activities)]
+        return plan
+
+    def test_generate_and_regenerate_in_constant_queries(self):
+        for n_stops, n_activities in ((2, 2), (10, 5)):
+            trip = self.trip()
+            with self.assertNumQueries(self.GENERATE_QUERIES):
+                generation.persist_itinerary(trip, self.plan(trip, n_stops, n_activities), "INR")
+            with self.assertNumQueries(self.REGENERATE_QUERIES):
+                generation.persist_itinerary(trip, self.plan(trip, 10 - n_stops + 2, n_activities), "INR")
+            self.assertEqual(trip.stops.count(), 10 - n_stops + 2)
+            self.assertEqual(TripBudgetRollup.objects.stored(), TripBudgetRollup.objects.expected())
+
+    def test_clone_in_constant_queries(self):
+        for n_stops, n_activities in ((2, 2), (10, 5)):
+            source = self.trip()
+            generation.persist_itinerary(source, self.plan(source, n_stops, n_activities), "INR")
+            source = Trip.objects.get(pk=source.pk)
+            # two reads, trip insert, stop and activity inserts and the rollup rebuild
+            with self.assertNumQueries(14):
+                copy = clone_trip(source, self.user)
+            self.assertEqual(copy.stops.count(), n_stops)
+
+    def test_days_per_city_is_validated(self):
+        trip = self.trip()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for bad in ("abc", "0", "-1", "31", "1e9", "2.5"):
+            with self.subTest(days_per_city=bad):
+                resp = client.post(f"/api/trips/{trip.id}/generate/", {"days_per_city": bad}, format="json")
+                self.assertEqual(resp.status_code, 400)
+                self.assertIn("days_per_city", resp.json()["error"])
+                resp = client.get(f"/api/trips/{trip.id}/generate/stream/?days_per_city={bad}", HTTP_ACCEPT="text/event-stream")
+                self.assertEqual(resp.status_code, 400)
+                self.assertEqual(parse_sse([resp.content.decode()])[0][0], "error")
+        for bad in (0, 31, 2.5, True):
+            with self.subTest(days_per_city=bad):
+                resp = client.post(f"/api/trips/{trip.id}/generate/", {"days_per_city": bad}, format="json")
+                self.assertEqual(resp.status_code, 400)
+        self.assertFalse(GenerationJob.objects.exists())
+        self.assertEqual(generation.parse_days_per_city(None), generation.DEFAULT_DAYS_PER_CITY)
+        self.assertEqual(generation.parse_days_per_city(""), generation.DEFAULT_DAYS_PER_CITY)
+        self.assertEqual(generation.parse_days_per_city("30"), 30)
+        self.assertEqual(generation.parse_days_per_city(3.0), 3)
+
+
+ITINERARY = {
+    "cities": [{"name": "City 0"}, {"name": "City 1"}],
+    "perCity": {
+        "City 0": {"activities": [{"title": 'Say "hi" {here}', "category": "food", "cost_minor": 500}]},
+        "City 1": {"activities": [{"title": "Walk [around]", "category": "sightseeing", "cost_minor": 0}]},
+    },
+}
+
+
+class FakeStream:
+    """Stands in for a streamed ``requests`` response carrying ``text`` in small deltas."""
+
+    def __init__(self, text, size=7):
+        self.lines = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": text[i:i + size]}}]})
+            for i in range(0, len(text), size)
+        ] + ["data: [DONE]"]
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            yield line
+            yield ""
+
+
+def parse_sse(frames):
+    events = []
+    for frame in frames:
+        head, data = frame.strip().split("\n", 1)
+        events.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+class IncrementalJSONScannerTests(TestCase):
+    def feed_all(self, text, size):
+        scanner = IncrementalJSONScanner()
+        done = []
+        for i in range(0, len(text), size):
+            done += scanner.feed(text[i:i + size])
+        return scanner, done
+
+    def test_reports_same_containers_for_any_chunking(self):
+        text = "```json\n" + json.dumps(ITINERARY) + "\n```"
+        expected = None
+        for size in (1, 2, 5, len(text)):
+            scanner, done = self.feed_all(text, size)
+            self.assertTrue(scanner.complete)
+            paths = [path for path, _ in done]
+            expected = expected or paths
+            self.assertEqual(paths, expected)
+        self.assertEqual(expected, [
+            ("cities", 0), ("cities", 1), ("cities",),
+            ("perCity", "City 0"), ("perCity", "City 1"), ("perCity",), (),
+        ])
+        raw = dict(done)
+        self.assertEqual(json.loads(raw[("perCity", "City 0")]), ITINERARY["perCity"]["City 0"])
+
+    def test_escaped_quotes_and_brackets_inside_strings(self):
+        text = json.dumps({'a"{': {"b": "]}\\"}, "c": ['"', "}"]})
+        scanner, done = self.feed_all(text, 1)
+        self.assertTrue(scanner.complete)
+        self.assertEqual([path for path, _ in done], [('a"{',), ("c",), ()])
+        self.assertEqual(json.loads(done[-1][1]), json.loads(text))
+
+    def test_truncated_stream_reports_only_closed_containers(self):
+        text = json.dumps(ITINERARY)
+        cut = text.index('"City 1": {') + 12
+        scanner, done = self.feed_all(text[:cut], 3)
+        self.assertFalse(scanner.complete)
+        self.assertEqual([path for path, _ in done], [("cities", 0), ("cities", 1), ("cities",), ("perCity", "City 0")])
+
+
+class StreamItineraryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="s", email="s@example.com", password="x")
+        for i in range(3):
+            City.objects.create(name=f"City {i}", country="X")
+        self.trip = Trip.objects.create(user=self.user, name="Stream", start_date=date(2025, 1, 1), end_date=date(2025, 1, 10))
+        self.job, _ = submit_generation(self.trip, self.user, 2, "INR", inline=True)
+        patcher = mock.patch.object(llm, "api_key", return_value="test-key")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, response):
+        return mock.patch("gt_backend.http_client.post", return_value=response)
+
+    def test_event_sequence(self):
+        with self.stream(FakeStream(json.dumps(ITINERARY))):
+            events = parse_sse(stream_itinerary(self.trip, 2, "INR", job=self.job))
+        self.assertEqual([name for name, _ in events], ["status", "status", "stop", "stop", "done"])
+        self.assertEqual([data.get("stage") for _, data in events[:2]], ["planning", "streaming"])
+        self.assertEqual([data["city"]["name"] for _, data in events[2:4]], ["City 0", "City 1"])
+        self.assertEqual(events[2][1]["activities"][0]["title"], 'Say "hi" {here}')
+        self.assertEqual(events[-1][1]["status"], "generated")
+        self.assertEqual(len(events[-1][1]["stops"]), 2)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(self.job.source, "openrouter")
+
+    def test_truncated_stream_keeps_persisted_stops(self):
+        text = json.dumps(ITINERARY)
+        with self.stream(FakeStream(text[:text.index('"City 1": {') + 12])):
+            events = parse_sse(stream_itinerary(self.trip, 2, "INR", job=self.job))
+        self.assertEqual([name for name, _ in events], ["status", "status", "stop", "done"])
+        self.assertEqual(self.trip.stops.count(), 1)
+
+    def test_disconnect_fails_job_and_reopens_probing_breaker(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        CircuitBreakerState.objects.create(name="openrouter", state=CircuitBreakerState.STATE_OPEN, failures=3, opened_at=long_ago)
+        with self.stream(FakeStream(json.dumps(ITINERARY))):
+            events = stream_itinerary(self.trip, 2, "INR", job=self.job)
+            for frame in events:
+                if frame.startswith("event: stop"):
+                    break
+            events.close()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, GenerationJob.STATUS_FAILED)
+        row = CircuitBreakerState.objects.get(name="openrouter")
+        self.assertEqual(row.state, CircuitBreakerState.STATE_OPEN)
+        self.assertGreater(row.opened_at, long_ago)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.now = timezone.now()
+        patcher = mock.patch("django.utils.timezone.now", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def breaker(self):
+        # A fresh instance per caller, as openrouter_breaker() hands out
+        return CircuitBreaker("test", failure_threshold=3, reset_seconds=60, probe_timeout_seconds=30)
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def state(self):
+        return self.breaker().state()["state"]
+
+    def trip_open(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker().allow_request())
+            self.breaker().record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker().record_failure()
+        self.breaker().record_failure()
+        self.breaker().record_success()
+        self.breaker().record_failure()
+        self.breaker().record_failure()
+        self.assertEqual(self.state(), CircuitBreakerState.STATE_CLOSED)
+        self.breaker().record_failure()
+        self.assertEqual(self.state(), CircuitBreakerState.STATE_OPEN)
+        self.assertFalse(self.breaker().allow_request())
+        self.assertEqual(metrics.snapshot()["counters"]["breaker.test.opened"], 1)
+
+    def test_admits_a_single_probe_after_cool_down(self):
+        self.trip_open()
+        self.advance(59)
+        self.assertFalse(self.breaker().allow_request())
+        self.advance(2)
+        probe, other = self.breaker(), self.breaker()
+        self.assertTrue(probe.allow_request())
+        self.assertTrue(probe.probing)
+        self.assertFalse(other.allow_request())
+        self.assertFalse(other.probing)
+        self.assertEqual(self.state(), CircuitBreakerState.STATE_HALF_OPEN)
+
+    def test_probe_success_closes(self):
+        self.trip_open()
+        self.advance(61)
+        probe = self.breaker()
+        self.assertTrue(probe.allow_request())
+        probe.record_success()
+        self.assertEqual(self.breaker().state(), {"state": CircuitBreakerState.STATE_CLOSED, "failures": 0, "opened_at": None})
+        self.assertTrue(self.breaker().allow_request())
+
+    def test_probe_failure_reopens_for_a_full_cool_down(self):
+        self.trip_open()
+        self.advance(61)
+        probe = self.breaker()
+        self.assertTrue(probe.allow_request())
+        probe.record_failure()
+        self.assertEqual(self.breaker().state()["opened_at"], self.now)
+        self.assertEqual(metrics.snapshot()["counters"]["breaker.test.reopened"], 1)
+        self.advance(59)
+        self.assertFalse(self.breaker().allow_request())
+        self.advance(2)
+        self.assertTrue(self.breaker().allow_request())
+
+    def test_silent_probe_is_reclaimed_after_probe_timeout(self):
+        self.trip_open()
+        self.advance(61)
+        self.assertTrue(self.breaker().allow_request())
+        self.advance(29)
+        self.assertFalse(self.breaker().allow_request())
+        self.advance(2)
+        probe, other = self.breaker(), self.breaker()
+        self.assertTrue(probe.allow_request())
+        self.assertTrue(probe.probing)
+        self.assertFalse(other.allow_request())
+        self.assertEqual(self.state(), CircuitBreakerState.STATE_HALF_OPEN)
+
+
+class GenerationIdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="i", email="i@example.com", password="x")
+        for i in range(3):
+            City.objects.create(name=f"City {i}", country="X")
+        self.trip = Trip.objects.create(user=self.user, name="Idem", start_date=date(2025, 1, 1), end_date=date(2025, 1, 10))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/trips/{self.trip.id}/generate/"
+        patcher = mock.patch.object(llm, "api_key", return_value="")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def job(self, **kwargs):
+        return GenerationJob.objects.create(trip=self.trip, user=self.user, **kwargs)
+
+    def generate(self, key, **body):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, body, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_one_active_job_per_trip(self):
+        self.job(status=GenerationJob.STATUS_FAILED)
+        self.job(status=GenerationJob.STATUS_SUCCEEDED)
+        self.job(status=GenerationJob.STATUS_QUEUED)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.job(status=GenerationJob.STATUS_RUNNING)
+
+    def test_idempotency_key_unique_per_trip_unless_blank(self):
+        self.job(status=GenerationJob.STATUS_FAILED)
+        self.job(status=GenerationJob.STATUS_FAILED)
+        self.job(status=GenerationJob.STATUS_FAILED, idempotency_key="k")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.job(status=GenerationJob.STATUS_SUCCEEDED, idempotency_key="k")
+
+    def test_losing_the_insert_race_attaches_to_the_winner(self):
+        winner = self.job(status=GenerationJob.STATUS_RUNNING)
+        real = jobs.attachable_job
+        # The first lookup runs before the concurrent request's insert commits
+        calls = iter([lambda trip, key: None, real])
+        with mock.patch.object(jobs, "attachable_job", side_effect=lambda trip, key: next(calls)(trip, key)):
+            job, created = submit_generation(self.trip, self.user, 2, "INR", inline=True)
+        self.assertFalse(created)
+        self.assertEqual(job.id, winner.id)
+        self.assertEqual(GenerationJob.objects.count(), 1)
+
+    def test_replay_returns_the_original_result(self):
+        first = self.generate("k1")
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", first)
+        replay = self.generate("k1", force=True)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(GenerationJob.objects.count(), 1)
+
+    def test_replay_after_regeneration_conflicts(self):
+        first = self.generate("k1")
+        second = self.generate("k2", force=True)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.json()["job_id"], first.json()["job_id"])
+        replay = self.generate("k1", force=True)
+        self.assertEqual(replay.status_code, 409)
+        self.assertEqual(replay.json()["status"], "superseded")
+        self.assertEqual(replay.json()["job_id"], first.json()["job_id"])
+        status = self.client.get(f"{self.url}jobs/{first.json()['job_id']}/").json()
+        self.assertEqual((status["status"], status["error"], status["stops"]), ("superseded", jobs.SUPERSEDED_ERROR, None))
+        status = self.client.get(f"{self.url}jobs/{second.json()['job_id']}/").json()
+        self.assertEqual(status["status"], GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(status["stops"], second.json()["stops"])
+
+    def test_attaching_without_a_matching_key_is_not_a_replay(self):
+        running = self.job(status=GenerationJob.STATUS_RUNNING, idempotency_key="k1")
+        for key in ("", "k2"):
+            with self.subTest(key=key):
+                resp = self.generate(key)
+                self.assertEqual(resp.status_code, 202)
+                self.assertEqual(resp.json()["job_id"], running.id)
+                self.assertNotIn("Idempotent-Replayed", resp)
+        self.assertEqual(self.generate("k1")["Idempotent-Replayed"], "true")
+
+
+class GenerationJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="q", email="q@example.com", password="x")
+        self.trips = [
+            Trip.objects.create(user=self.user, name=f"Q{i}", start_date=date(2025, 1, 1), end_date=date(2025, 1, 10))
+            for i in range(3)
+        ]
+
+    def job(self, trip, **kwargs):
+        return GenerationJob.objects.create(trip=trip, user=self.user, **kwargs)
+
+    def age(self, job, minutes):
+        GenerationJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_claims_oldest_queued_job_once(self):
+        self.job(self.trips[0], status=GenerationJob.STATUS_FAILED)
+        first = self.job(self.trips[1])
+        second = self.job(self.trips[2])
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.stage), (GenerationJob.STATUS_RUNNING, "claimed"))
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(jobs.claim_next_job().id, second.id)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_requeues_only_stale_worker_jobs(self):
+        stale = self.job(self.trips[0], status=GenerationJob.STATUS_RUNNING)
+        fresh = self.job(self.trips[1], status=GenerationJob.STATUS_RUNNING)
+        inline = self.job(self.trips[2], status=GenerationJob.STATUS_RUNNING, inline=True)
+        self.age(stale, 11)
+        self.age(inline, 11)
+        self.assertEqual(jobs.requeue_stale_jobs(timedelta(minutes=10)), 1)
+        statuses = dict(GenerationJob.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {
+            stale.id: GenerationJob.STATUS_QUEUED,
+            fresh.id: GenerationJob.STATUS_RUNNING,
+            inline.id: GenerationJob.STATUS_RUNNING,
+        })
+        self.assertEqual(jobs.claim_next_job().id, stale.id)
+
+    def test_fails_abandoned_inline_jobs(self):
+        abandoned = self.job(self.trips[0], status=GenerationJob.STATUS_RUNNING, inline=True)
+        running = self.job(self.trips[1], status=GenerationJob.STATUS_RUNNING, inline=True)
+        self.age(abandoned, 11)
+        self.assertEqual(jobs.fail_abandoned_jobs(timedelta(minutes=10)), 1)
+        abandoned.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual(abandoned.status, GenerationJob.STATUS_FAILED)
+        self.assertEqual(running.status, GenerationJob.STATUS_RUNNING)
+
+    def test_attached_requests_do_not_wait(self):
+        trip = self.trips[0]
+        job, created = submit_generation(trip, self.user, 2, "INR", inline=True)
+        self.assertTrue(created)
+        self.assertTrue(job.inline)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        resp = client.post(f"/api/trips/{trip.id}/generate/", {}, format="json")
+        self.assertEqual(resp.status_code, 202)
+        self.assertNotIn("Idempotent-Replayed", resp)
+        self.assertEqual(resp.json()["job_id"], job.id)
+        self.assertTrue(resp.json()["poll_url"].endswith(f"/api/trips/{trip.id}/generate/jobs/{job.id}/"))
+        resp = client.get(f"/api/trips/{trip.id}/generate/stream/", HTTP_ACCEPT="text/event-stream")
+        self.assertEqual(parse_sse(frame.decode() for frame in resp.streaming_content), [("status", {
+            "stage": "attached", "job_id": job.id, "status": GenerationJob.STATUS_RUNNING,
+            "poll_url": resp.wsgi_request.build_absolute_uri(f"/api/trips/{trip.id}/generate/jobs/{job.id}/"),
+        })])
+
+
+@skipUnless(importlib.util.find_spec("orjson"), "orjson is not installed")
+class ORJSONRendererTests(TestCase):
+    def test_matches_drf_json_renderer(self):
+        from gt_backend.renderers import ORJSONParser, ORJSONRenderer
+
+        user = User.objects.create_user(username="r", email="r@example.com", password="x")
+        make_trips(user, 1, n_stops=3, n_activities=2)
+        trip = Trip.objects.get()
+        Activity.objects.filter(trip_stop__trip=trip).update(start_time=time(9, 30), notes="Café ☕")
+        moment = datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc)
+        data = {
+            "trip": TripSerializer(Trip.objects.get(pk=trip.pk)).data,
+            "raw": {
+                "utc": moment,
+                "offset": moment.astimezone(dt_timezone(timedelta(hours=5, minutes=30))),
+                "naive": moment.replace(tzinfo=None, microsecond=0),
+                "date": date(2025, 1, 2),
+                "time": time(9, 30, 0, 250),
+                "decimal": Decimal("12.345678"),
+                "lazy": gettext_lazy("Trips"),
+                "duration": timedelta(minutes=90),
+                1: "int key",
+            },
+        }
+        rendered = ORJSONRenderer().render(data)
+        self.assertEqual(rendered, JSONRenderer().render(data))
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(rendered)), json.loads(rendered))
+
+
+@override_settings(LLM_CACHE_TTL_SECONDS=3600, LLM_CACHE_MAX_ENTRIES=2)
+class LLMResponseCacheTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.now = timezone.now()
+        patcher = mock.patch("django.utils.timezone.now", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+    def test_key_normalizes_prompt_whitespace_and_case(self):
+        key = llm_cache.cache_key("Model/X", [{"role": "User", "content": "  Plan a\n\ttrip  "}], {"temperature": 0.6})
+        self.assertEqual(key, llm_cache.cache_key("model/x ", [{"role": "user", "content": "Plan a trip"}], {"temperature": 0.6}))
+        self.assertNotEqual(key, llm_cache.cache_key("model/x", [{"role": "user", "content": "Plan a trip!"}], {"temperature": 0.6}))
+        self.assertNotEqual(key, llm_cache.cache_key("model/x", [{"role": "user", "content": "Plan a trip"}], {"temperature": 0.7}))
+        self.assertNotEqual(key, llm_cache.cache_key("model/x", [{"role": "system", "content": "Plan a trip"}], {"temperature": 0.6}))
+
+    def test_entries_expire_after_ttl(self):
+        llm_cache.put("k", "m", {"a": 1})
+        self.advance(3599)
+        self.assertEqual(llm_cache.get("k"), {"a": 1})
+        self.advance(2)
+        self.assertIsNone(llm_cache.get("k"))
+        self.assertEqual(llm_cache.evict(), 1)
+        self.assertFalse(LLMResponseCache.objects.exists())
+
+    def test_evicts_least_recently_used_beyond_max_entries(self):
+        for key in ("a", "b"):
+            llm_cache.put(key, "m", {"key": key})
+            self.advance(1)
+        llm_cache.get("a")
+        self.advance(1)
+        llm_cache.put("c", "m", {"key": "c"})
+        self.assertEqual(set(LLMResponseCache.objects.values_list("key", flat=True)), {"a", "c"})
+        self.assertEqual(metrics.snapshot()["counters"]["llm_cache.evictions"], 1)
+
+    def test_stats_count_hits_misses_and_saved_latency(self):
+        llm_cache.put("k", "m", {"a": 1}, latency_ms=1500)
+        llm_cache.get("k")
+        llm_cache.get("k")
+        llm_cache.get("missing")
+        stats = llm_cache.stats()
+        self.assertEqual((stats["entries"], stats["stored_hits"], stats["stored_latency_saved_ms"]), (1, 2, 3000))
+        self.assertEqual((stats["process_hits"], stats["process_misses"], stats["process_latency_saved_ms"]), (2, 1, 3000))
+
+
+class CachedGenerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="c", email="c@example.com", password="x")
+        for i in range(3):
+            City.objects.create(name=f"City {i}", country="X")
+        self.trip = Trip.objects.create(user=self.user, name="Cached", start_date=date(2025, 1, 1), end_date=date(2025, 1, 10))
+        messages = generation.itinerary_messages(None, 2, "INR")
+        llm_cache.put(generation.itinerary_cache_key(messages), generation.GENERATE_MODEL, ITINERARY, latency_ms=30000)
+        for patcher in (
+            mock.patch.object(llm, "api_key", return_value="test-key"),
+            mock.patch("gt_backend.http_client.post"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_generate_serves_cached_payload(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(f"/api/trips/{self.trip.id}/generate/", {"days_per_city": 2, "currency": "INR"}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([s["city"]["name"] for s in resp.json()["stops"]], ["City 0", "City 1"])
+        self.assertEqual(GenerationJob.objects.get().source, "openrouter")
+        http_client.post.assert_not_called()
+
+    def test_stream_serves_cached_payload(self):
+        job, _ = submit_generation(self.trip, self.user, 2, "INR", inline=True)
+        events = parse_sse(stream_itinerary(self.trip, 2, "INR", job=job))
+        self.assertEqual([name for name, _ in events], ["status", "status", "stop", "stop", "done"])
+        self.assertEqual(events[1][1], {"stage": "persisting", "source": "openrouter", "cached": True})
+        http_client.post.assert_not_called()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 endpoint answering every request with ``server.status``."""
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        self.server.hits.append(self.command)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = b"{}"
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(HTTP_CLIENT_RETRIES=2, HTTP_CLIENT_BACKOFF=0, HTTP_CLIENT_CONNECT_TIMEOUT=1.5, HTTP_CLIENT_READ_TIMEOUT=7)
+class HttpClientTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        http_client._sessions.clear()
+        self.addCleanup(http_client._sessions.clear)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.status, self.server.hits = 200, []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def test_one_session_per_host(self):
+        session = http_client.session_for(self.url + "/a")
+        self.assertIs(http_client.session_for(self.url + "/b?x=1"), session)
+        self.assertIsNot(http_client.session_for("https://openrouter.ai/api"), session)
+        self.assertEqual(len(http_client._sessions), 2)
+
+    def test_retries_only_idempotent_methods(self):
+        self.server.status = 503
+        self.assertEqual(http_client.get(self.url).status_code, 503)
+        self.assertEqual(self.server.hits, ["GET"] * 3)
+        self.server.hits.clear()
+        self.assertEqual(http_client.post(self.url, json={}).status_code, 503)
+        self.assertEqual(self.server.hits, ["POST"])
+
+    def test_default_timeouts(self):
+        with mock.patch("requests.Session.request") as request:
+            http_client.get(self.url)
+            http_client.post(self.url, timeout=(1, 2))
+        self.assertEqual(request.call_args_list[0].kwargs["timeout"], (1.5, 7))
+        self.assertEqual(request.call_args_list[1].kwargs["timeout"], (1, 2))
+
+    def test_stats_count_new_and_reused_connections(self):
+        for _ in range(3):
+            http_client.get(self.url)
+        http_client.post(self.url, json={})
+        stats = http_client.stats()[f"127.0.0.1:{self.server.server_port}"]
+        self.assertEqual((stats["requests"], stats["errors"]), (4, 0))
+        self.assertEqual((stats["new_connections"], stats["reused_connections"]), (1, 3))
+
+    @override_settings(HTTP_CLIENT_POOL_MAXSIZE=3)
+    def test_pool_size_is_a_bound(self):
+        adapter = http_client.session_for(self.url).get_adapter(self.url)
+        self.assertEqual((adapter._pool_maxsize, adapter._pool_block), (3, True))
+
+
+class CatalogIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="cat", password="x")
+        self.goa = City.objects.create(name="Goa", country="India")
+        ActivityCatalog.objects.create(title="Spa", category="wellness", avg_cost=900, duration_minutes=60)
+        for title, category, cost, minutes in [
+            ("Fort", "sights", 300, 120), ("Beach", "outdoors", 0, 240), ("Market", "sights", 300, 45),
+            ("Kayak", "outdoors", 500, 90), ("Museum", "sights", 700, 60),
+        ]:
+            ActivityCatalog.objects.create(title=title, category=category, avg_cost=cost, duration_minutes=minutes, city=self.goa)
+        self.trip = Trip.objects.create(user=self.user, name="Coast", start_date=date(2025, 1, 1), end_date=date(2025, 1, 5))
+
+    def titles(self, city_name, limit=3):
+        return [item.title for item in catalog_index.get_index().pick(city_name, limit)]
+
+    def test_picks_match_city_ordered_by_cost_and_duration(self):
+        # Best of each category first (cheapest, then shortest), then the runners-up
+        self.assertEqual(self.titles("goa", 5), ["Beach", "Market", "Kayak", "Fort", "Museum"])
+        self.assertEqual(self.titles("Goa", 2), ["Beach", "Market"])
+        self.assertEqual(catalog_index.get_index().destinations, ["Goa"])
+
+    def test_unknown_city_falls_back_to_first_catalog_rows(self):
+        self.assertEqual(self.titles("Atlantis"), ["Spa", "Fort", "Beach"])
+        self.assertEqual(self.titles(""), ["Spa", "Fort", "Beach"])
+
+    def test_heuristic_plan_needs_no_queries_once_loaded(self):
+        with self.assertNumQueries(1):
+            catalog_index.get_index()
+        with self.assertNumQueries(0):
+            plan = generation.plan_heuristic(self.trip, ["Goa", "Atlantis"], 2)
+        self.assertEqual([a.title for a in plan[0].activities], ["Beach", "Market", "Kayak"])
+        self.assertEqual([a.title for a in plan[1].activities], ["Spa", "Fort", "Beach"])
+        self.assertEqual(plan[1].end_date, date(2025, 1, 5))
+
+    def test_catalog_save_and_delete_reload_the_index(self):
+        first = catalog_index.get_index()
+        version = cache.get(catalog_index.VERSION_KEY)
+        cheap = ActivityCatalog.objects.create(title="Sunset", category="outdoors", avg_cost=0, duration_minutes=30, city=self.goa)
+        self.assertEqual(cache.get(catalog_index.VERSION_KEY), version + 1)
+        self.assertIsNot(catalog_index.get_index(), first)
+        self.assertEqual(self.titles("Goa", 1), ["Sunset"])
+        cheap.delete()
+        self.assertEqual(cache.get(catalog_index.VERSION_KEY), version + 2)
+        self.assertEqual(self.titles("Goa", 1), ["Beach"])
+
+    def test_version_bump_from_another_process_reloads(self):
+        first = catalog_index.get_index()
+        self.assertIs(catalog_index.get_index(), first)
+        cache.incr(catalog_index.VERSION_KEY)
+        self.assertIsNot(catalog_index.get_index(), first)
 
-# Create your tests here.
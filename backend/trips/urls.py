@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested.routers import NestedDefaultRouter
-from .views import TripViewSet, TripStopViewSet, ActivityViewSet, CityViewSet, public_itinerary, search_cities, personalized_recs, search_activities, copy_public_itinerary
+from .views import TripViewSet, TripStopViewSet, ActivityViewSet, CityViewSet, public_itinerary, search_cities, personalized_recs, search_activities, copy_public_itinerary, service_metrics, sync_changes, calendar_feed
 
 
 router = DefaultRouter()
@@ -24,5 +24,8 @@ urlpatterns = [
     path('search/cities', search_cities, name='search-cities'),
     path('search/activities', search_activities, name='search-activities'),
     path('recs/personalized/', personalized_recs, name='personalized-recs'),
+    path('calendar/feed/<str:token>.ics', calendar_feed, name='calendar-feed'),
+    path('sync', sync_changes, name='sync'),
+    path('metrics', service_metrics, name='service-metrics'),
 ]
 
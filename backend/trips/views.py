@@ -1,21 +1,103 @@
 from rest_framework import viewsets, permissions, decorators, response, filters
 from rest_framework.throttling import ScopedRateThrottle
-from .models import Trip, TripStop, Activity, City, ExternalPlace, PersonalizedRec, ActivityCatalog
-from .serializers import TripSerializer, TripStopSerializer, ActivitySerializer, CitySerializer
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from .models import Trip, TripStop, Activity, City, ExternalPlace, PersonalizedRec, ActivityCatalog, GenerationJob
+from .serializers import request_shape, shape_key, TripSerializer, TripSummarySerializer, TripStopSerializer, ActivitySerializer, CitySerializer, GenerationJobSerializer
+from .jobs import SUPERSEDED_ERROR, attachable_job, job_stops, run_job, submit_generation
+from .generation import parse_days_per_city
+from . import llm, llm_cache, public_cache, reorder, samples, snapshots, sync
+from .signals import trip_tree_changed
+from .circuit_breaker import openrouter_breaker
+from .pagination import TripCursorPagination
+from .schedule import build_calendar
+from .ics import ICalendarRenderer, calendar_lines, feed_token, feed_user_id
+from .cloning import clone_trip
+from .budget import UnknownCurrency, spend_overview, trip_summary, trip_total
+from .conditional import ConditionalRetrieveMixin, not_modified, set_validators, tree_validators, with_variant
+from .streaming import EventStreamRenderer, attached_events, sse, stream_itinerary
+from gt_backend import http_client, metrics
+from django.core import signing
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-import requests
-import os
+from django.urls import reverse
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 import logging
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes, OpenApiExample
 
 
-class TripViewSet(viewsets.ModelViewSet):
+SHAPE_PARAMETERS = [
+    OpenApiParameter("fields", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Comma-separated fields to include, dotted for nested (e.g. name,stops.city)"),
+    OpenApiParameter("expand", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Relations to include: stops, stops.activities, stops.city, origin_city (default: all)"),
+]
+
+BUDGET_CURRENCY_PARAMETER = OpenApiParameter(
+    "currency", OpenApiTypes.STR, OpenApiParameter.QUERY,
+    description="Convert amounts to this ISO currency using the FX rate table (default: the trip's currency)",
+)
+
+
+def _int_or_none(value):
+    """Stop id from a JSON body value; raises ValueError for non-numeric input."""
+    return None if value is None else int(value)
+
+
+def _date_param(request, name):
+    """Optional ``YYYY-MM-DD`` query parameter; raises ValueError when malformed."""
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    value = parse_date(raw)
+    if value is None:
+        raise ValueError(name)
+    return value
+
+
+class TripViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     serializer_class = TripSerializer
     permission_classes = [permissions.IsAuthenticated]
+    conditional_children = ('stops', 'stops__activities')
+
+    pagination_class = TripCursorPagination
+
+    def _full_list(self) -> bool:
+        return self.action == 'list' and self.request.query_params.get('view') == 'full'
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not self._full_list():
+            return TripSummarySerializer
+        return TripSerializer
 
     def get_queryset(self):
-        return Trip.objects.filter(user=self.request.user).order_by('-id')
+        qs = Trip.objects.filter(user=self.request.user).order_by('-id')
+        if self.action == 'list' and not self._full_list():
+            qs = TripSummarySerializer.setup_eager_loading(qs)
+        elif self.action in ('list', 'retrieve', 'update', 'partial_update'):
+            qs = TripSerializer.setup_eager_loading(qs, *request_shape(self.request))
+        return qs
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = request_shape(self.request)
+        return super().get_serializer(*args, fields=fields, expand=expand, **kwargs)
+
+    def conditional_variant(self) -> str:
+        return shape_key(self.request)
+
+    @extend_schema(
+        tags=["Trips"],
+        summary="List my trips (summary rows, cursor-paginated)",
+        parameters=[
+            OpenApiParameter("view", OpenApiTypes.STR, OpenApiParameter.QUERY, description="'full' returns nested stops and activities"),
+            *SHAPE_PARAMETERS,
+        ],
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(tags=["Trips"], summary="Trip detail", parameters=SHAPE_PARAMETERS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -26,352 +108,288 @@ class TripViewSet(viewsets.ModelViewSet):
         trip = self.get_object()
         trip.is_public = True
         trip.save()
-        return response.Response({"public_slug": trip.public_slug})
+        data = {"public_slug": trip.public_slug, "snapshot_url": None}
+        try:
+            snapshot = snapshots.render_snapshot(snapshots.ensure_snapshot(trip).trip_id)
+            data["snapshot_url"] = snapshots.snapshot_url(snapshot) if snapshot else None
+        except Exception as ex:
+            # The worker retries stale snapshots; sharing itself succeeded
+            logging.getLogger(__name__).warning("Snapshot render failed for trip %s: %s", trip.id, ex)
+        return response.Response(data)
 
     @extend_schema(
         tags=["Trips"],
         summary="Auto-generate itinerary",
         request=OpenApiTypes.OBJECT,
         responses={200: OpenApiTypes.OBJECT},
-        examples=[OpenApiExample('Generate example', value={'days_per_city': 2, 'currency': 'INR', 'force': False})],
+        examples=[OpenApiExample('Generate example', value={'days_per_city': 2, 'currency': 'INR', 'force': False, 'async': False})],
     )
     @decorators.action(detail=True, methods=['post'], url_path='generate', throttle_classes=[ScopedRateThrottle])
     def generate(self, request, pk=None):
         """Auto-generate itinerary stops and activities via OpenRouter (if key set),
         else use heuristic generation from ActivityCatalog. Allows customization later.
 
-        Body (optional): { days_per_city: number, currency: 'INR', force: boolean }
+        Body (optional): { days_per_city: 1-30 (default 2), currency: 'INR', force: boolean, async: boolean }
+        An invalid days_per_city is a 400.
+
+        With async (or ?async=1) the work is queued for the run_generation_jobs worker
+        and a 202 with the job id is returned; poll generate/jobs/{job_id}.
+
+        Only one generation runs per trip: concurrent requests attach to the in-flight
+        job and get its 202 instead of waiting for it. An Idempotency-Key header makes retries replay the original job's result
+        for GENERATE_IDEMPOTENCY_WINDOW_SECONDS; once that itinerary has been
+        regenerated the replay is a 409.
         """
         request.parser_context = getattr(request, 'parser_context', {}) or {}
         request.parser_context['throttle_scope'] = 'generate'
         trip = self.get_object()
-        days_per_city = int(request.data.get('days_per_city') or 2)
+        try:
+            days_per_city = parse_days_per_city(request.data.get('days_per_city'))
+        except ValueError as exc:
+            return response.Response({"error": str(exc)}, status=400)
         currency = request.data.get('currency') or 'INR'
         force = str(request.data.get('force') or '').lower() in ('1','true','yes')
+        run_async = str(request.data.get('async') or request.query_params.get('async') or '').lower() in ('1','true','yes')
+        idempotency_key = (request.headers.get('Idempotency-Key') or '').strip()[:255]
+
+        job = attachable_job(trip, idempotency_key)
+        created = False
+        if job is None:
+            # If already has stops and not forcing, return existing
+            if trip.stops.exists() and not force:
+                return response.Response({"status": "exists", "stops": TripStopSerializer(trip.stops.all(), many=True).data})
+            job, created = submit_generation(trip, request.user, days_per_city, currency, idempotency_key, inline=not run_async)
+            if created and not run_async:
+                # Plan in memory (LLM or heuristic), then replace stops in one transaction
+                job = run_job(job)
+        # An attached request never blocks a web worker on someone else's job: 202 + poll_url
+        resp = self._generation_response(request, trip, job)
+        if not created and idempotency_key and job.idempotency_key == idempotency_key:
+            # Only a supplied key matching an existing job is a replay, not attaching to an in-flight job
+            resp['Idempotent-Replayed'] = 'true'
+        return resp
+
+    def _generation_response(self, request, trip, job):
+        if job.status == GenerationJob.STATUS_SUCCEEDED:
+            stops = job_stops(job)
+            if stops is None:
+                return response.Response({"status": "superseded", "job_id": job.id, "error": SUPERSEDED_ERROR}, status=409)
+            return response.Response({"status": "generated", "job_id": job.id, "stops": TripStopSerializer(stops, many=True).data})
+        if job.status == GenerationJob.STATUS_FAILED:
+            return response.Response({"status": "failed", "job_id": job.id, "error": job.error}, status=500)
+        return response.Response({
+            "status": job.status,
+            "job_id": job.id,
+            "poll_url": request.build_absolute_uri(reverse('trip-generation-job', kwargs={'pk': trip.pk, 'job_id': job.id})),
+        }, status=202)
 
-        # If already has stops and not forcing, return existing
-        if trip.stops.exists() and not force:
-            return response.Response({"status": "exists", "stops": TripStopSerializer(trip.stops.all(), many=True).data})
-
-        # Clear existing to regenerate
-        trip.stops.all().delete()
+    @extend_schema(
+        tags=["Trips"],
+        summary="Auto-generate itinerary (Server-Sent Events)",
+        request=OpenApiTypes.OBJECT,
+        responses={(200, 'text/event-stream'): OpenApiTypes.STR},
+    )
+    @decorators.action(
+        detail=True,
+        methods=['get', 'post'],
+        url_path='generate/stream',
+        throttle_classes=[ScopedRateThrottle],
+        renderer_classes=[EventStreamRenderer, JSONRenderer],
+    )
+    def generate_stream(self, request, pk=None):
+        """Streaming variant of generate for EventSource/fetch clients.
 
-        origin = trip.origin_city.name if trip.origin_city else None
-        dests = []
-        # If user already created some cities in description, ignore; otherwise propose 1-2 based on ActivityCatalog
-        from .models import ActivityCatalog
-        cat_cities = ActivityCatalog.objects.exclude(city=None).values_list('city__name', flat=True).distinct()[:3]
-        if cat_cities:
-            dests = list(cat_cities)
+        Same parameters as generate (query string for GET). Emits `status`
+        events, a `stop` event as each stop and its activities are persisted,
+        and a final `done` event with the payload generate would return.
+        """
+        request.parser_context = getattr(request, 'parser_context', {}) or {}
+        request.parser_context['throttle_scope'] = 'generate'
+        trip = self.get_object()
+        params = request.data if request.method == 'POST' else request.query_params
+        try:
+            days_per_city = parse_days_per_city(params.get('days_per_city'))
+        except ValueError as exc:
+            return response.Response({"error": str(exc)}, status=400)
+        currency = params.get('currency') or 'INR'
+        force = str(params.get('force') or '').lower() in ('1','true','yes')
+        idempotency_key = (request.headers.get('Idempotency-Key') or '').strip()[:255]
+
+        job = attachable_job(trip, idempotency_key)
+        if job is None and trip.stops.exists() and not force:
+            events = iter([sse('done', {"status": "exists", "stops": TripStopSerializer(trip.stops.all(), many=True).data})])
         else:
-            dests = ["Goa", "Udaipur"]
-
-        # Attempt OpenRouter to propose cities and activities
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        created_stops = []
-        if api_key:
-            try:
-                system = "Return only valid JSON"
-                user_prompt = (
-                    "Design a short itinerary. Output JSON: { cities: [{ name, country }], perCity: { cityName: { activities: [{ title, category, cost_minor }] } } }"
-                )
-                timeout_seconds = int(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "60"))
-                r = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {api_key}",
-                        "HTTP-Referer": os.getenv("OPENROUTER_SITE_URL", "http://localhost:3000"),
-                        "X-Title": os.getenv("OPENROUTER_APP_NAME", "GlobalTrotters"),
-                    },
-                    json={
-                        "model": "deepseek/deepseek-r1-0528:free",
-                        "temperature": 0.6,
-                        "messages": [
-                            {"role": "system", "content": system},
-                            {"role": "user", "content": f"Origin: {origin}; daysPerCity: {days_per_city}; currency: {currency}. {user_prompt}"},
-                        ],
-                    },
-                    timeout=(10, timeout_seconds),
-                )
-                r.raise_for_status()
-                content = r.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-                import json as _json
-                def extract_json(s: str):
-                    s = s.strip()
-                    if s.startswith("```"):
-                        s = s.strip('`')
-                        if s.lower().startswith("json\n"):
-                            s = s[5:]
-                    start = s.find("{"); end = s.rfind("}")
-                    return s[start:end+1] if start!=-1 and end!=-1 and end>=start else s
-                payload = _json.loads(extract_json(content))
-                proposed_cities = [c.get('name') for c in payload.get('cities', []) if c.get('name')]
-                if proposed_cities:
-                    dests = proposed_cities
-                per_city = payload.get('perCity', {})
-                # Build stops
-                from datetime import datetime, timedelta
-                cur = trip.start_date
-                order = 1
-                for name in dests:
-                    start_date = cur
-                    end_date = cur + timedelta(days=days_per_city)
-                    cur = end_date
-                    # Ensure city
-                    city_obj, _ = City.objects.get_or_create(name=name, defaults={"country": ""})
-                    stop = TripStop.objects.create(trip=trip, city=city_obj, start_date=start_date, end_date=end_date, order=order)
-                    order += 1
-                    # Activities
-                    acts = per_city.get(name) or per_city.get(name.title()) or {}
-                    for a in acts.get('activities', [])[:5]:
-                        Activity.objects.create(trip_stop=stop, title=a.get('title') or 'Activity', category=a.get('category') or '', cost_amount=int(a.get('cost_minor') or 0), currency=currency)
-                    created_stops.append(stop.id)
-            except Exception:
-                pass
+            created = False
+            if job is None:
+                job, created = submit_generation(trip, request.user, days_per_city, currency, idempotency_key, inline=True)
+            if created:
+                events = stream_itinerary(trip, days_per_city, currency, job=job)
+            else:
+                poll_url = request.build_absolute_uri(reverse('trip-generation-job', kwargs={'pk': trip.pk, 'job_id': job.id}))
+                events = attached_events(job, poll_url)
+        resp = StreamingHttpResponse(events, content_type='text/event-stream')
+        resp['Cache-Control'] = 'no-cache'
+        resp['X-Accel-Buffering'] = 'no'
+        return resp
+
+    @extend_schema(tags=["Trips"], summary="Itinerary generation job status", responses={200: GenerationJobSerializer})
+    @decorators.action(detail=True, methods=['get'], url_path=r'generate/jobs/(?P<job_id>\d+)')
+    def generation_job(self, request, pk=None, job_id=None):
+        trip = self.get_object()
+        job = get_object_or_404(GenerationJob, pk=job_id, trip=trip)
+        return response.Response(GenerationJobSerializer(job).data)
 
-        # Heuristic fallback if no stops created
-        if not created_stops:
-            from datetime import timedelta
-            cur = trip.start_date
-            order = 1
-            for name in dests:
-                start_date = cur
-                end_date = cur + timedelta(days=days_per_city)
-                cur = end_date
-                city_obj, _ = City.objects.get_or_create(name=name, defaults={"country": ""})
-                stop = TripStop.objects.create(trip=trip, city=city_obj, start_date=start_date, end_date=end_date, order=order)
-                order += 1
-                # a few catalog-based activities
-                samples = ActivityCatalog.objects.all()[:3]
-                for ac in samples:
-                    Activity.objects.create(trip_stop=stop, title=ac.title, category=ac.category, cost_amount=ac.avg_cost, currency=currency)
-                created_stops.append(stop.id)
-
-        return response.Response({"status": "generated", "stops": TripStopSerializer(trip.stops.all(), many=True).data})
-
-    @extend_schema(tags=["Trips"], summary="Reorder stops", request=OpenApiTypes.OBJECT, responses={200: OpenApiTypes.OBJECT})
+    @extend_schema(
+        tags=["Trips"],
+        summary="Reorder stops",
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[
+            OpenApiExample("Full order", value={"order": [3, 1, 2]}, request_only=True),
+            OpenApiExample("Full order, gap numbering", value={"order": [3, 1, 2], "mode": "gap"}, request_only=True),
+            OpenApiExample("Move one stop", value={"move": 3, "after": 1}, request_only=True),
+        ],
+    )
     @decorators.action(detail=True, methods=['post'], url_path='stops/reorder')
     def reorder_stops(self, request, pk=None):
         """Reorder stops by provided list of stop IDs.
 
-        Body: { order: [stop_id1, stop_id2, ...] }
+        Body: { order: [stop_id1, stop_id2, ...], mode?: "gap" }
+        or, to move a single stop: { move: stop_id, after: stop_id|null } / { move: stop_id, before: stop_id }
         """
         trip = self.get_object()
-        order_list = request.data.get('order') or []
-        if not isinstance(order_list, list) or not order_list:
-            return response.Response({"error": "order list required"}, status=400)
-        # Map to int and keep only stops for this trip
-        valid_ids = list(TripStop.objects.filter(trip=trip, id__in=order_list).values_list('id', flat=True))
-        # Apply new order
-        position = 1
-        for sid in order_list:
-            if sid in valid_ids:
-                TripStop.objects.filter(id=sid, trip=trip).update(order=position)
-                position += 1
-        # Any remaining stops get appended preserving existing order
-        remaining = TripStop.objects.filter(trip=trip).exclude(id__in=order_list).order_by('order', 'start_date').values_list('id', flat=True)
-        for sid in remaining:
-            TripStop.objects.filter(id=sid, trip=trip).update(order=position)
-            position += 1
-        return response.Response({"status": "ok", "stops": TripStopSerializer(trip.stops.order_by('order'), many=True).data})
-
-    @extend_schema(tags=["Trips"], summary="Budget total", responses={200: OpenApiTypes.OBJECT})
+        data = request.data
+        try:
+            if 'move' in data:
+                reorder.move_stop(trip, _int_or_none(data.get('move')), after=_int_or_none(data.get('after')), before=_int_or_none(data.get('before')))
+            else:
+                order_list = data.get('order') or []
+                if not isinstance(order_list, list) or not order_list:
+                    return response.Response({"error": "order list required"}, status=400)
+                gap = reorder.ORDER_GAP if data.get('mode') == 'gap' else 1
+                reorder.apply_order(trip, [_int_or_none(i) for i in order_list], gap=gap)
+        except (reorder.ReorderError, TypeError, ValueError) as exc:
+            return response.Response({"error": str(exc) or "invalid stop id"}, status=400)
+        trip_tree_changed(trip.id)
+        stops = TripStopSerializer.setup_eager_loading(TripStop.objects.filter(trip=trip).order_by('order', 'start_date', 'id'))
+        return response.Response({"status": "ok", "stops": TripStopSerializer(stops, many=True).data})
+
+    def _budget_response(self, build):
+        try:
+            return response.Response(build(self.get_object(), self.request.query_params.get('currency')))
+        except UnknownCurrency as exc:
+            return response.Response({"error": str(exc)}, status=400)
+
+    @extend_schema(tags=["Trips"], summary="Budget total", parameters=[BUDGET_CURRENCY_PARAMETER], responses={200: OpenApiTypes.OBJECT})
     @decorators.action(detail=True, methods=['get'])
     def budget(self, request, pk=None):
-        trip = self.get_object()
-        total = Activity.objects.filter(trip_stop__trip=trip).aggregate(sum=Sum('cost_amount'))['sum'] or 0
-        # Try to infer currency from first activity; default to INR
-        first_act = Activity.objects.filter(trip_stop__trip=trip).first()
-        currency = first_act.currency if first_act and first_act.currency else 'INR'
-        return response.Response({"trip_id": trip.id, "currency": currency, "total_cost_minor": total})
+        return self._budget_response(trip_total)
 
-    @extend_schema(tags=["Trips"], summary="Budget summary", responses={200: OpenApiTypes.OBJECT})
+    @extend_schema(tags=["Trips"], summary="Budget summary", parameters=[BUDGET_CURRENCY_PARAMETER], responses={200: OpenApiTypes.OBJECT})
     @decorators.action(detail=True, methods=['get'], url_path='budget/summary')
     def budget_summary(self, request, pk=None):
         """Return totals by category, overall total, and avg per day.
 
         Categories consolidated into: activities, meals, transport, stay, other.
+        Amounts are converted to ``?currency=`` (default: the trip's currency).
         """
-        trip = self.get_object()
-        activities = Activity.objects.filter(trip_stop__trip=trip)
-        # Determine currency
-        first_act = activities.first()
-        currency = first_act.currency if first_act and first_act.currency else 'INR'
-
-        def normalize_category(raw: str) -> str:
-            r = (raw or '').strip().lower()
-            if any(k in r for k in ['food', 'meal', 'dine', 'restaurant']):
-                return 'meals'
-            if any(k in r for k in ['transport', 'flight', 'train', 'bus', 'cab', 'taxi']):
-                return 'transport'
-            if any(k in r for k in ['stay', 'hotel', 'hostel', 'accommodation']):
-                return 'stay'
-            if any(k in r for k in ['sight', 'tour', 'museum', 'activity', 'adventure', 'culture']):
-                return 'activities'
-            return 'activities' if r else 'other'
-
-        from collections import defaultdict
-        cat_totals = defaultdict(int)
-        num_activities = 0
-        for a in activities:
-            cat = normalize_category(a.category)
-            cat_totals[cat] += int(a.cost_amount or 0)
-            num_activities += 1
-        total = sum(cat_totals.values())
-
-        # Average per day
-        days = (trip.end_date - trip.start_date).days
-        if days <= 0:
-            days = 1
-        avg_per_day = total // days if total else 0
-
-        # Per-city breakdown
-        per_city = []
-        stops = trip.stops.select_related('city').all().order_by('order', 'start_date')
-        for s in stops:
-            city_cat = defaultdict(int)
-            city_total = 0
-            for a in s.activities.all():
-                cat = normalize_category(a.category)
-                amt = int(a.cost_amount or 0)
-                city_cat[cat] += amt
-                city_total += amt
-            per_city.append({
-                'city': {
-                    'id': s.city.id,
-                    'name': s.city.name,
-                    'country': s.city.country,
-                },
-                'total_minor': city_total,
-                'categories': {
-                    'activities': city_cat.get('activities', 0),
-                    'meals': city_cat.get('meals', 0),
-                    'transport': city_cat.get('transport', 0),
-                    'stay': city_cat.get('stay', 0),
-                    'other': city_cat.get('other', 0),
-                }
-            })
+        return self._budget_response(trip_summary)
 
-        return response.Response({
-            'trip_id': trip.id,
-            'currency': currency,
-            'total_minor': total,
-            'avg_per_day_minor': avg_per_day,
-            'num_activities': num_activities,
-            'categories': {
-                'activities': cat_totals.get('activities', 0),
-                'meals': cat_totals.get('meals', 0),
-                'transport': cat_totals.get('transport', 0),
-                'stay': cat_totals.get('stay', 0),
-                'other': cat_totals.get('other', 0),
-            },
-            'per_city': per_city,
-            'days': days,
-        })
-
-    @extend_schema(tags=["Trips"], summary="Calendar day-wise schedule", responses={200: OpenApiTypes.OBJECT})
-    @decorators.action(detail=True, methods=['get'], url_path='calendar')
-    def calendar(self, request, pk=None):
+    @extend_schema(
+        tags=["Trips"],
+        summary="Budget overview across my trips",
+        parameters=[
+            BUDGET_CURRENCY_PARAMETER,
+            OpenApiParameter("from", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Only spend at stops starting on/after this date"),
+            OpenApiParameter("to", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Only spend at stops starting on/before this date"),
+            OpenApiParameter("page_size", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Trips per page (max 100)"),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @decorators.action(detail=False, methods=['get'], url_path='budget/overview')
+    def budget_overview(self, request):
+        """Totals, per-category and per-month spend over all my trips; per-trip totals are paginated under ``trips``."""
+        try:
+            start, end = (_date_param(request, k) for k in ('from', 'to'))
+        except ValueError:
+            return response.Response({"error": "from/to must be YYYY-MM-DD dates"}, status=400)
+        trips = Trip.objects.filter(user=request.user).only('id', 'name', 'start_date', 'end_date')
+        if start:
+            trips = trips.filter(end_date__gte=start)
+        if end:
+            trips = trips.filter(start_date__lte=end)
+        paginator = TripCursorPagination()
+        page = paginator.paginate_queryset(trips, request, view=self)
+        try:
+            data = spend_overview(request.user, page, start, end, request.query_params.get('currency'))
+        except UnknownCurrency as exc:
+            return response.Response({"error": str(exc)}, status=400)
+        data['next'] = paginator.get_next_link()
+        data['previous'] = paginator.get_previous_link()
+        return response.Response(data)
+
+    @extend_schema(
+        tags=["Trips"],
+        summary="Calendar day-wise schedule",
+        parameters=[
+            OpenApiParameter("from", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="First day to include (default: trip start)"),
+            OpenApiParameter("to", OpenApiTypes.DATE, OpenApiParameter.QUERY, description="Last day to include (default: trip end)"),
+        ],
+        responses={(200, 'application/json'): OpenApiTypes.OBJECT, (200, 'text/calendar'): OpenApiTypes.STR},
+    )
+    @decorators.action(detail=True, methods=['get'], url_path='calendar', renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ICalendarRenderer])
+    def calendar(self, request, pk=None, format=None):
         """Return a day-wise schedule between trip start_date (inclusive) and end_date (exclusive).
 
         For each day, include the stop covering that date and a distribution of activities
         across that stop's days (simple even split when activity dates are not set).
+        ``?from=``/``?to=`` limit the days returned, e.g. to one month of a long trip.
+        ``calendar.ics`` (or ``Accept: text/calendar``) streams the whole trip as iCalendar.
         """
-        from datetime import timedelta
-        trip = self.get_object()
-        # compute day count (exclusive end)
-        days = (trip.end_date - trip.start_date).days
-        if days <= 0:
-            days = 1
-
-        # Prepare stops ordered and prefetch activities
-        stops = list(trip.stops.select_related('city').prefetch_related('activities').order_by('order', 'start_date'))
-
-        # Helper: find stop for a given date (start <= date < end)
-        def stop_for(date_obj):
-            for s in stops:
-                if s.start_date <= date_obj < s.end_date:
-                    return s
-            return None
+        if request.accepted_renderer.format == ICalendarRenderer.format:
+            trip = self.get_object()
+            return ics_response(request, Trip.objects.filter(pk=trip.pk), trip.name, f"trip-{trip.pk}.ics")
+        try:
+            start, end = (_date_param(request, k) for k in ('from', 'to'))
+        except ValueError:
+            return response.Response({"error": "from/to must be YYYY-MM-DD dates"}, status=400)
+        return response.Response(build_calendar(self.get_object(), start, end))
 
-        # Pre-compute activity buckets per stop for even distribution
-        stop_to_buckets = {}
-        for s in stops:
-            span = (s.end_date - s.start_date).days
-            if span <= 0:
-                span = 1
-            acts = list(s.activities.all().order_by('id'))
-            buckets = [[] for _ in range(span)]
-            if acts:
-                # chunk approximately evenly
-                total = len(acts)
-                for idx, a in enumerate(acts):
-                    # map idx to bucket using proportional index
-                    b = min((idx * span) // total, span - 1)
-                    buckets[b].append(a)
-            stop_to_buckets[s.id] = buckets
-
-        def serialize_activity(a: Activity):
-            return {
-                'id': a.id,
-                'title': a.title,
-                'category': a.category,
-                'start_time': a.start_time,
-                'end_time': a.end_time,
-                'cost_amount': a.cost_amount,
-                'currency': a.currency,
-            }
-
-        timeline = []
-        for i in range(days):
-            day_date = trip.start_date + timedelta(days=i)
-            s = stop_for(day_date)
-            day_entry = {
-                'date': day_date.isoformat(),
-                'day_index': i + 1,
-                'stop_id': s.id if s else None,
-                'stop_order': s.order if s else None,
-                'city': ({
-                    'id': s.city.id,
-                    'name': s.city.name,
-                    'country': s.city.country,
-                } if s else None),
-                'activities': [],
-            }
-            if s:
-                span = (s.end_date - s.start_date).days
-                if span <= 0:
-                    span = 1
-                # index within the stop's span
-                offset = (day_date - s.start_date).days
-                offset = max(0, min(offset, span - 1))
-                buckets = stop_to_buckets.get(s.id, [[] for _ in range(span)])
-                day_entry['activities'] = [serialize_activity(a) for a in buckets[offset]]
-            timeline.append(day_entry)
+    @extend_schema(
+        tags=["Trips"],
+        summary="Duplicate trip",
+        request=OpenApiTypes.OBJECT,
+        responses={200: OpenApiTypes.OBJECT},
+        examples=[OpenApiExample("Duplicate", value={"name": "Europe 2026 (copy)"}, request_only=True)],
+    )
+    @decorators.action(detail=True, methods=['post'])
+    def duplicate(self, request, pk=None):
+        """Copy one of my trips with its stops and activities. Body: { name?: string }"""
+        trip = self.get_object()
+        name = (request.data.get('name') or '').strip() or f"{trip.name} (copy)"
+        return response.Response({"trip_id": clone_trip(trip, request.user, name=name).id})
 
-        return response.Response({
-            'trip_id': trip.id,
-            'start_date': trip.start_date.isoformat(),
-            'end_date': trip.end_date.isoformat(),
-            'total_days': days,
-            'days': timeline,
-        })
+    @extend_schema(tags=["Trips"], summary="Subscription URL for my trips' calendar feed", responses={200: OpenApiTypes.OBJECT})
+    @decorators.action(detail=False, methods=['get'], url_path='calendar-feed')
+    def calendar_feed_url(self, request):
+        path = reverse('calendar-feed', kwargs={'token': feed_token(request.user)})
+        return response.Response({"url": request.build_absolute_uri(path)})
 
 
-class TripStopViewSet(viewsets.ModelViewSet):
+class TripStopViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     serializer_class = TripStopSerializer
     permission_classes = [permissions.IsAuthenticated]
+    conditional_children = ('activities',)
 
     def get_queryset(self):
-        return TripStop.objects.filter(trip__user=self.request.user)
+        return TripStopSerializer.setup_eager_loading(TripStop.objects.filter(trip__user=self.request.user))
 
     def perform_create(self, serializer):
         trip = get_object_or_404(Trip, id=self.kwargs.get('trip_pk'), user=self.request.user)
         serializer.save(trip=trip)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     serializer_class = ActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -426,120 +444,37 @@ class CityViewSet(viewsets.ReadOnlyModelViewSet):
         return response.Response(data)
 
 
-@extend_schema(tags=["Public"], summary="Fetch public itinerary by slug", responses={200: OpenApiTypes.OBJECT})
+@extend_schema(tags=["Public"], summary="Fetch public itinerary by slug", parameters=SHAPE_PARAMETERS, responses={200: OpenApiTypes.OBJECT})
 @decorators.api_view(["GET"])
 @decorators.permission_classes([permissions.AllowAny])
 def public_itinerary(request, public_slug: str):
     # Built-in demo sample for homepage preview
     if public_slug in ("sample", "demo"):
-        # Accept query params to build a multi-city sample
-        origin_name = request.query_params.get("origin") or request.query_params.get("from") or "London"
-        dest_param = request.query_params.get("dest") or request.query_params.get("to") or "Paris"
-        start = request.query_params.get("start") or "2025-09-05"
-        days_per_city = int(request.query_params.get("daysPerCity") or 2)
-        currency = request.query_params.get("currency") or "USD"
-
-        dest_names = [d.strip() for d in dest_param.split(",") if d.strip()]
-        if not dest_names:
-            dest_names = ["Paris"]
-
-        # helper to make city dict; try to enrich from DB if available
-        def city_dict(name: str):
-            c = City.objects.filter(name__iexact=name).first()
-            if c:
-                return {
-                    "id": c.id,
-                    "name": c.name,
-                    "country": c.country,
-                    "region": c.region,
-                    "cost_index": c.cost_index,
-                    "popularity": c.popularity,
-                }
-            return {"id": 0, "name": name, "country": "", "region": ""}
-
-        # simple date math
-        from datetime import datetime, timedelta
-        cur = datetime.fromisoformat(start)
-        stops = []
-        act_total = food_total = transport_total = other_total = 0
-        order = 1
-        for name in dest_names:
-            start_date = cur.date().isoformat()
-            end_date = (cur + timedelta(days=days_per_city)).date().isoformat()
-            cur += timedelta(days=days_per_city)
-
-            # pick a few activities from catalog if available
-            acts = []
-            qs = Activity.objects.none()
-            # We don't have a full catalog tied to City; synthesize sample acts
-            sample_acts = [
-                ("Walking Tour", "sightseeing", 2000),
-                ("Museum Pass", "culture", 2500),
-                ("Food Crawl", "food", 3500),
-            ]
-            for idx, (title, cat, cost) in enumerate(sample_acts, start=1):
-                acts.append({
-                    "id": order * 10 + idx,
-                    "trip_stop": order,
-                    "title": title,
-                    "category": cat,
-                    "start_time": None,
-                    "end_time": None,
-                    "cost_amount": cost,
-                    "currency": currency,
-                    "notes": "",
-                })
-                if cat == "food":
-                    food_total += cost
-                else:
-                    act_total += cost
-
-            stops.append({
-                "id": order,
-                "trip": 0,
-                "city": city_dict(name),
-                "start_date": start_date,
-                "end_date": end_date,
-                "order": order,
-                "activities": acts,
-            })
-            # rough transport per leg
-            transport_total += 5000
-            order += 1
-
-        total_days = days_per_city * len(dest_names)
-        best_time = "Shoulder seasons for fewer crowds and mild weather"
-
-        sample = {
-            "id": 0,
-            "name": f"{origin_name} → {' → '.join(dest_names)}",
-            "start_date": start,
-            "end_date": (datetime.fromisoformat(start) + timedelta(days=total_days)).date().isoformat(),
-            "origin_city": city_dict(origin_name),
-            "description": "Auto‑generated sample itinerary",
-            "cover_image": "",
-            "is_public": True,
-            "public_slug": public_slug,
-            "best_time_to_visit": best_time,
-            "tips": [
-                "Adjust days per city based on interests",
-                "Book intercity transport in advance",
-                "Keep buffer time for popular attractions",
-            ],
-            "budget_breakdown_minor": {
-                "activities": act_total,
-                "food": food_total,
-                "transport": transport_total,
-                "stay": 0,
-                "other": other_total,
-            },
-            "stops": stops,
-        }
-        return response.Response(sample)
-
-    trip = get_object_or_404(Trip, is_public=True, public_slug=public_slug)
-    data = TripSerializer(trip).data
-    return response.Response(data)
+        try:
+            params = samples.parse_params(public_slug, request.query_params)
+        except ValueError as ex:
+            return response.Response({"error": f"invalid sample parameters: {ex}"}, status=400)
+        return response.Response(samples.get_sample(params))
+
+    public = Trip.objects.filter(is_public=True, public_slug=public_slug)
+    # Unknown names are dropped so the shape, and with it the cache key, stays bounded
+    fields, expand = request_shape(request, TripSerializer)
+    variant = shape_key(request, TripSerializer)
+
+    def render(trip_id):
+        tree = public.filter(pk=trip_id)
+        validators = with_variant(tree_validators(tree, ('stops', 'stops__activities')), variant)
+        trip = TripSerializer.setup_eager_loading(tree, fields, expand).get()
+        return {"data": TripSerializer(trip, fields=fields, expand=expand).data, "validators": validators}
+
+    cache_key = f"{public_slug}?{variant}" if variant else public_slug
+    entry = public_cache.get_or_build(cache_key, lambda: public.values_list('id', flat=True).first(), render)
+    if entry is None:
+        return response.Response({"detail": "No Trip matches the given query."}, status=404)
+    resp = not_modified(request, entry["validators"])
+    if resp is not None:
+        return resp
+    return set_validators(response.Response(entry["data"]), entry["validators"])
 
 
 @extend_schema(tags=["Public"], summary="Copy public itinerary into my trips", responses={200: OpenApiTypes.OBJECT})
@@ -548,41 +483,10 @@ def public_itinerary(request, public_slug: str):
 def copy_public_itinerary(request, public_slug: str):
     """Clone a public itinerary by slug into the authenticated user's trips.
 
-    Copies trip name/dates/origin and all stops+activities. Returns the new trip id.
+    Copies trip name/dates/origin and all stops+activities (see trips.cloning). Returns the new trip id.
     """
     src_trip = get_object_or_404(Trip, is_public=True, public_slug=public_slug)
-    user = request.user
-    # Create destination trip
-    new_trip = Trip.objects.create(
-        user=user,
-        name=src_trip.name,
-        start_date=src_trip.start_date,
-        end_date=src_trip.end_date,
-        origin_city=src_trip.origin_city,
-        description=src_trip.description,
-        cover_image=src_trip.cover_image,
-        is_public=False,
-    )
-    # Copy stops and activities
-    for s in src_trip.stops.all().order_by('order', 'start_date'):
-        new_stop = TripStop.objects.create(
-            trip=new_trip,
-            city=s.city,
-            start_date=s.start_date,
-            end_date=s.end_date,
-            order=s.order,
-        )
-        for a in s.activities.all().order_by('id'):
-            Activity.objects.create(
-                trip_stop=new_stop,
-                title=a.title,
-                category=a.category,
-                start_time=a.start_time,
-                end_time=a.end_time,
-                cost_amount=a.cost_amount,
-                currency=a.currency,
-                notes=a.notes,
-            )
+    new_trip = clone_trip(src_trip, request.user)
     return response.Response({"trip_id": new_trip.id})
 
 
@@ -603,7 +507,7 @@ def search_cities(request):
         url = "https://nominatim.openstreetmap.org/search"
         params = {"q": q, "format": "json", "addressdetails": 1, "limit": 8}
         headers = {"User-Agent": "GlobalTrotters/1.0"}
-        r = requests.get(url, params=params, headers=headers, timeout=8)
+        r = http_client.get(url, params=params, headers=headers, timeout=8)
         r.raise_for_status()
         results = []
         for item in r.json():
@@ -777,7 +681,7 @@ def personalized_recs(request):
                 data.setdefault("source", "city-cache")
                 return response.Response(data)
 
-    api_key = os.getenv("OPENROUTER_API_KEY")
+    api_key = llm.api_key()
     prompt = (
         "You are a travel curator. Based on the user's profile and recent trips, propose: "
         "bannerTitle (<=6 words), blurb (<=20 words), topSelections: 6 destination cards with { name, country, reason }, "
@@ -787,44 +691,16 @@ def personalized_recs(request):
 
     if api_key:
         try:
-            timeout_seconds = int(os.getenv("OPENROUTER_TIMEOUT_SECONDS", "60"))
-            r = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}",
-                    "HTTP-Referer": os.getenv("OPENROUTER_SITE_URL", "http://localhost:3000"),
-                    "X-Title": os.getenv("OPENROUTER_APP_NAME", "GlobalTrotters"),
-                },
-                json={
-                    "model": "deepseek/deepseek-r1-0528:free",
-                    "temperature": 0.7,
-                    "messages": [
-                        {"role": "system", "content": "Return only valid JSON"},
-                        {"role": "user", "content": f"{prompt}\nProfile: {profile}\nRecentTrips: {trips}"},
-                    ],
-                },
-                timeout=(10, timeout_seconds),
+            content = llm.chat_completion(
+                [
+                    {"role": "system", "content": "Return only valid JSON"},
+                    {"role": "user", "content": f"{prompt}\nProfile: {profile}\nRecentTrips: {trips}"},
+                ],
+                temperature=0.7,
             )
-            r.raise_for_status()
-            data = r.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
             # Try to parse JSON content robustly
             try:
-                def extract_json(s: str):
-                    s = s.strip()
-                    if s.startswith("```"):
-                        # remove triple backticks and optional 'json' label
-                        s = s.strip('`')
-                        if s.lower().startswith("json\n"):
-                            s = s[5:]
-                    start = s.find("{")
-                    end = s.rfind("}")
-                    if start != -1 and end != -1 and end >= start:
-                        return s[start:end+1]
-                    return s
-                json_like = extract_json(content)
-                parsed = _json.loads(json_like)
+                parsed = _json.loads(llm.extract_json(content))
                 parsed.setdefault("source", "openrouter")
                 # Save to cache (user + city)
                 PersonalizedRec.objects.create(user=user, signature=signature, data=parsed, city=profile.get("city") or "", country=profile.get("country") or "")
@@ -856,4 +732,59 @@ def personalized_recs(request):
     PersonalizedRec.objects.create(user=user, signature=signature, data=fallback, city=profile.get("city") or "", country=profile.get("country") or "")
     return response.Response(fallback)
 
+
+def ics_response(request, trips, name: str, filename: str):
+    """Streamed iCalendar for ``trips`` with ETag/Last-Modified validators (304 when unchanged)."""
+    validators = tree_validators(trips, ('stops', 'stops__activities'))
+    resp = not_modified(request, validators)
+    if resp is not None:
+        return resp
+    resp = StreamingHttpResponse(calendar_lines(trips.order_by('start_date', 'id'), name), content_type='text/calendar; charset=utf-8')
+    resp['Content-Disposition'] = f'inline; filename="{filename}"'
+    return set_validators(resp, validators)
+
+
+@extend_schema(tags=["Trips"], summary="iCalendar feed of all of a user's trips (signed URL)", responses={(200, 'text/calendar'): OpenApiTypes.STR})
+@decorators.api_view(["GET"])
+@decorators.permission_classes([permissions.AllowAny])
+@decorators.authentication_classes([])
+@decorators.renderer_classes([ICalendarRenderer, JSONRenderer])
+def calendar_feed(request, token: str):
+    """Subscribable feed; the signed token in the URL stands in for credentials calendar apps cannot send."""
+    try:
+        user_id = feed_user_id(token)
+    except (signing.BadSignature, ValueError):
+        return response.Response({"detail": "Invalid feed token."}, status=404)
+    return ics_response(request, Trip.objects.filter(user_id=user_id), "GlobalTrotters trips", "trips.ics")
+
+
+@extend_schema(
+    tags=["Sync"],
+    summary="Trips, stops and activities changed since a cursor",
+    parameters=[OpenApiParameter("since", OpenApiTypes.STR, OpenApiParameter.QUERY, description="Cursor from the previous response; omit for a full sync")],
+    responses={200: OpenApiTypes.OBJECT},
+)
+@decorators.api_view(["GET"])
+@decorators.permission_classes([permissions.IsAuthenticated])
+def sync_changes(request):
+    """Delta sync for offline clients; see ``trips.sync`` for the cursor semantics."""
+    try:
+        data = sync.changes(request.user, request.query_params.get('since'))
+    except sync.InvalidCursor as exc:
+        return response.Response({"error": str(exc)}, status=400)
+    return response.Response(data)
+
+
+@extend_schema(tags=["Ops"], summary="Service metrics for this worker process", responses={200: OpenApiTypes.OBJECT})
+@decorators.api_view(["GET"])
+@decorators.permission_classes([permissions.IsAdminUser])
+def service_metrics(request):
+    """Per-process counters/timers, outbound HTTP pool stats and cache statistics."""
+    data = metrics.snapshot()
+    data["http"] = http_client.stats()
+    data["llm_cache"] = llm_cache.stats()
+    data["public_itinerary_cache"] = public_cache.stats()
+    data["openrouter_breaker"] = openrouter_breaker().state()
+    return response.Response(data)
+
 # Create your views here.
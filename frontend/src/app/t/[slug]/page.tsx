@@ -1,8 +1,12 @@
-import { API_BASE } from "@/lib/api";
+import { API_BASE, SNAPSHOT_BASE } from "@/lib/api";
 import { buildRouteSummary, formatMoneyMinor } from "@/lib/format";
 import PublicBudgetSection from "@/components/PublicBudgetSection";
 
 async function fetchPublic(slug: string) {
+  if (SNAPSHOT_BASE) {
+    const snap = await fetch(`${SNAPSHOT_BASE}/latest/${slug}.json`).catch(() => null);
+    if (snap?.ok) return snap.json();
+  }
   const res = await fetch(`${API_BASE}/public/itineraries/${slug}`, { cache: "no-store" });
   if (!res.ok) throw new Error("Not found");
   return res.json();
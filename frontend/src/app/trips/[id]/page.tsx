@@ -68,7 +68,7 @@ export default function TripDetailPage() {
     try {
       await authFetch(`/trips/${id}/stops/`, {
         method: "POST",
-        body: JSON.stringify({ city_id: cityId, start_date: stopStart, end_date: stopEnd, order: (trip?.stops?.length || 0) + 1 })
+        body: JSON.stringify({ city_id: cityId, start_date: stopStart, end_date: stopEnd, order: Math.max(0, ...(trip?.stops || []).map((s: any) => s.order || 0)) + 1 })
       });
       setCityId(null); setCityQ(""); setCityResults([]); setStopStart(""); setStopEnd("");
       load();
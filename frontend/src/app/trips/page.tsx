@@ -13,11 +13,24 @@ type Trip = {
   origin_city?: { id: number; name: string; country: string } | null;
   is_public: boolean;
   public_slug: string | null;
+  stop_count: number;
+  cities: string[];
+  total_cost: number;
 };
 
+type TripPage = { results: Trip[]; next: string | null };
+
+// Cursor pagination returns absolute `next` URLs; apiFetch wants a path under API_BASE
+function pagePath(next: string): string {
+  const url = new URL(next);
+  return url.pathname.replace(/^.*?\/api(?=\/)/, "") + url.search;
+}
+
 export default function TripsPage() {
   const router = useRouter();
   const [trips, setTrips] = useState<Trip[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [name, setName] = useState("");
   const [start, setStart] = useState("");
   const [end, setEnd] = useState("");
@@ -42,9 +55,26 @@ export default function TripsPage() {
       router.push("/login");
       return;
     }
-    authFetch<Trip[]>("/trips/").then(setTrips).catch((e) => setError(String(e)));
+    authFetch<TripPage>("/trips/?page_size=100").then((page) => {
+      setTrips(page.results);
+      setNextPage(page.next);
+    }).catch((e) => setError(String(e)));
   }, [router]);
 
+  async function loadMore() {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const page = await authFetch<TripPage>(pagePath(nextPage));
+      setTrips((prev) => [...prev, ...page.results]);
+      setNextPage(page.next);
+    } catch (e) {
+      setError(String(e));
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   function searchOrigin(q: string) {
     setOriginQuery(q);
   }
@@ -172,8 +202,9 @@ export default function TripsPage() {
         return;
       }
       const payload: any = { name: editName, start_date: editStart, end_date: editEnd, origin_city_id: editOriginId };
-      const updated = await authFetch<Trip>(`/trips/${id}/`, { method: 'PATCH', body: JSON.stringify(payload) });
-      setTrips(trips.map(t => t.id === id ? updated : t));
+      const updated = await authFetch<Partial<Trip>>(`/trips/${id}/`, { method: 'PATCH', body: JSON.stringify(payload) });
+      // The detail response has no list-row fields (cities, counts); keep the row's
+      setTrips(trips.map(t => t.id === id ? { ...t, ...updated, stop_count: t.stop_count, cities: t.cities, total_cost: t.total_cost } : t));
       cancelEdit();
     } catch (e: any) {
       setError(String(e));
@@ -277,7 +308,7 @@ export default function TripsPage() {
 
       <div className="grid gap-3 sm:grid-cols-2">
         {trips.map((t) => {
-          const route = buildRouteSummary(t.origin_city || null, (t as any).stops || []);
+          const route = buildRouteSummary(t.origin_city || null, t.cities.map((name) => ({ city: { name } })));
           const isEditing = editingId === t.id;
           return (
           <div key={t.id} className="card p-4 hover:ring-1 hover:ring-white/15 transition">
@@ -348,6 +379,11 @@ export default function TripsPage() {
           </div>
         );})}
       </div>
+      {nextPage && (
+        <div className="mt-4 flex justify-center">
+          <button className="btn btn-ghost" disabled={loadingMore} onClick={loadMore}>{loadingMore ? "Loading…" : "Load more trips"}</button>
+        </div>
+      )}
     </div>
     </AuthGuard>
   );
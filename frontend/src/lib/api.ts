@@ -2,6 +2,9 @@ export const API_BASE = process.env.NEXT_PUBLIC_API_BASE_URL
   ? `${process.env.NEXT_PUBLIC_API_BASE_URL}/api`
   : "http://localhost:8000/api";
 
+// Pre-rendered public itineraries (backend trips.snapshots); optional
+export const SNAPSHOT_BASE = process.env.NEXT_PUBLIC_SNAPSHOT_BASE_URL || "";
+
 export type LoginResponse = { access: string; refresh: string };
 
 export async function apiFetch<T>(path: string, init: RequestInit = {}): Promise<T> {